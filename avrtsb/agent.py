@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Remote programming agent
+#
+# The agent runs on the host with the serial ports and executes whole jobs
+# sent by "pytsb job --agent". Page exchanges with the bootloader are done
+# next to the port, the network latency is paid once per job.
+#
+# One request per TCP connection, messages are JSON objects on separate
+# lines:
+#   request:  {"job": job definition, "files": {name: base64 data},
+#              "outputs": [names of files read from the device]}
+#   response: {"output": text}, ... output of the job as it is printed
+#             {"result": {"ok": bool, "failed": [ports]},
+#              "files": {name: base64 data}}
+#   or        {"error": message}
+#
+# There is no authentication, the agent listens on localhost by default.
+# File names in the request are plain names of the request files and only
+# JOB_OPTIONS can be set by the client.
+
+import base64
+import json
+import os
+import socket
+import SocketServer
+
+from tsb_locale import *
+
+AGENT_HOST = '127.0.0.1'
+AGENT_PORT = 4711
+
+# Job options accepted from the clients. Other options (record, replay,
+# eeprom_cache) would give the client access to the files of the agent host.
+JOB_OPTIONS = ['activation_retries', 'baudrate', 'change_timeout', 'delta',
+               'eeprom_file_format', 'fail_fast', 'flash_file_format', 'force',
+               'low_latency', 'new_password', 'no_blank_check', 'no_trim',
+               'password', 'reset_cmd', 'reset_dtr', 'reset_rts', 'retries',
+               'slow_activation', 'timeout', 'verify_erase', 'verify_report']
+
+
+class AgentError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(AgentError, self).__init__(message)
+
+
+def parse_address(address):
+    """Return (host, port) from HOST:PORT, HOST or :PORT"""
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        host, port = port, ''
+    try:
+        port = int(port) if port else AGENT_PORT
+    except ValueError:
+        raise AgentError(_('Invalid agent address "{}".').format(address))
+    return (host or AGENT_HOST, port)
+
+
+def check_file_name(name):
+    """Raise AgentError if the name is not a plain file name"""
+    if (not name) or (name in ('-', '.', '..')) or ('/' in name) or \
+            ('\\' in name) or (os.path.basename(name) != name):
+        raise AgentError(_('Invalid file name "{}" in the agent request.').format(name))
+    return name
+
+
+def check_job(job_def):
+    """Check file names and options of the job definition received from
+    the client.
+    """
+    if job_def.get('personalize'):
+        raise AgentError(_("Personalisation is not supported by the agent."))
+
+    options = [job_def.get('options', {})]
+    for operation in job_def.get('operations', []):
+        operation = dict(operation)
+        operation.pop('op', None)
+        if 'file' in operation:
+            check_file_name(operation.pop('file'))
+        options.append(operation)
+
+    for names in options:
+        for name in names:
+            if name not in JOB_OPTIONS:
+                raise AgentError(_('Job option "{}" is not accepted by the agent.').format(name))
+
+
+def encode_data(data):
+    return base64.b64encode(data)
+
+
+def decode_data(data):
+    try:
+        return base64.b64decode(data)
+    except TypeError:
+        raise AgentError(_("Invalid file data in the agent message."))
+
+
+class MessageStream(object):
+    """JSON messages on separate lines"""
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+
+    def send(self, **message):
+        self.wfile.write(json.dumps(message) + '\n')
+        self.wfile.flush()
+
+    def receive(self):
+        line = self.rfile.readline()
+        if not line:
+            raise AgentError(_("Connection closed by the agent."))
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise AgentError(_("Invalid agent message."))
+
+
+class OutputSink(object):
+    """Buffer of ThreadOutput which sends the output as it is written"""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def append(self, data):
+        self.stream.send(output=data.decode('utf-8', 'replace'))
+
+
+class AgentHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        stream = MessageStream(self.rfile, self.wfile)
+        try:
+            request = stream.receive()
+            self.server.run_job(request, stream, self.client_address)
+        except socket.error:
+            pass
+        except Exception as e:
+            try:
+                stream.send(error=u"%s" % (e,))
+            except socket.error:
+                pass
+
+
+class AgentServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Job server, run_job(request, stream, client_address) is called in
+    own thread for every connection.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, run_job):
+        self.run_job = run_job
+        SocketServer.TCPServer.__init__(self, address, AgentHandler)
+
+
+def request_job(address, request):
+    """Send the job request to the agent and yield the response messages up
+    to the result or error.
+    """
+    try:
+        sock = socket.create_connection(address)
+    except socket.error as e:
+        raise AgentError(_("Cannot connect to the agent {}:{}: {}").format(
+            address[0], address[1], e))
+
+    try:
+        stream = MessageStream(sock.makefile('rb'), sock.makefile('wb'))
+        stream.send(**request)
+        while True:
+            message = stream.receive()
+            yield message
+            if ('result' in message) or ('error' in message):
+                return
+    except socket.error as e:
+        raise AgentError(_("Agent connection error: {}").format(e))
+    finally:
+        sock.close()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Sub-command agent - serves job requests of "pytsb job --agent", see
+# agent.py for the protocol. Every request runs in own thread with own
+# ConsoleApp, its output is sent to the client.
+
+import os
+import sys
+
+import pytsb
+from tsb_locale import *
+
+
+class AgentRunner(object):
+    def __init__(self, app):
+        self.app = app
+        self.args = app.args
+        self.stderr = app.stderr    # Error output of the request threads
+
+    def runJob(self, request, stream, client_address):
+        """Run the job request received by the agent, the output is sent to
+        the client while the job is running.
+        """
+        import agent
+        import job
+        import shutil
+        import tempfile
+        import time
+
+        tmpdir = tempfile.mkdtemp(prefix='pytsb_agent_')
+        try:
+            for name, data in request.get('files', {}).items():
+                with open(os.path.join(tmpdir, agent.check_file_name(name)), 'wb') as file:
+                    file.write(agent.decode_data(data))
+            outputs = [agent.check_file_name(name) for name in request.get('outputs', [])]
+
+            try:
+                agent.check_job(request['job'])
+                tsb_job = job.Job()
+                tsb_job.fromDict(request['job'], tmpdir)
+                steps = tsb_job.plan()
+            except (KeyError, TypeError, job.JobError) as e:
+                raise agent.AgentError(_("Invalid job: %s") % (e,))
+            if not tsb_job.ports:
+                raise agent.AgentError(_("No port given in the job."))
+
+            worker = pytsb.ConsoleApp(self.app.argv, stderr=self.stderr)
+            worker.checkJob(tsb_job, steps, tsb_job.ports)
+            for filename, file_format, memory in tsb_job.images(steps):
+                worker.loadImage(filename, file_format, memory)
+
+            print(_("%s  job from %s on ports %s") % (
+                time.strftime("%Y-%m-%d %H:%M:%S"), client_address[0], ", ".join(tsb_job.ports)))
+            failed = []
+            sys.stdout.capture(agent.OutputSink(stream))
+            try:
+                for port in tsb_job.ports:
+                    print(_("Port %s:") % (port,))
+                    try:
+                        worker.runJobSteps(tsb_job, steps, port)
+                    except Exception as e:
+                        print(_("Port %s: %s") % (port, e))
+                        failed.append(port)
+            finally:
+                sys.stdout.release()
+
+            files = {}
+            for name in outputs:
+                path = os.path.join(tmpdir, name)
+                if os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        files[name] = agent.encode_data(file.read())
+
+            status = _("FAILED") if failed else _("OK")
+            print(_("%s  job from %s %s") % (
+                time.strftime("%Y-%m-%d %H:%M:%S"), client_address[0], status))
+            stream.send(result={'ok': not failed, 'failed': failed}, files=files)
+        finally:
+            shutil.rmtree(tmpdir, True)
+
+    def run(self, parser):
+        """Serve job requests until Ctrl+C. Every connection is handled in
+        own thread, output of the threads is sent to their clients.
+        """
+        import agent
+
+        try:
+            address = agent.parse_address(self.args.listen)
+            server = agent.AgentServer(address, self.runJob)
+        except (agent.AgentError, IOError) as e:
+            raise pytsb.AppException(u"%s" % (e,))
+
+        print(_("Agent listens on %s:%d, press Ctrl+C to stop.") % server.server_address)
+        stdout, sys.stdout = sys.stdout, pytsb.ThreadOutput(sys.stdout)
+        self.stderr = pytsb.ThreadOutput(self.app.stderr, sys.stdout.buffers)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            sys.stdout = stdout
+            self.stderr = self.app.stderr
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Sub-command bench - measures the link to the bootloader. User data reads
+# and flash page reads are timed, nothing is written into the device.
+
+import math
+import sys
+
+from tsb_locale import *
+
+
+def exchange_stats(times, tx_bytes, rx_bytes, baudrate):
+    """Statistics of the exchange durations (in seconds). Theoretical time
+    is given by the UART frame of 10 bits per byte (8N1).
+    """
+    times = sorted(times)
+    count = len(times)
+    mean = sum(times) / count
+    theoretical = (tx_bytes + rx_bytes) * 10.0 / baudrate
+    median = times[count // 2]
+
+    # Jitter histogram - number of exchanges in 1 ms bins above minimum
+    histogram = {}
+    for t in times:
+        slot = int((t - times[0]) * 1000)
+        histogram[slot] = histogram.get(slot, 0) + 1
+
+    return {
+        'count'          : count,
+        'min_ms'         : times[0] * 1000,
+        'median_ms'      : median * 1000,
+        'p90_ms'         : times[min(count - 1, int(count * 0.9))] * 1000,
+        'max_ms'         : times[-1] * 1000,
+        'stddev_ms'      : math.sqrt(sum((t - mean)**2 for t in times) / count) * 1000,
+        'theoretical_ms' : theoretical * 1000,
+        'overhead_ms'    : (median - theoretical) * 1000,
+        'bytes_per_s'    : (tx_bytes + rx_bytes) / mean,
+        'uart_bytes_per_s' : baudrate / 10.0,
+        'efficiency'     : theoretical / mean,
+        'jitter_histogram' : sorted(histogram.items()),
+    }
+
+
+class BenchRunner(object):
+    def __init__(self, app):
+        self.app = app
+        self.args = app.args
+
+    def run(self, parser):
+        """Time user data reads and flash page reads"""
+        import json
+        import time
+
+        app = self.app
+        args = self.args
+        if not args.baudrate.isdigit():
+            app.stderr.write(_("%s: error: argument -b/--buadrate: invalid int value: '%s'") % (sys.argv[0], args.baudrate,))
+            return
+        args.baudrate = int(args.baudrate)
+
+        app.activateTSB()
+        pagesize = app.tsb.device_info.pagesize
+
+        userdata_times = []
+        page_times = []
+        for i in xrange(max(args.count, 1)):
+            start = time.time()
+            app.tsb.readUserData()
+            userdata_times.append(time.time() - start)
+            page_times.extend(app.tsb.pageExchanges('f', max(args.pages, 1)))
+
+        # User data: 'c' -> page + '!', flash page: '!' -> page
+        results = {
+            'port'      : args.devicename,
+            'baudrate'  : args.baudrate,
+            'pagesize'  : pagesize,
+            'user_data' : exchange_stats(userdata_times, 1, pagesize + 1, args.baudrate),
+            'flash_page': exchange_stats(page_times, 1, pagesize, args.baudrate),
+        }
+
+        if args.json:
+            app.stdout.write(json.dumps(results, sort_keys=True) + '\n')
+            return
+        self.showResults(results)
+
+    def showResults(self, results):
+        print(_("Port %s, %d bps, page size %d bytes") % (
+            results['port'], results['baudrate'], results['pagesize']))
+        print(_("UART limit (8N1): %.0f bytes/s") % (results['flash_page']['uart_bytes_per_s'],))
+        print('')
+        print(_("%-12s %5s %8s %8s %8s %8s %8s %11s %6s") % (
+            _("Exchange"), _("Count"), _("Min ms"), _("Median"), _("P90"),
+            _("Max"), _("Ideal"), _("Bytes/s"), _("Eff.")))
+        for name, label in (('user_data', _("user data")), ('flash_page', _("flash page"))):
+            stats = results[name]
+            print(_("%-12s %5d %8.2f %8.2f %8.2f %8.2f %8.2f %11.0f %5.0f%%") % (
+                label, stats['count'], stats['min_ms'], stats['median_ms'],
+                stats['p90_ms'], stats['max_ms'], stats['theoretical_ms'],
+                stats['bytes_per_s'], stats['efficiency'] * 100))
+
+        stats = results['flash_page']
+        print('')
+        print(_("Overhead per exchange: %.2f ms, jitter (stddev): %.2f ms") % (
+            stats['overhead_ms'], stats['stddev_ms']))
+        print(_("Jitter distribution of flash page exchanges (above minimum):"))
+        for slot, count in stats['jitter_histogram']:
+            print(_("  +%3d ms %5d %s") % (slot, count, '#' * min(count, 50)))
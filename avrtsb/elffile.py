@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Reader of AVR ELF files made by avr-gcc
+#
+# Flash image is made from the loadable segments placed in the flash address
+# space (.text and the initial values of .data), the same as
+# "avr-objcopy -O ihex -R .eeprom". EEPROM image is made from the .eeprom
+# section. Other memories (fuses, lock bits, signature) are ignored.
+
+import struct
+
+import hexfile
+from tsb_locale import *
+
+ELF_MAGIC = '\x7fELF'
+ELFCLASS32 = 1
+ELFDATA2LSB = 1
+EM_AVR = 83
+
+PT_LOAD = 1
+SHT_NOBITS = 8
+
+ELF_HEADER = struct.Struct('<16sHHIIIIIHHHHHH')
+PROGRAM_HEADER = struct.Struct('<IIIIIIII')
+SECTION_HEADER = struct.Struct('<IIIIIIIIII')
+
+# Address spaces of avr-gcc linker scripts
+AVR_DATA_OFFSET = 0x800000
+AVR_EEPROM_OFFSET = 0x810000
+
+
+def is_elf(data):
+    return data[:len(ELF_MAGIC)] == ELF_MAGIC
+
+
+class ElfFile(object):
+    def __init__(self, data):
+        self.data = data
+        if len(data) < ELF_HEADER.size:
+            raise hexfile.DataFileError(_("ELF: file is truncated."))
+
+        (ident, e_type, self.machine, version, self.entry, self.phoff,
+         self.shoff, flags, ehsize, self.phentsize, self.phnum,
+         self.shentsize, self.shnum, self.shstrndx) = ELF_HEADER.unpack_from(data)
+
+        if not is_elf(ident):
+            raise hexfile.DataFileError(_("ELF: not an ELF file."))
+        if (ord(ident[4]) != ELFCLASS32) or (ord(ident[5]) != ELFDATA2LSB):
+            raise hexfile.DataFileError(_("ELF: only 32-bit little endian files are supported."))
+        if self.machine != EM_AVR:
+            raise hexfile.DataFileError(_("ELF: not an AVR file (machine %d).") % (self.machine,))
+
+    def unpackTable(self, header, offset, entsize, count):
+        if count and (entsize < header.size):
+            raise hexfile.DataFileError(_("ELF: invalid header table."))
+        if offset + entsize * count > len(self.data):
+            raise hexfile.DataFileError(_("ELF: file is truncated."))
+        return [header.unpack_from(self.data, offset + i * entsize)
+                for i in xrange(count)]
+
+    def fileData(self, offset, size):
+        if offset + size > len(self.data):
+            raise hexfile.DataFileError(_("ELF: file is truncated."))
+        return self.data[offset:offset+size]
+
+    def segments(self):
+        """Return list of (physical address, data) of loadable segments"""
+        return [(p_paddr, self.fileData(p_offset, p_filesz))
+                for (p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz,
+                     p_flags, p_align)
+                in self.unpackTable(PROGRAM_HEADER, self.phoff, self.phentsize, self.phnum)
+                if (p_type == PT_LOAD) and p_filesz]
+
+    def sections(self):
+        """Return list of (name, address, data) of sections with data"""
+        headers = self.unpackTable(SECTION_HEADER, self.shoff, self.shentsize, self.shnum)
+        if not headers:
+            return []
+        if self.shstrndx >= len(headers):
+            raise hexfile.DataFileError(_("ELF: invalid section name table."))
+        strtab = headers[self.shstrndx]
+        names = self.fileData(strtab[4], strtab[5])
+
+        sections = []
+        for (sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size,
+             sh_link, sh_info, sh_addralign, sh_entsize) in headers:
+            if (sh_type == SHT_NOBITS) or not sh_size:
+                continue
+            name = names[sh_name:names.find('\0', sh_name)]
+            sections.append((name, sh_addr, self.fileData(sh_offset, sh_size)))
+        return sections
+
+
+def read_elf(data, memory='flash'):
+    """Return MemoryImage of the 'flash' or 'eeprom' memory from the content
+    of AVR ELF file.
+    """
+    elf = ElfFile(data)
+    image = hexfile.MemoryImage()
+    if memory == 'eeprom':
+        for name, addr, section_data in elf.sections():
+            if name == '.eeprom':
+                if addr >= AVR_EEPROM_OFFSET:
+                    addr -= AVR_EEPROM_OFFSET
+                image.puts(addr, section_data, overwrite=False)
+    else:
+        for addr, segment_data in elf.segments():
+            if addr < AVR_DATA_OFFSET:
+                image.puts(addr, segment_data, overwrite=False)
+    return image
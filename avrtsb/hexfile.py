@@ -0,0 +1,392 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Memory images and Intel HEX / raw binary files reader and writer
+#
+# File name "-" is the standard input or output, files with .gz, .bz2 and .xz
+# extension are decompressed and compressed as streams.
+
+import binascii
+import bisect
+import os
+import re
+import sys
+
+from tsb_locale import *
+
+IHEX_BYTES_PER_RECORD = 16
+IHEX_DATA = 0
+IHEX_EOF = 1
+IHEX_EXT_SEGMENT_ADDR = 2
+IHEX_START_SEGMENT_ADDR = 3
+IHEX_EXT_LINEAR_ADDR = 4
+IHEX_START_LINEAR_ADDR = 5
+
+# Data length of the record types with fixed length
+IHEX_RECORD_LENGTH = {
+    IHEX_EOF                : 0,
+    IHEX_EXT_SEGMENT_ADDR   : 2,
+    IHEX_START_SEGMENT_ADDR : 4,
+    IHEX_EXT_LINEAR_ADDR    : 2,
+    IHEX_START_LINEAR_ADDR  : 4,
+}
+
+RE_IHEX_FIRST_LINE = re.compile(r"\s*:[0-9A-Fa-f]+\s*$")
+
+STDIO_FILENAME = '-'
+COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+
+class DataFileError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(DataFileError, self).__init__(message)
+
+
+class MemoryImage(object):
+    """Sparse memory image. Data are kept in the list of [start, bytearray]
+    segments sorted by the start address. The segments never overlap and
+    never touch each other, neighbouring data are merged into one segment.
+    """
+    def __init__(self):
+        self.segments = []
+        self.start_record = None    # (type, data) of Intel HEX start address
+
+    def __len__(self):
+        """Number of the data bytes in the image"""
+        return sum(len(data) for start, data in self.segments)
+
+    def copy(self):
+        image = MemoryImage()
+        image.segments = [[start, bytearray(data)] for start, data in self.segments]
+        image.start_record = self.start_record
+        return image
+
+    def minaddr(self):
+        if self.segments:
+            return self.segments[0][0]
+        return None
+
+    def maxaddr(self):
+        if self.segments:
+            start, data = self.segments[-1]
+            return start + len(data) - 1
+        return None
+
+    def puts(self, addr, data, overwrite=True):
+        """Put data at the given address. If overwrite is False, DataFileError
+        is raised when the data overlap existing data.
+        """
+        if not data:
+            return
+
+        segments = self.segments
+        end = addr + len(data)
+
+        # Fast path - data follow the last segment, usual for file reading
+        if segments:
+            last_start, last_data = segments[-1]
+            if last_start + len(last_data) == addr:
+                last_data.extend(data)
+                return
+
+        # Find all segments which overlap or touch the range addr..end
+        first = bisect.bisect_left(segments, [addr])
+        if (first > 0) and (segments[first-1][0] + len(segments[first-1][1]) >= addr):
+            first -= 1
+
+        last = first
+        while (last < len(segments)) and (segments[last][0] <= end):
+            seg_start, seg_data = segments[last]
+            if (not overwrite) and (seg_start < end) and \
+                    (seg_start + len(seg_data) > addr):
+                raise DataFileError(
+                    _("Data at address 0x%.4X overlap existing data.") % (max(addr, seg_start),))
+            last += 1
+
+        if first == last:
+            segments.insert(first, [addr, bytearray(data)])
+            return
+
+        new_start = min(addr, segments[first][0])
+        new_end = max(end, segments[last-1][0] + len(segments[last-1][1]))
+        buf = bytearray(new_end - new_start)
+        for seg_start, seg_data in segments[first:last]:
+            buf[seg_start-new_start : seg_start-new_start+len(seg_data)] = seg_data
+        buf[addr-new_start : end-new_start] = data
+        segments[first:last] = [[new_start, buf]]
+
+    def tobinstr(self, start=None, end=None, pad='\xFF'):
+        """Return data from the start up to the end address (included) as
+        a string. Gaps between segments are filled with the pad byte. Missing
+        start/end means the lowest/highest address of the image.
+        """
+        if start is None:
+            start = self.minaddr()
+        if end is None:
+            end = self.maxaddr()
+        if (start is None) or (end is None) or (end < start):
+            return ''
+
+        if len(self.segments) == 1:
+            seg_start, seg_data = self.segments[0]
+            if (seg_start == start) and (seg_start + len(seg_data) == end + 1):
+                return bytes(seg_data)
+
+        buf = bytearray(pad * (end - start + 1))
+        for seg_start, seg_data in self.segments:
+            lo = max(start, seg_start)
+            hi = min(end + 1, seg_start + len(seg_data))
+            if lo < hi:
+                buf[lo-start : hi-start] = seg_data[lo-seg_start : hi-seg_start]
+        return bytes(buf)
+
+
+def split_compression(filename):
+    """Return (filename without compression extension, compression or None)"""
+    basename, ext = os.path.splitext(filename)
+    compression = COMPRESSIONS.get(ext.lower())
+    if compression is None:
+        return filename, None
+    return basename, compression
+
+
+def open_compressed(filename, mode, compression):
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filename, mode)
+    if compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(filename, mode)
+
+    try:
+        from backports import lzma
+    except ImportError:
+        try:
+            import lzma
+        except ImportError:
+            raise DataFileError(_("xz compressed files require the backports.lzma package."))
+    return lzma.open(filename, mode)
+
+
+def open_stdio(stream, mode):
+    """Return binary file object of the standard stream. Closing of the file
+    object does not close the stream.
+    """
+    stream.flush()
+    fd = os.dup(stream.fileno())
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(fd, os.O_BINARY)
+    return os.fdopen(fd, mode)
+
+
+def open_input(filename):
+    """Open the file for binary reading, compressed file is decompressed"""
+    if filename == STDIO_FILENAME:
+        return open_stdio(sys.stdin, 'rb')
+    basename, compression = split_compression(filename)
+    if compression:
+        return open_compressed(filename, 'rb', compression)
+    return open(filename, 'rb')
+
+
+def open_output(filename, mode='wb'):
+    """Open the file for writing, compressed file is always binary. The
+    standard output is used even if sys.stdout was redirected.
+    """
+    if filename == STDIO_FILENAME:
+        return open_stdio(sys.__stdout__, 'wb')
+    basename, compression = split_compression(filename)
+    if compression:
+        return open_compressed(filename, 'wb', compression)
+    return open(filename, mode)
+
+
+def is_intelhex(data):
+    """Check first non empty line of the data for Intel HEX record"""
+    for line in data[:4096].splitlines():
+        if line.strip():
+            return RE_IHEX_FIRST_LINE.match(line) is not None
+    return False
+
+
+def read_ihex(data):
+    """Parse content of Intel HEX file and return MemoryImage. Records are
+    processed in one pass, checksum of every record is checked.
+    """
+    image = MemoryImage()
+    base_addr = 0
+    for lineno, line in enumerate(data.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            if line[0] != ':':
+                raise ValueError
+            record = bytearray(binascii.unhexlify(line[1:]))
+        except (ValueError, TypeError):
+            raise DataFileError(_("Intel HEX: invalid record on line %d.") % (lineno,))
+
+        if (len(record) < 5) or (record[0] + 5 != len(record)):
+            raise DataFileError(_("Intel HEX: invalid record length on line %d.") % (lineno,))
+
+        if sum(record) & 0xFF:
+            raise DataFileError(_("Intel HEX: checksum error on line %d.") % (lineno,))
+
+        rectype = record[3]
+        if (rectype in IHEX_RECORD_LENGTH) and (record[0] != IHEX_RECORD_LENGTH[rectype]):
+            raise DataFileError(_("Intel HEX: invalid record length on line %d.") % (lineno,))
+
+        if rectype == IHEX_DATA:
+            addr = base_addr + (record[1] << 8) + record[2]
+            image.puts(addr, record[4:-1], overwrite=False)
+        elif rectype == IHEX_EOF:
+            break
+        elif rectype == IHEX_EXT_SEGMENT_ADDR:
+            base_addr = ((record[4] << 8) + record[5]) * 16
+        elif rectype == IHEX_EXT_LINEAR_ADDR:
+            base_addr = ((record[4] << 8) + record[5]) << 16
+        elif rectype in (IHEX_START_SEGMENT_ADDR, IHEX_START_LINEAR_ADDR):
+            image.start_record = (rectype, bytes(record[4:-1]))
+        else:
+            raise DataFileError(_("Intel HEX: unknown record type on line %d.") % (lineno,))
+
+    return image
+
+
+def read_raw(data, addr=0):
+    image = MemoryImage()
+    image.puts(addr, data)
+    return image
+
+
+def ihex_record(rectype, addr, data=''):
+    record = bytearray([len(data), (addr >> 8) & 0xFF, addr & 0xFF, rectype])
+    record.extend(data)
+    record.append((-sum(record)) & 0xFF)
+    return ':' + binascii.hexlify(record).upper() + '\n'
+
+
+class IntelHexWriter(object):
+    """Intel HEX records written as the data come. Data must be written with
+    increasing addresses, the gap between data starts new record. Incomplete
+    record is kept until the next data or close().
+    """
+    def __init__(self, file):
+        self.file = file
+        self.upper_addr = 0
+        self.addr = 0               # Address of the buffered data
+        self.buf = bytearray()
+        self.lines = []
+
+    def write(self, addr, data):
+        if self.buf and (addr != self.addr + len(self.buf)):
+            self.writeRecords(flush=True)
+        if not self.buf:
+            self.addr = addr
+        self.buf.extend(data)
+        self.writeRecords()
+
+    def writeRecords(self, flush=False):
+        buf = bytes(self.buf)
+        lines = self.lines
+        offset = 0
+        while offset < len(buf):
+            addr = self.addr + offset
+
+            # Record cannot cross 64kB boundary
+            size = min(IHEX_BYTES_PER_RECORD, 0x10000 - (addr & 0xFFFF))
+            if len(buf) - offset < size:
+                if not flush:
+                    break
+                size = len(buf) - offset
+
+            if (addr >> 16) != self.upper_addr:
+                self.upper_addr = addr >> 16
+                lines.append(ihex_record(IHEX_EXT_LINEAR_ADDR, 0,
+                                         bytearray([self.upper_addr >> 8, self.upper_addr & 0xFF])))
+            lines.append(ihex_record(IHEX_DATA, addr & 0xFFFF, buf[offset:offset+size]))
+            offset += size
+
+            if len(lines) >= 256:
+                self.file.write(''.join(lines))
+                del lines[:]
+
+        del self.buf[:offset]
+        self.addr += offset
+        if flush:
+            self.file.write(''.join(lines))
+            del lines[:]
+
+    def close(self, start_record=None):
+        self.writeRecords(flush=True)
+        if start_record is not None:
+            self.file.write(ihex_record(start_record[0], 0, start_record[1]))
+        self.file.write(ihex_record(IHEX_EOF, 0))
+
+
+class RawWriter(object):
+    """Raw binary data written as they come, data must be written with
+    increasing addresses. Gaps are filled with the pad byte.
+    """
+    def __init__(self, file, pad='\xFF'):
+        self.file = file
+        self.pad = pad
+        self.addr = None            # Address after the written data
+
+    def write(self, addr, data):
+        if (self.addr is not None) and (addr > self.addr):
+            self.file.write(self.pad * (addr - self.addr))
+        self.file.write(data)
+        self.addr = addr + len(data)
+
+    def close(self, start_record=None):
+        pass
+
+
+class TrimmedWriter(object):
+    """Writer wrapper which does not write the pad bytes at the end of data,
+    contiguous data are expected.
+    """
+    def __init__(self, writer, pad='\xFF'):
+        self.writer = writer
+        self.pad = pad
+        self.pending = 0            # Number of pad bytes not written yet
+
+    def write(self, addr, data):
+        stripped = data.rstrip(self.pad)
+        if stripped:
+            self.writer.write(addr - self.pending, self.pad * self.pending + stripped)
+            self.pending = len(data) - len(stripped)
+        else:
+            self.pending += len(data)
+
+    def close(self, start_record=None):
+        self.writer.close(start_record)
+
+
+def image_writer(file, format):
+    """Return writer of the format 'ihex' or 'raw'"""
+    return {'ihex': IntelHexWriter, 'raw': RawWriter}[format](file)
+
+
+def write_ihex(image, file):
+    """Write image into the file object in Intel HEX format. Records are
+    written per segment, never the whole file is made in the memory.
+    """
+    writer = IntelHexWriter(file)
+    for seg_start, seg_data in image.segments:
+        writer.write(seg_start, seg_data)
+    writer.close(image.start_record)
+
+
+def write_raw(image, file, pad='\xFF'):
+    """Write image from the lowest to the highest address, gaps are filled
+    with the pad byte.
+    """
+    writer = RawWriter(file, pad)
+    for seg_start, seg_data in image.segments:
+        writer.write(seg_start, seg_data)
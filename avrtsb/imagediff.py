@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Byte level comparison of memory images
+
+import json
+
+from tsb_locale import *
+
+DIFF_CHUNK_SIZE = 256       # Equal chunks are skipped with one string compare
+DUMP_LINE_SIZE = 16
+
+
+class ImageDiff(object):
+    """Result of comparison of two memory images. Mismatching address ranges
+    are kept in the list of (start, end) tuples sorted by address, the end
+    address is not included.
+    """
+    def __init__(self, name1="", name2=""):
+        self.name1 = name1
+        self.name2 = name2
+        self.start = 0
+        self.data1 = ''
+        self.data2 = ''
+        self.ranges = []
+        self.stop_addr = None   # Comparison was stopped before the end
+
+    @property
+    def ok(self):
+        return not self.ranges
+
+    @property
+    def mismatch_count(self):
+        """Number of mismatching bytes"""
+        return sum(end - start for start, end in self.ranges)
+
+    def summary(self):
+        if self.ok:
+            return _("Data verification OK")
+
+        summary = _("%d mismatching bytes in %d address ranges, first at 0x%.4X") % (
+            self.mismatch_count, len(self.ranges), self.ranges[0][0])
+        if self.stop_addr is not None:
+            summary += "\n" + _("Verification stopped at address 0x%.4X") % (self.stop_addr,)
+        return summary
+
+    def dumpLine(self, data, addr):
+        offset = addr - self.start
+        line = bytearray(data[offset : offset+DUMP_LINE_SIZE])
+        hex_bytes = " ".join("%.2X" % (b,) for b in line)
+        ascii = "".join(chr(b) if 32 <= b < 127 else "." for b in line)
+        return "%.4X  %-47s  |%s|" % (addr, hex_bytes, ascii)
+
+    def dump(self):
+        """Return hex dump of the mismatching ranges only. Every line is
+        printed for both images, the first one with '-' and second with '+'.
+        """
+        # Ranges which share dump lines are printed as one block
+        blocks = []
+        for start, end in self.ranges:
+            first = max(self.start, start - (start % DUMP_LINE_SIZE))
+            if blocks and (first < blocks[-1][2]):
+                blocks[-1][2] = end
+            else:
+                blocks.append([first, start, end])
+
+        lines = ["--- %s" % (self.name1,), "+++ %s" % (self.name2,)]
+        for first, start, end in blocks:
+            lines.append("@@ 0x%.4X - 0x%.4X @@" % (start, end - 1))
+            for addr in xrange(first, end, DUMP_LINE_SIZE):
+                lines.append("-" + self.dumpLine(self.data1, addr))
+                lines.append("+" + self.dumpLine(self.data2, addr))
+
+        return "\n".join(lines)
+
+    def todict(self):
+        return {
+            'ok'             : self.ok,
+            'name1'          : self.name1,
+            'name2'          : self.name2,
+            'mismatch_count' : self.mismatch_count,
+            'stop_addr'      : self.stop_addr,
+            'ranges'         : [{'start': start, 'end': end, 'length': end - start}
+                                for start, end in self.ranges],
+        }
+
+    def tojson(self):
+        return json.dumps(self.todict(), sort_keys=True)
+
+
+def compare_buffers(data1, data2, start=0):
+    """Compare two strings of the same length. Return list of mismatching
+    (start, end) address ranges, start is the address of the first byte.
+    """
+    ranges = []
+    size = len(data1)
+    for offset in xrange(0, size, DIFF_CHUNK_SIZE):
+        chunk_end = min(offset + DIFF_CHUNK_SIZE, size)
+        if data1[offset:chunk_end] == data2[offset:chunk_end]:
+            continue
+
+        for i in xrange(offset, chunk_end):
+            if data1[i] == data2[i]:
+                continue
+            addr = start + i
+            if ranges and ranges[-1][1] == addr:
+                ranges[-1] = (ranges[-1][0], addr + 1)
+            else:
+                ranges.append((addr, addr + 1))
+    return ranges
+
+
+def compare_data(data1, data2, name1="", name2="", start=0):
+    """Compare two strings of the same length, start is the address of the
+    first byte.
+    """
+    diff = ImageDiff(name1, name2)
+    diff.start = start
+    diff.data1 = data1
+    diff.data2 = data2
+    diff.ranges = compare_buffers(data1, data2, start)
+    return diff
+
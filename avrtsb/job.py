@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Job files - list of operations executed in one bootloader session
+#
+# Example of JSON job file:
+# {
+#     "ports": ["/dev/ttyUSB0", "/dev/ttyUSB1"],
+#     "options": {"baudrate": 115200, "password": "secret"},
+#     "operations": [
+#         {"op": "user-data", "change_timeout": 200},
+#         {"op": "flash-write", "file": "app.hex"},
+#         {"op": "flash-verify"},
+#         {"op": "eeprom-write", "file": "eeprom.hex", "delta": true},
+#         {"op": "eeprom-verify"}
+#     ]
+# }
+#
+# Keys of "options" and of the operations are names of pytsb tsb options
+# with underscores (for example "fail_fast", "no_trim").
+#
+# Optional "personalize" part defines unique data of every unit, see
+# template.py.
+#
+# File names of the read operations can include {port} and {unit}, they are
+# replaced with the port name and the unit description. One of them is
+# required if the job runs on more ports.
+
+import os
+import json
+import re
+
+from tsb_locale import *
+
+# Operation name: (ConsoleApp method, argument with the file name, memory)
+OPERATIONS = {
+    'info'          : ('showDeviceInfo', None, None),
+    'user-data'     : ('changeUserData', None, None),
+    'flash-read'    : ('flashRead', 'flash_read', 'flash'),
+    'flash-erase'   : ('flashErase', None, 'flash'),
+    'flash-write'   : ('flashWrite', 'flash_write', 'flash'),
+    'flash-verify'  : ('flashVerify', 'flash_verify', 'flash'),
+    'eeprom-read'   : ('eepromRead', 'eeprom_read', 'eeprom'),
+    'eeprom-erase'  : ('eepromErase', None, 'eeprom'),
+    'eeprom-write'  : ('eepromWrite', 'eeprom_write', 'eeprom'),
+    'eeprom-verify' : ('eepromVerify', 'eeprom_verify', 'eeprom'),
+}
+
+# Arguments which are lists in pytsb tsb command line (nargs=1 or nargs=+)
+LIST_ARGUMENTS = ['flash_read', 'flash_write', 'eeprom_read', 'eeprom_write',
+                  'new_password', 'change_timeout']
+
+
+def unit_file_name(filename, port, unit=None):
+    """Return filename with {port} and {unit} replaced for the port"""
+    def field(value):
+        return re.sub(r'[^\w.-]+', '_', value).strip('_')
+
+    filename = filename.replace('{port}', field(os.path.basename(port)))
+    if unit is not None:
+        filename = filename.replace('{unit}', field(unit))
+    return filename
+
+
+class JobError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(JobError, self).__init__(message)
+
+
+class JobStep(object):
+    def __init__(self, op, filename=None, options=None):
+        if op not in OPERATIONS:
+            raise JobError(_('Unknown job operation "{}".').format(op))
+
+        self.op = op
+        self.method, self.file_argument, self.memory = OPERATIONS[op]
+        self.filename = filename
+        self.options = options or {}
+
+    @property
+    def format_argument(self):
+        return "%s_file_format" % (self.memory,)
+
+    @property
+    def file_format(self):
+        return self.options.get(self.format_argument, 'auto')
+
+    def apply(self, args):
+        """Set the command line arguments used by the ConsoleApp method"""
+        for name, value in self.options.items():
+            if not hasattr(args, name):
+                raise JobError(_('Unknown option "{}" of the job operation "{}".').format(name, self.op))
+            if (name in LIST_ARGUMENTS) and not isinstance(value, list):
+                value = [value]
+            setattr(args, name, value)
+
+        if self.file_argument:
+            value = self.filename
+            if self.file_argument in LIST_ARGUMENTS:
+                value = [value]
+            setattr(args, self.file_argument, value)
+
+    def forUnit(self, port, unit=None):
+        """Return the step with the output file name of the port"""
+        if not (self.op.endswith('-read') and self.filename):
+            return self
+        return JobStep(self.op, unit_file_name(self.filename, port, unit), self.options)
+
+    def todict(self):
+        operation = dict(self.options)
+        operation['op'] = self.op
+        if self.filename:
+            operation['file'] = self.filename
+        return operation
+
+    def __str__(self):
+        if self.filename:
+            return "%-14s %s" % (self.op, self.filename)
+        return self.op
+
+
+class Job(object):
+    def __init__(self):
+        self.ports = []
+        self.options = {}
+        self.steps = []
+        self.dropped = []   # List of (step, reason) removed by the planner
+        self.template = None    # template.Template of the personalisation
+
+    @classmethod
+    def fromFile(cls, filename):
+        basename, ext = os.path.splitext(filename)
+        with open(filename, 'r') as file:
+            content = file.read()
+
+        try:
+            if ext.lower() == '.toml':
+                try:
+                    import toml
+                except ImportError:
+                    raise JobError(_("TOML job file requires the toml package."))
+                job_def = toml.loads(content)
+            else:
+                job_def = json.loads(content)
+        except ValueError as e:
+            raise JobError(_('Job file "{}" parsing error: {}').format(filename, e))
+
+        job = cls()
+        job.fromDict(job_def, os.path.dirname(os.path.abspath(filename)))
+        return job
+
+    def fromDict(self, job_def, base_dir=""):
+        """Load job definition, file names are relative to the base_dir"""
+        self.ports = list(job_def.get('ports', []))
+        if 'port' in job_def:
+            self.ports.insert(0, job_def['port'])
+        self.options = dict(job_def.get('options', {}))
+
+        self.template = None
+        if job_def.get('personalize'):
+            import template
+            try:
+                self.template = template.Template.fromDict(job_def['personalize'], base_dir)
+            except template.TemplateError as e:
+                raise JobError(u"%s" % (e,))
+
+        self.steps = []
+        for operation in job_def.get('operations', []):
+            operation = dict(operation)
+            op = operation.pop('op', None)
+            filename = operation.pop('file', None)
+            if filename and base_dir and (filename != '-'):
+                filename = os.path.join(base_dir, filename)
+            self.steps.append(JobStep(op, filename, operation))
+
+    def plan(self):
+        """Return list of steps which will be executed. Verification without
+        file name uses the last written file, erase before flash write is
+        dropped because the flash write erases whole flash.
+        """
+        steps = []
+        last_written = {}
+        for step in self.steps:
+            if (step.op in ('flash-write', 'eeprom-write')) and not step.filename:
+                raise JobError(_('Job operation "{}" requires file.').format(step.op))
+            if (step.op in ('flash-read', 'eeprom-read')) and not step.filename:
+                raise JobError(_('Job operation "{}" requires file.').format(step.op))
+
+            if step.op.endswith('-verify') and not step.filename:
+                if step.memory not in last_written:
+                    raise JobError(_('Job operation "{}" requires file, no file was written before.').format(step.op))
+                written = last_written[step.memory]
+                step = JobStep(step.op, written.filename, dict(step.options))
+                step.options.setdefault(step.format_argument, written.file_format)
+
+            if step.op.endswith('-write'):
+                last_written[step.memory] = step
+            steps.append(step)
+
+        if self.template:
+            for memory in sorted(self.template.memories()):
+                if memory not in last_written:
+                    raise JobError(_('Personalisation of {0} memory requires {0}-write operation.').format(memory))
+
+        self.dropped = []
+        planned = []
+        for i, step in enumerate(steps):
+            if step.op == 'flash-erase':
+                next_flash = [s for s in steps[i+1:] if s.memory == 'flash'][:1]
+                if next_flash and next_flash[0].op == 'flash-write':
+                    self.dropped.append((step, _("flash is erased by flash-write")))
+                    continue
+            planned.append(step)
+        return planned
+
+    def checkOutputs(self, steps, ports=None):
+        """Raise JobError if the read steps would write the same file for
+        more ports. Ports None means any number of ports.
+        """
+        for step in steps:
+            if not (step.op.endswith('-read') and step.filename):
+                continue
+            if ('{unit}' in step.filename) and not self.template:
+                raise JobError(_('File name "{}" uses {{unit}}, the job has no personalisation.').format(step.filename))
+            if (ports is None or len(ports) > 1) and (step.filename != '-') and \
+                    ('{port}' not in step.filename) and ('{unit}' not in step.filename):
+                raise JobError(_('Job operation "{}" runs on more ports, use {{port}} or {{unit}} '
+                                 'in the file name "{}".').format(step.op, step.filename))
+
+    def images(self, steps):
+        """Return list of (filename, format, memory) of the input files"""
+        images = []
+        for step in steps:
+            if step.filename and (step.op.endswith('-write') or step.op.endswith('-verify')):
+                image = (step.filename, step.file_format, step.memory)
+                if image not in images:
+                    images.append(image)
+        return images
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Sub-command job - operations of the job file executed on every port
+#
+# Steps of the job are executed by ConsoleApp.runJobSteps(), this module
+# plans the job, runs it on the ports one by one or sends it to the agent.
+# Functions load_job, show_job_plan and unit_images are shared with the
+# watch sub-command.
+
+import os
+import sys
+
+import hexfile
+import pytsb
+from tsb_locale import *
+
+
+def load_job(filename):
+    """Load and plan the job file, return (job, steps)"""
+    import job
+
+    try:
+        tsb_job = job.Job.fromFile(filename)
+        steps = tsb_job.plan()
+    except (IOError, job.JobError) as e:
+        raise pytsb.AppException(u"%s" % (e,))
+    return tsb_job, steps
+
+
+def show_job_plan(tsb_job, steps, ports):
+    print(_("Ports: %s") % (", ".join(ports),))
+    print(_("Planned operations:"))
+    print(_("  %2d. %s") % (1, _("activate bootloader")))
+    for i, step in enumerate(steps, 2):
+        print(_("  %2d. %s") % (i, step))
+
+    for step, reason in tsb_job.dropped:
+        print(_("  Dropped %s: %s") % (step, reason))
+    print('')
+
+
+def unit_images(tsb_job, steps, images):
+    """Return (images, unit description) for the next unit. Images of the
+    memories personalised by the job template are replaced by patched
+    copies, the other images are shared.
+    """
+    import template
+
+    if not tsb_job.template:
+        return images, None
+
+    try:
+        record = tsb_job.template.nextRecord()
+        memories = tsb_job.template.memories()
+        images = dict(images)
+        for key in tsb_job.images(steps):
+            filename, file_format, memory = key
+            if memory in memories:
+                file_container = pytsb.DataFileContainer()
+                file_container.setImage(
+                    tsb_job.template.apply(images[key].image, memory, record))
+                images[key] = file_container
+    except template.TemplateError as e:
+        raise pytsb.AppException(u"%s" % (e,))
+    return images, tsb_job.template.describe(record)
+
+
+class JobRunner(object):
+    def __init__(self, app):
+        self.app = app
+        self.args = app.args
+
+    def run(self, parser):
+        app = self.app
+        tsb_job, steps = load_job(self.args.jobfile)
+
+        ports = self.args.port or tsb_job.ports
+        if not ports:
+            parser.print_usage()
+            app.stderr.write(_("pytsb job: error: no port given in the job file or by --port.\n"))
+            return
+
+        reports = [tsb_job.options.get('verify_report')] + \
+                  [step.options.get('verify_report') for step in steps]
+        if (hexfile.STDIO_FILENAME in [step.filename for step in steps if step.op.endswith('-read')]) or \
+                ('json' in reports):
+            sys.stdout = sys.stderr
+
+        show_job_plan(tsb_job, steps, ports)
+        app.checkJob(tsb_job, steps, ports)
+
+        if self.args.dry_run:
+            return
+
+        if self.args.agent:
+            self.runRemoteJob(tsb_job, steps, ports)
+            return
+
+        # All images are parsed before the first device is activated
+        for filename, file_format, memory in tsb_job.images(steps):
+            app.loadImage(filename, file_format, memory)
+
+        base_images = app.images
+        failed = []
+        for port in ports:
+            print(_("Port %s:") % (port,))
+            app.images, unit = unit_images(tsb_job, steps, base_images)
+            if unit:
+                print(_("Unit: %s") % (unit,))
+            try:
+                app.runJobSteps(tsb_job, steps, port, unit)
+            except Exception as e:
+                app.stderr.write(_("Port %s: %s\n") % (port, e))
+                failed.append(port)
+
+        if failed:
+            app.stderr.write(_("Job failed on ports: %s\n") % (", ".join(failed),))
+        else:
+            print(_("Job finished OK"))
+
+    def agentRequest(self, tsb_job, steps, ports):
+        """Return (request, outputs) for the agent. Input files are sent with
+        the request, outputs is dict of received file names and local paths.
+        """
+        import agent
+        import job
+
+        if tsb_job.template:
+            raise pytsb.AppException(_("Personalisation is not supported with --agent."))
+
+        files = {}
+        outputs = {}
+        operations = []
+        for i, step in enumerate(steps):
+            operation = step.todict()
+            if step.filename:
+                name = "%d_%s" % (i, os.path.basename(step.filename))
+                operation['file'] = name
+                if step.op.endswith('-read'):
+                    args = self.app.jobArgs(tsb_job, ports[0])
+                    step.apply(args)
+                    for port in ports:
+                        filename = job.unit_file_name(step.filename, port)
+                        pytsb.DataFileContainer().checkOutputFileExists(filename, args.force)
+                        outputs[job.unit_file_name(name, port)] = filename
+                else:
+                    with hexfile.open_input(step.filename) as file:
+                        files[name] = agent.encode_data(file.read())
+            operations.append(operation)
+
+        request = {
+            'job'     : {'ports': ports, 'options': tsb_job.options,
+                         'operations': operations},
+            'files'   : files,
+            'outputs' : sorted(outputs),
+        }
+        return request, outputs
+
+    def runRemoteJob(self, tsb_job, steps, ports):
+        """Send the job to the agent, print its output as it comes and save
+        the files read from the devices.
+        """
+        import agent
+
+        try:
+            address = agent.parse_address(self.args.agent)
+            request, outputs = self.agentRequest(tsb_job, steps, ports)
+            for message in agent.request_job(address, request):
+                if 'output' in message:
+                    sys.stdout.write(message['output'].encode(SYS_ENCODING or 'utf-8', 'replace'))
+                    sys.stdout.flush()
+                elif 'error' in message:
+                    raise pytsb.AppException(_("Agent: %s") % (message['error'],))
+                else:
+                    result = message['result']
+                    files = message.get('files', {})
+        except (IOError, agent.AgentError) as e:
+            raise pytsb.AppException(u"%s" % (e,))
+
+        for name, data in sorted(files.items()):
+            if name in outputs:
+                with hexfile.open_output(outputs[name]) as file:
+                    file.write(agent.decode_data(data))
+
+        if result['failed']:
+            self.app.stderr.write(_("Job failed on ports: %s\n") % (", ".join(result['failed']),))
+        else:
+            print(_("Job finished OK"))
@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Serial port enumeration
+#
+# On Linux the ports are read directly from /sys/class/tty. Information about
+# every tty is read only once and kept in the cache, the list of ports is
+# rescanned only when /dev or /sys/class/tty was changed. On other systems
+# serial.tools.list_ports is used.
+#
+# Low latency mode of USB serial adapters is also set here.
+
+import os
+
+from tsb_locale import *
+
+SYSFS_TTY = '/sys/class/tty'
+DEV_DIR = '/dev'
+
+# Subsystems of the tty devices which are not real serial ports
+IGNORED_SUBSYSTEMS = ['platform']
+
+# Linux ioctl for struct serial_struct, flags are 5th int of the structure
+TIOCGSERIAL = 0x541E
+TIOCSSERIAL = 0x541F
+SERIAL_STRUCT_INTS = 32
+SERIAL_STRUCT_FLAGS = 4
+ASYNC_LOW_LATENCY = 0x2000
+
+LOW_LATENCY_TIMER = 1   # ms, latency timer of FTDI adapters, default is 16 ms
+
+
+class PortInfo(object):
+    def __init__(self, device):
+        self.device = device
+        self.name = os.path.basename(device)
+        self.description = 'n/a'
+        self.subsystem = None
+        self.vid = None
+        self.pid = None
+        self.serial_number = None
+        self.location = None        # USB physical path, e.g. 1-1.2:1.0
+        self.manufacturer = None
+        self.product = None
+
+    @property
+    def hwid(self):
+        if self.vid is None:
+            return 'n/a'
+        hwid = 'USB VID:PID=%.4X:%.4X' % (self.vid, self.pid)
+        if self.serial_number:
+            hwid += ' SER=%s' % (self.serial_number,)
+        if self.location:
+            hwid += ' LOCATION=%s' % (self.location,)
+        return hwid
+
+    def __repr__(self):
+        return 'PortInfo(%r)' % (self.device,)
+
+
+def read_attr(path, name):
+    """Return content of sysfs attribute file or None if it does not exist"""
+    try:
+        with open(os.path.join(path, name), 'r') as file:
+            return file.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def sysfs_port_info(name):
+    """Read information about one tty from sysfs. Return None for virtual
+    terminals and serial ports without hardware.
+    """
+    tty_path = os.path.join(SYSFS_TTY, name)
+    device_path = os.path.join(tty_path, 'device')
+    if not os.path.exists(device_path):
+        return None
+
+    device_path = os.path.realpath(device_path)
+    subsystem = os.path.basename(os.path.realpath(os.path.join(device_path, 'subsystem')))
+    if subsystem in IGNORED_SUBSYSTEMS:
+        return None
+
+    # Legacy 8250 UART ports are registered even if there is no hardware
+    if (subsystem == 'pnp' or name.startswith('ttyS')) and read_attr(tty_path, 'type') == '0':
+        return None
+
+    info = PortInfo(os.path.join(DEV_DIR, name))
+    info.subsystem = subsystem
+    info.description = name
+
+    if subsystem == 'usb-serial':
+        interface_path = os.path.dirname(device_path)
+    elif subsystem == 'usb':
+        interface_path = device_path
+    else:
+        return info
+
+    usb_path = os.path.dirname(interface_path)
+    vid = read_attr(usb_path, 'idVendor')
+    pid = read_attr(usb_path, 'idProduct')
+    if vid and pid:
+        info.vid = int(vid, 16)
+        info.pid = int(pid, 16)
+    info.serial_number = read_attr(usb_path, 'serial')
+    info.manufacturer = read_attr(usb_path, 'manufacturer')
+    info.product = read_attr(usb_path, 'product')
+    info.location = os.path.basename(interface_path)
+    info.description = info.product or read_attr(interface_path, 'interface') or name
+    return info
+
+
+class PortCache(object):
+    def __init__(self):
+        self.key = None
+        self.ports = []
+        self.entries = {}       # entryKey(): PortInfo or None
+
+    def scanKey(self):
+        """Key changed whenever a tty device is added or removed"""
+        names = tuple(sorted(os.listdir(SYSFS_TTY)))
+        try:
+            dev_mtime = os.stat(DEV_DIR).st_mtime
+        except OSError:
+            dev_mtime = None
+        return (os.stat(SYSFS_TTY).st_mtime, dev_mtime, names)
+
+    def entryKey(self, name):
+        """Key of the cached tty information. The sysfs directory and the
+        device file are made again for every connected adapter, their inode
+        and change time differ also for an adapter plugged into the same USB
+        socket under the same name.
+        """
+        tty_path = os.path.join(SYSFS_TTY, name)
+        key = [name, os.path.realpath(tty_path)]
+        for path in (tty_path, os.path.join(DEV_DIR, name)):
+            try:
+                stat = os.stat(path)
+                key.append((stat.st_ino, stat.st_ctime))
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    def comports(self):
+        key = self.scanKey()
+        if key == self.key:
+            return self.ports
+
+        entries = {}
+        ports = []
+        for name in key[-1]:
+            entry = self.entryKey(name)
+            if entry in self.entries:
+                info = self.entries[entry]
+            else:
+                info = sysfs_port_info(name)
+            entries[entry] = info
+            if info is not None:
+                ports.append(info)
+
+        self.key = key
+        self.entries = entries
+        self.ports = sorted(ports, key=lambda info: info.device)
+        return self.ports
+
+
+_cache = PortCache()
+
+
+def list_ports_comports():
+    """Port list made by pyserial, used if sysfs is not available"""
+    from serial.tools.list_ports import comports
+
+    ports = []
+    for port in comports():
+        info = PortInfo(port.device)
+        info.description = port.description
+        for name in ('vid', 'pid', 'serial_number', 'location', 'manufacturer', 'product'):
+            setattr(info, name, getattr(port, name, None))
+        ports.append(info)
+    return sorted(ports, key=lambda info: info.device)
+
+
+def comports():
+    """Return list of PortInfo of available serial ports sorted by device"""
+    if os.path.isdir(SYSFS_TTY):
+        return list(_cache.comports())
+    return list_ports_comports()
+
+
+def find_port(name):
+    """Find port by USB serial number, USB location or device name. Return
+    PortInfo or None.
+    """
+    ports = comports()
+    for attr in ('serial_number', 'location', 'name'):
+        for info in ports:
+            if getattr(info, attr) == name:
+                return info
+    return None
+
+
+def resolve_port(devicename):
+    """Return device of the port. Existing device file is returned without
+    port enumeration, otherwise the name is looked up as USB serial number
+    or location.
+    """
+    if os.path.exists(devicename):
+        return devicename
+    info = find_port(devicename)
+    if info is None:
+        return devicename
+    return info.device
+
+
+class LowLatency(object):
+    """Low latency mode of the serial port - ASYNC_LOW_LATENCY flag of the
+    tty driver and latency_timer of FTDI adapters. Original settings are
+    restored by restore().
+    """
+    def __init__(self, serial_port):
+        self.serial = serial_port
+        self.old_flags = None
+        self.latency_timer = None       # Path of latency_timer sysfs file
+        self.old_latency_timer = None
+
+    def readSerialStruct(self, fd):
+        import array
+        import fcntl
+
+        buf = array.array('i', [0] * SERIAL_STRUCT_INTS)
+        fcntl.ioctl(fd, TIOCGSERIAL, buf)
+        return buf
+
+    def setFlags(self, flags):
+        import fcntl
+
+        fd = self.serial.fileno()
+        buf = self.readSerialStruct(fd)
+        buf[SERIAL_STRUCT_FLAGS] = flags
+        fcntl.ioctl(fd, TIOCSSERIAL, buf)
+
+    def latencyTimerPath(self):
+        port = getattr(self.serial, 'port', None)
+        if not port:
+            return None
+        name = os.path.basename(os.path.realpath(port))
+        return os.path.join(SYSFS_TTY, name, 'device', 'latency_timer')
+
+    def enable(self):
+        """Set low latency mode. Return list of messages about settings
+        which could not be changed.
+        """
+        messages = []
+        try:
+            fd = self.serial.fileno()
+            flags = self.readSerialStruct(fd)[SERIAL_STRUCT_FLAGS]
+            self.setFlags(flags | ASYNC_LOW_LATENCY)
+            self.old_flags = flags
+        except (AttributeError, ImportError, IOError, OSError, ValueError) as e:
+            messages.append(_("Cannot set ASYNC_LOW_LATENCY: %s") % (e,))
+
+        path = self.latencyTimerPath()
+        old_value = path and read_attr(os.path.dirname(path), 'latency_timer')
+        if old_value:
+            try:
+                with open(path, 'w') as file:
+                    file.write(str(LOW_LATENCY_TIMER))
+                self.latency_timer = path
+                self.old_latency_timer = old_value
+            except (IOError, OSError) as e:
+                messages.append(_("Cannot set latency_timer: %s") % (e,))
+
+        return messages
+
+    def restore(self):
+        if self.old_flags is not None:
+            try:
+                self.setFlags(self.old_flags)
+            except (IOError, OSError, ValueError):
+                pass
+            self.old_flags = None
+
+        if self.latency_timer is not None:
+            try:
+                with open(self.latency_timer, 'w') as file:
+                    file.write(self.old_latency_timer)
+            except (IOError, OSError):
+                pass
+            self.latency_timer = None
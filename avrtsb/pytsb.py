@@ -1,24 +1,22 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
+# Modules which are necessary only for some sub-commands (serial, intelhex,
+# firmware database, tsbloader) are imported at the place of use. The script
+# is often run from IDE hooks and the startup time matters.
 import sys, os
 import argparse
-import firmware
-import textwrap
+import math
 import re
-import locale
-import serial
-from intelhex import IntelHex, diff_dumps
-from tsbloader import *
+import hexfile
 from tsb_locale import *
 
-try:
-    from serial.tools.list_ports import comports
-except ImportError:
-    comports = None
+WATCH_INTERVAL = 0.2    # Polling of the files watched by --watch, seconds
 
-sys.modules.setdefault('avrtsb.firmware', firmware)
-stderr = sys.stderr 
+def import_firmware():
+    import firmware
+    sys.modules.setdefault('avrtsb.firmware', firmware)
+    return firmware
 
 class AppException(Exception):
     def __init__(self, message):
@@ -26,75 +24,167 @@ class AppException(Exception):
         # Call the base class constructor with the parameters it needs
         super(AppException, self).__init__(message)
 
+class BackgroundTask(object):
+    """Run function in the background thread. Exception raised by the
+    function is raised again by wait().
+    """
+    def __init__(self, function, *args):
+        import threading
+        self.function = function
+        self.args = args
+        self.result = None
+        self.exc_info = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+    @property
+    def finished(self):
+        return not self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise AppException(_("Timeout of the background task."))
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+class ThreadOutput(object):
+    """Output stream which keeps the output of capturing threads in separate
+    buffers. Output of the other threads is written to the stream.
+    """
+    def __init__(self, stream, buffers=None):
+        self.stream = stream
+        self.buffers = {} if buffers is None else buffers
+
+    def capture(self, sink=None):
+        """Capture output of the current thread into the list or into the
+        sink object with append() method.
+        """
+        import thread
+        self.buffers[thread.get_ident()] = [] if sink is None else sink
+
+    def release(self):
+        """Stop capturing of the current thread, return the captured output"""
+        import thread
+        buf = self.buffers.pop(thread.get_ident(), [])
+        if isinstance(buf, list):
+            return ''.join(buf)
+        return ''
+
+    def write(self, data):
+        import thread
+        buf = self.buffers.get(thread.get_ident())
+        if buf is None:
+            self.stream.write(data)
+        else:
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            buf.append(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
 class DataFileContainer():
     def __init__(self):
-        self.ihex_data = IntelHex()
+        self.format = None      # Format of the loaded file
+        self.setImage(hexfile.MemoryImage())
 
-    def get_first_line(self, filename):
-        """Return first non empty line from the file
-        """
-        with open(filename, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    return line
+    def setImage(self, image):
+        self.image = image
+        self.binstr = {}    # Data converted by toBinStr
+        self.spm = None
 
-    def is_intelhex(self, filename):
-        first_line = self.get_first_line(filename)
-        if first_line and re.match(":[0-9A-F]+", first_line):
-            return True
+    def is_intelhex(self, data):
+        return hexfile.is_intelhex(data)
 
-        return False
+    def get_fileformat(self, filename, data):
+        if data[:4] == '\x7fELF':
+            return 'elf'
 
-    def get_fileformat(self, filename):
+        filename, compression = hexfile.split_compression(filename)
         basename, ext = os.path.splitext(filename)
         if ext.upper() == '.HEX':
-            if self.is_intelhex(filename):
+            if self.is_intelhex(data):
                 return 'ihex'
             else:
                 raise AppException( _("Not supported HEX file format"))
         else:
-            if self.is_intelhex(filename):
+            if self.is_intelhex(data):
                 return 'ihex'
         
         return 'raw'
 
     def fromIntelHexObject(self, ihex):
-        self.ihex_data = IntelHex(ihex)
+        self.setImage(hexfile.MemoryImage())
+        for start, end in ihex.segments():
+            self.image.puts(start, ihex.tobinstr(start, end-1))
 
-    def fromIntelHex(self, filename):
-        self.ihex_data = IntelHex()
-        self.ihex_data.fromfile(filename, 'hex')
+    def fromIntelHex(self, data):
+        self.setImage(hexfile.read_ihex(data))
 
-    def fromBinary(self, filename):
-        self.ihex_data = IntelHex()
-        self.ihex_data.fromfile(filename, 'bin')
+    def fromBinary(self, data):
+        self.setImage(hexfile.read_raw(data))
 
-    def fromFile(self, filename, format='auto'):
-        if not os.path.exists(filename):
+    def fromElf(self, data, memory='flash'):
+        import elffile
+        self.setImage(elffile.read_elf(data, memory))
+
+    def fromFile(self, filename, format='auto', memory='flash'):
+        """Read the file, ELF file contains both 'flash' and 'eeprom' memory"""
+        if (filename != hexfile.STDIO_FILENAME) and not os.path.exists(filename):
             raise AppException(_('Input file "{}" not found.').format(filename))
+
+        # File is read only once, the format is detected from the content
+        try:
+            with hexfile.open_input(filename) as file:
+                data = file.read()
+        except (IOError, EOFError) as e:
+            raise AppException(_('Input file "{}" read error: {}').format(filename, e))
        
         if format == 'auto':
-            format = self.get_fileformat(filename)
+            format = self.get_fileformat(filename, data)
 
         if format == "ihex":
-            self.fromIntelHex(filename)
+            self.fromIntelHex(data)
         elif format == "raw":
-            self.fromBinary(filename)
+            self.fromBinary(data)
+        elif format == "elf":
+            self.fromElf(data, memory)
         else:
             raise AppException(
                 _('"{}" Unsupported input file format').format(format))
+        self.format = format
 
     def getIntelHex(self):
-        return self.ihex_data
+        """Return copy of the data as intelhex.IntelHex object"""
+        from intelhex import IntelHex
+        ihex = IntelHex()
+        for start, data in self.image.segments:
+            ihex.puts(start, bytes(data))
+        return ihex
 
     def toIntelHex(self, filename):
-        self.ihex_data.tofile(filename, 'hex')
+        with hexfile.open_output(filename, 'w') as file:
+            hexfile.write_ihex(self.image, file)
 
     def toBinary(self, filename):
-        self.ihex_data.tofile(filename, 'bin')
+        with hexfile.open_output(filename, 'wb') as file:
+            hexfile.write_raw(self.image, file)
 
     def checkOutputFileExists(self, filename, overwrite):
+        if filename == hexfile.STDIO_FILENAME:
+            return
         if os.path.exists(filename) and (not overwrite):
             raise AppException(
                 _('Error: output file "{}" already exist. '
@@ -102,41 +192,70 @@ class DataFileContainer():
                  ).format(filename))
 
 
-    def toFile(self, filename, format='auto', overwrite=False):
-        self.checkOutputFileExists(filename, overwrite)
-
+    def outputFormat(self, filename, format='auto'):
+        """Return format of the output file, 'ihex' or 'raw'"""
         if format == 'auto':
-            basename, ext = os.path.splitext(filename)
+            basename, ext = os.path.splitext(hexfile.split_compression(filename)[0])
             format = 'raw'
             if ext.upper() == '.HEX':
                 format = 'ihex'
 
+        if format not in ('ihex', 'raw'):
+            raise AppException(
+                _('"{}" Unsupported output file format').format(format))
+        return format
+
+    def toFile(self, filename, format='auto', overwrite=False):
+        self.checkOutputFileExists(filename, overwrite)
+
+        format = self.outputFormat(filename, format)
         if format == 'ihex':
             self.toIntelHex(filename)
-        elif format == 'raw':
-            self.toBinary(filename)
         else:
-            raise AppException(
-                _('"{}" Unsupported output file format').format(format))
+            self.toBinary(filename)
     
 
     def toBinStr(self, start=None, end=None):
-        return self.ihex_data.tobinstr(start, end)
+        if (start, end) not in self.binstr:
+            self.binstr[start, end] = self.image.tobinstr(start, end)
+        return self.binstr[start, end]
 
     def fromBinStr(self, data, addr = 0):
-        self.ihex_data.puts(addr, data)
+        self.image.puts(addr, data)
+        self.setImage(self.image)
+
+    def hasSPM(self):
+        """Check data for SPM instruction, result is kept for next use"""
+        if self.spm is None:
+            from tsbloader import TSBLoader
+            self.spm = TSBLoader.check4SPM(self.toBinStr())
+        return self.spm
 
 class ConsoleApp():
-    def __init__(self):
+    def __init__(self, argv=None, stderr=None):
+        if argv is None:
+            argv = sys.argv[1:]
+        self.argv = argv
+        self.stderr = stderr or sys.stderr  # Output of error messages
         self.argParserInit()
         self.tsb = None
+        self.images = {}
+        self.progress_bar = True
+        self.stdout = sys.stdout    # Output of JSON documents
+
+    def getSubcommand(self):
+        """Return name of the sub-command given on the command line"""
+        for arg in self.argv:
+            if not arg.startswith('-'):
+                return arg
+        return None
     
     def argParserInit(self):
         self.parser = argparse.ArgumentParser(
            formatter_class=argparse.RawDescriptionHelpFormatter,
-           description =_("Console Tool for TinySafeBoot, the tiny and safe AVR bootloader.\n" +
+           description =_l("Console Tool for TinySafeBoot, the tiny and safe AVR bootloader.\n" +
                           "----------------------------------------------------------------"),
-           epilog = _(
+           epilog = _l(
                       "For more information use:\n" +
                       "  %(prog)s tsb --help\n" +
                       "  %(prog)s fw --help\n\n" +
@@ -157,27 +276,91 @@ class ConsoleApp():
         
         subparsers = self.parser.add_subparsers(dest='subparser_name',
                     help='sub-command help')
-        self.parser_tsb = subparsers.add_parser('tsb', help=_('Connect to bootloader') )
-        self.argParserTSBInit(self.parser_tsb)
-
+        self.parser_tsb = subparsers.add_parser('tsb', help=_l('Connect to bootloader') )
         self.parser_fw = subparsers.add_parser('fw', 
-            help=_('Make custom TSB firmware') )
-        self.argParserFirmwareInit(self.parser_fw)
+            help=_l('Make custom TSB firmware') )
+        self.parser_scan = subparsers.add_parser('scan',
+            help=_l('Find TSB bootloaders on all serial ports') )
+        self.parser_bench = subparsers.add_parser('bench',
+            help=_l('Measure the speed of the link to the bootloader') )
+        self.parser_job = subparsers.add_parser('job',
+            help=_l('Run operations from the job file') )
+        self.parser_watch = subparsers.add_parser('watch',
+            help=_l('Run the job file on every newly connected serial port') )
+        self.parser_agent = subparsers.add_parser('agent',
+            help=_l('Run jobs sent by pytsb job --agent on the local serial ports') )
+
+        # Arguments are defined only for the selected sub-command, options
+        # of the other sub-commands are never used
+        subcommand = self.getSubcommand()
+        if subcommand == 'tsb':
+            self.argParserTSBInit(self.parser_tsb)
+        elif subcommand == 'fw':
+            self.argParserFirmwareInit(self.parser_fw)
+        elif subcommand == 'scan':
+            self.argParserScanInit(self.parser_scan)
+        elif subcommand == 'bench':
+            self.argParserBenchInit(self.parser_bench)
+        elif subcommand == 'job':
+            # Job uses default values of tsb sub-command arguments
+            self.argParserTSBInit(self.parser_tsb)
+            self.argParserJobInit(self.parser_job)
+        elif subcommand == 'watch':
+            self.argParserTSBInit(self.parser_tsb)
+            self.argParserWatchInit(self.parser_watch)
+        elif subcommand == 'agent':
+            self.argParserTSBInit(self.parser_tsb)
+            self.argParserAgentInit(self.parser_agent)
 
 
     def argParserTSBInit(self, parser):
-        con_group = parser.add_argument_group(_("Connection parameters"))
+        con_group = parser.add_argument_group(_l("Connection parameters"))
         con_group.add_argument("devicename", 
-            help=_("Device name of genuine or virtual serial port. Use %(prog)s help for list of available devices"))
+            help=_l("Device name of genuine or virtual serial port, USB serial number or USB location of the port. Use %(prog)s help for list of available devices"))
+        self.argParserConnectionInit(con_group)
+
+        con_group.add_argument("--record", metavar="FILENAME",
+            help=_l("Record the serial communication into the binary file"))
 
+        con_group.add_argument("--replay", metavar="FILENAME",
+            help=_l("Do not open the serial port, play back the communication "
+                   "recorded by --record. Written data must match the record. "
+                   "The device name is ignored."))
+
+        con_group.add_argument("--replay-realtime", action="store_true",
+            help=_l("Replay with the recorded timing. Default: as fast as "
+                   "possible"))
+
+        parser.add_argument("-i", "--info", action="store_true",
+            help=_l("Show bootloader and device info"))
+            
+        self.argParserTSBOperationsInit(parser)
+
+    def argParserConnectionInit(self, con_group):
         con_group.add_argument("-b", "--baudrate", default='9600', type=str,
-            help=_("Set the baudrate of the serial port. Default 9600 bps"))
+            help=_l("Set the baudrate of the serial port. Default 9600 bps"))
+
+        con_group.add_argument("--low-latency", action="store_true",
+            help=_l("Switch the serial port to low latency mode (Linux). "
+                   "USB serial adapters send received data without waiting "
+                   "for the latency timer. Original setting is restored "
+                   "at the end."))
+
+        con_group.add_argument("--slow-activation", action="store_true",
+            help=_l("Send the password only after the bootloader does not "
+                   "answer the autobaud sequence for the read timeout, "
+                   "instead of a few character times. Use if the "
+                   "activation with the password fails."))
+
+        con_group.add_argument("--activation-retries", type=int, default=2,
+            help=_l("Number of repeated activations when invalid info header "
+                   "is received, e.g. at high baudrates. Default 2"))
 
         con_group.add_argument("-p", "--password", default="",
-            help=_("Password for accessing bootloader"))
+            help=_l("Password for accessing bootloader"))
 
         con_group.add_argument("-t", "--timeout", type=int, default=200,
-            help=_("After MCU reset wait specified time before the " 
+            help=_l("After MCU reset wait specified time before the " 
                    "TSB activation sequence is sent. "
                    "Suitable value with the respect to TIMEOUT_FACTOR "
                    "must be chosen. Default value is 200 ms")
@@ -187,32 +370,30 @@ class ConsoleApp():
         
         reset_group.add_argument("--reset-dtr", choices=['0','1'],
             metavar='LEVEL = {0,1}', default="1",
-            help=_("Reset MCU with DTR line active in LEVEL. Default: --reset-dtr 1") )
+            help=_l("Reset MCU with DTR line active in LEVEL. Default: --reset-dtr 1") )
 
         reset_group.add_argument("--reset-rts",  choices=['0','1'],
             metavar='LEVEL = {0,1}',
-            help=_('Reset MCU with RTS line active in LEVEL')) 
+            help=_l('Reset MCU with RTS line active in LEVEL')) 
 
         reset_group.add_argument(
             "--reset-cmd", default="", type=str, nargs="?", const="TSB", 
-            help=_("Send given command for reset MCU, it must be supported by "
+            help=_l("Send given command for reset MCU, it must be supported by "
                    "the application. The option cannot be used together with "
                    "the RTS/DTR reset."
                   )
         )
 
-        parser.add_argument("-i", "--info", action="store_true",
-            help=_("Show bootloader and device info"))
-            
+    def argParserTSBOperationsInit(self, parser):
         #group = parser.add_mutually_exclusive_group()
-        tsb_group = parser.add_argument_group(_("TinySafeBoot settings"))
+        tsb_group = parser.add_argument_group(_l("TinySafeBoot settings"))
         
         tsb_group.add_argument("--new-password", nargs=1, 
-            help=_("Change password for activating TinySafeBoot loader."))
+            help=_l("Change password for activating TinySafeBoot loader."))
         
         tsb_group.add_argument("--change-timeout", nargs="+", type=int,
             metavar=("TIMEOUT_FACTOR", "TIMEOUT_MS F_CPU"),
-             help=_("Change the time how long time the bootloader will wait for activation before the " +
+             help=_l("Change the time how long time the bootloader will wait for activation before the " +
                     "downloaded firmware is started. The waiting time is given by number " +
                     "in range 8..255 (approx 0.1 up to many seconds). The TIMEOUT_FACTOR can be computed " +
                     "from given time in milliseconds and MCU frequency in MHz or Hz. " +
@@ -220,95 +401,277 @@ class ConsoleApp():
         )
 
         tsb_group.add_argument("--emergency-erase", action='store_true', 
-            help=_("Emergency erase after lost password. Reset the contents of the flash ROM " +
+            help=_l("Emergency erase after lost password. Reset the contents of the flash ROM " +
                    "and EEPROM to the value '0xff'. " +
                    "The bootloader is not deleted, only TSB password is reset and TIMEOUT_FACTOR set " +
                    "to maximum value 255. Operation is time demanding from 10 s up to 1 minute. ")
         )
 
-        group = parser.add_argument_group(_('FLASH programming') )
+        group = parser.add_argument_group(_l('FLASH programming') )
         group.add_argument("-fr", "--flash-read", nargs=1, 
             metavar="FILENAME",
-            help=_("Read flash ROM device memory and write to the specified file"))
+            help=_l("Read flash ROM device memory and write to the specified file"))
             
         group.add_argument("-fe", "--flash-erase", action="store_true",
-            help=_("This will reset the content of the flash ROM to the value '0xff'"))
+            help=_l("This will reset the content of the flash ROM to the value '0xff'. "
+                    "By default only the first page is read back and checked, "
+                    "use --verify-erase to check the whole flash ROM."))
+
+        group.add_argument("--no-blank-check", action="store_true",
+            help=_l("Do not read back the first page of the flash ROM after "
+                   "--flash-erase to check that it is blank."))
+
+        group.add_argument("--verify-erase", action="store_true",
+            help=_l("Read back the whole flash ROM after --flash-erase to "
+                   "check that it is blank."))
             
         group.add_argument("-fw", "--flash-write", nargs=1, 
             metavar="FILENAME",
-            help=_("Read the specified file and write it to the flash ROM device memory"))
+            help=_l("Read the specified file and write it to the flash ROM device memory"))
+
+        group.add_argument("--no-trim", action="store_true",
+            help=_l("Write also trailing blank (0xff) pages of the image into "
+                   "the flash ROM. By default they are skipped, the flash ROM "
+                   "is erased before writing."))
 
         group.add_argument(
             "-fff", "--flash-file-format", default="auto", type=str,
             metavar="FORMAT",
-            help=_("Format of the file to read from or write into the flash. "
+            help=_l("Format of the file to read from or write into the flash. "
                    "Default value is auto. For list of available options "
                    "use -fwf help"))
         
         group.add_argument("-fv", "--flash-verify", nargs="?", default=False,  
             metavar="FILENAME",
-            help=_("Read the specified file and compare it with the flash ROM device memory. " +  
+            help=_l("Read the specified file and compare it with the flash ROM device memory. " +  
                    "When it is used with the option --flash-write than the FILENAME can be omitted." ) 
         ) 
 
-        ee_group = parser.add_argument_group(_('EEPROM programming') )
+        ee_group = parser.add_argument_group(_l('EEPROM programming') )
         ee_group.add_argument("-er", "--eeprom-read", nargs=1, 
             metavar="FILENAME",
-            help=_("Read EEPROM device memory and write to the specified file"))
+            help=_l("Read EEPROM device memory and write to the specified file"))
 
         ee_group.add_argument("-ee", "--eeprom-erase", action="store_true",
-            help=_("This will reset the content of the EEPROM to the value '0xff'"))
+            help=_l("This will reset the content of the EEPROM to the value '0xff'"))
 
         ee_group.add_argument("-ew", "--eeprom-write", nargs=1, 
             metavar="FILENAME",
-            help=_("Read the specified file and write it to the EEPROM device memory"))
+            help=_l("Read the specified file and write it to the EEPROM device memory"))
+
+        ee_group.add_argument("--delta", action="store_true",
+            help=_l("Used with --eeprom-write. Current EEPROM content is read "
+                   "first and only pages up to the last changed page are "
+                   "written."))
+
+        ee_group.add_argument("--eeprom-cache", metavar="FILENAME",
+            help=_l("File with the current EEPROM content used by --delta "
+                   "instead of reading the device. The file is created or "
+                   "updated after the write. Requires --unit-id, the cache "
+                   "is used only if the EEPROM pages up to the unit ID read "
+                   "back the same as in the cache."))
+
+        ee_group.add_argument("--unit-id", metavar="START:LENGTH",
+            help=_l("EEPROM bytes with the ID unique for every board (for "
+                   "example serial number). Used by --eeprom-cache to "
+                   "recognize the board."))
 
         group.add_argument(
             "-eff", "--eeprom-file-format", default="auto", type=str,
             metavar="FORMAT",
-            help=_("Format of the file to read from or write into the eeprom "
+            help=_l("Format of the file to read from or write into the eeprom "
                    "memory. Default value is auto. For list of available "
                    "options use -ewf help"))
 
         ee_group.add_argument("-ev", "--eeprom-verify", nargs="?", default=False,  
             metavar="FILENAME",
-            help=_("Read the specified file and compare it with EEPROM device memory. " +
+            help=_l("Read the specified file and compare it with EEPROM device memory. " +
                    "When is used with --eeprom-write option, the FILENAME can be omitted.")
         ) 
             
         parser.add_argument("-f", "--force", action="store_true",
-            help=_("Force to perform some danger operation: overwrite existing file or write " +
+            help=_l("Force to perform some danger operation: overwrite existing file or write " +
                    "write new bootloader to the device flash ROM.")
         )
+
+        parser.add_argument("--retries", type=int, default=0, metavar="N",
+            help=_l("After a read error of --flash-read or --eeprom-read "
+                   "reset the MCU, activate the bootloader again and "
+                   "continue from the failed page, up to N times. "
+                   "Default 0. Requires reset by DTR or RTS line.")
+        )
+
+        parser.add_argument("--fail-fast", nargs="?", type=int, default=0,
+            const=1, metavar="N",
+            help=_l("Stop the verification after N mismatching pages, "
+                   "default 1. Pages are compared as they are received, "
+                   "only the range covered by the file is read.")
+        )
+
+        parser.add_argument("--verify-report", choices=['text', 'json'],
+            default='text',
+            help=_l("Format of the verification report. The text report "
+                   "includes hex dump of mismatching address ranges, the json "
+                   "report is one line with list of mismatching ranges. "
+                   "Default: text")
+        )
+
+        parser.add_argument("--watch", action="store_true",
+            help=_l("Keep the serial port open and watch the files given by "
+                   "--flash-write and --eeprom-write. Changed files are "
+                   "written again and only the written range is verified. "
+                   "Stop with Ctrl+C.")
+        )
+
+        parser.add_argument("--watch-settle", type=float, default=0.3,
+            metavar="SECONDS",
+            help=_l("Time without further file change before the write "
+                   "starts. Default 0.3 s")
+        )
         
     def argParserFirmwareInit(self, parser):
         parser.add_argument("-d", "--device", type=str,
-            help=_("Type of ATtiny/ATmega device for which the firmware will be made. " +
+            help=_l("Type of ATtiny/ATmega device for which the firmware will be made. " +
                    "For the list of all supported devices use --device help" )
             )
         
         parser.add_argument("-p", "--rxtx", type=str,
-            help=_("Port definition for serial communication. For example d0d1 means D0=RxD and D1=TxD."))
+            help=_l("Port definition for serial communication. For example d0d1 means D0=RxD and D1=TxD."))
  
         parser.add_argument("-o", "--output", metavar="FILENAME",
-            help=_("Name of output file with generated firmware. File will be Hex (.hex) or Binary (other extension)"))
+            help=_l("Name of output file with generated firmware. File will be Hex (.hex) or Binary (other extension)"))
 
         parser.add_argument(
             "-fff", "--flash-file-format", default="auto", type=str,
             metavar="FORMAT",
-            help=_("Output file format of the generated firmware. Default: auto"))
+            help=_l("Output file format of the generated firmware. Default: auto"))
 
         parser.add_argument("-f", "--force", action="store_true",
-            help=_("Overwrite existing file"))
+            help=_l("Overwrite existing file"))
+
+    def argParserScanInit(self, parser):
+        con_group = parser.add_argument_group(_l("Connection parameters"))
+        con_group.add_argument("ports", nargs="*", metavar="DEVICENAME",
+            help=_l("Serial ports to probe. Default: all available ports"))
+        self.argParserConnectionInit(con_group)
+
+        parser.add_argument("--port-timeout", type=float, default=3.0,
+            metavar="SECONDS",
+            help=_l("Maximum time for probing of one port. All ports are "
+                   "probed in parallel. Default 3 s"))
+
+        parser.add_argument("--json", action="store_true",
+            help=_l("Print result in JSON format"))
+
+    def argParserBenchInit(self, parser):
+        con_group = parser.add_argument_group(_l("Connection parameters"))
+        con_group.add_argument("devicename",
+            help=_l("Device name of genuine or virtual serial port, USB serial number or USB location of the port"))
+        self.argParserConnectionInit(con_group)
+
+        parser.add_argument("--count", type=int, default=10,
+            help=_l("Number of measurement rounds. Default 10"))
+
+        parser.add_argument("--pages", type=int, default=16,
+            help=_l("Number of flash pages read in every round. Default 16"))
+
+        parser.add_argument("--json", action="store_true",
+            help=_l("Print result in JSON format"))
+
+    def argParserJobInit(self, parser):
+        parser.add_argument("jobfile", metavar="JOBFILE",
+            help=_l("JSON (or TOML) file with the list of operations. All "
+                   "operations are done in one bootloader session."))
+
+        parser.add_argument("--port", action="append", metavar="DEVICENAME",
+            help=_l("Serial port of the device, can be used more times. "
+                   "Overrides ports given in the job file."))
+
+        parser.add_argument("--dry-run", action="store_true",
+            help=_l("Only print the planned operations"))
+
+        parser.add_argument("--agent", metavar="HOST:PORT",
+            help=_l("Send the whole job to the pytsb agent running on the "
+                   "host with the serial ports. Ports are device names on "
+                   "the agent host."))
+
+    def argParserAgentInit(self, parser):
+        parser.add_argument("--listen", metavar="HOST:PORT", default="127.0.0.1:4711",
+            help=_l("Address of the agent. There is no authentication, use "
+                   "other address than localhost only in trusted network. "
+                   "Default 127.0.0.1:4711"))
+
+    def argParserWatchInit(self, parser):
+        parser.add_argument("jobfile", metavar="JOBFILE",
+            help=_l("JSON (or TOML) file with the list of operations done on "
+                   "every new port. Ports of the job file are ignored."))
+
+        parser.add_argument("--log", metavar="FILENAME", default="pytsb_watch.log",
+            help=_l("Append output of every board to the log file. "
+                   "Default pytsb_watch.log"))
+
+        parser.add_argument("--match", metavar="PATTERN", default=None,
+            help=_l("Watch only ports with the device name matching the "
+                   "pattern (e.g. /dev/ttyUSB*). Default: all USB ports"))
+
+        parser.add_argument("--interval", type=float, default=0.5,
+            help=_l("Port polling interval in seconds. Default 0.5 s"))
+
+        parser.add_argument("--settle", type=float, default=1.0,
+            help=_l("Delay in seconds between the port connection and the "
+                   "job start. Default 1 s"))
+
+        parser.add_argument("--count", type=int, default=0,
+            help=_l("Stop after the given number of boards. Default: run "
+                   "until Ctrl+C"))
+
+    def outputFiles(self):
+        """Return names of the files written by the sub-command"""
+        args = self.args
+        files = [getattr(args, 'output', None)]
+        for name in ('flash_read', 'eeprom_read'):
+            files.extend(getattr(args, name, None) or [])
+        return [filename for filename in files if filename]
+
+    def jsonOutput(self):
+        """Return True if the sub-command prints JSON document"""
+        return (getattr(self.args, 'verify_report', None) == 'json') or \
+               getattr(self.args, 'json', False)
 
     def run(self):
-        args = self.parser.parse_args()
+        args = self.parser.parse_args(self.argv)
         self.args = args
+
+        # Data and JSON documents written to the standard output are not
+        # mixed with messages and progress bars
+        self.stdout = sys.stdout
+        if (hexfile.STDIO_FILENAME in self.outputFiles()) or self.jsonOutput():
+            sys.stdout = sys.stderr
         if args.subparser_name == 'tsb':
             self.run_tsb(self.parser_tsb)
 
         if args.subparser_name == 'fw':
             self.run_fw(self.parser_fw)
+
+        if args.subparser_name == 'job':
+            import jobrunner
+            jobrunner.JobRunner(self).run(self.parser_job)
+
+        if args.subparser_name == 'scan':
+            import scanrunner
+            scanrunner.ScanRunner(self).run(self.parser_scan)
+
+        if args.subparser_name == 'watch':
+            import watchrunner
+            watchrunner.WatchRunner(self).run(self.parser_watch)
+
+        if args.subparser_name == 'bench':
+            import benchrunner
+            benchrunner.BenchRunner(self).run(self.parser_bench)
+
+        if args.subparser_name == 'agent':
+            import agentrunner
+            agentrunner.AgentRunner(self).run(self.parser_agent)
             
     def run_tsb(self, parser):
         args = self.args
@@ -327,7 +690,7 @@ class ConsoleApp():
 
             
         if not args.baudrate.isdigit():
-            stderr.write(_("%s: error: argument -b/--buadrate: invalid int value: '%s'") % (sys.argv[0], args.baudrate,))
+            self.stderr.write(_("%s: error: argument -b/--buadrate: invalid int value: '%s'") % (sys.argv[0], args.baudrate,))
             return
         
         args.baudrate = int(args.baudrate)
@@ -335,8 +698,8 @@ class ConsoleApp():
         # If there is --flash-verify without filename specified arg.flash_verify==None
         # If there is no option --flash-verify arg.flash_verify==False
         if (args.flash_verify == None) and (args.flash_write == None):
-            stderr.write(_("%s: error: argument -fv/--flash-verify: expected 1 argument(s)\n") % (sys.argv[0],))
-            stderr.write(_("Argument can be omitted only when is used with option --flash-write\n"))
+            self.stderr.write(_("%s: error: argument -fv/--flash-verify: expected 1 argument(s)\n") % (sys.argv[0],))
+            self.stderr.write(_("Argument can be omitted only when is used with option --flash-write\n"))
             return 
         
         #--flash-write FILENAME.HEX --flash-verify
@@ -347,8 +710,8 @@ class ConsoleApp():
         # If there is --eeprom-verify without filename specified arg.eeprom_verify==None
         # If there is no option --eeprom-verify arg.eeprom_verify==False
         if (args.eeprom_verify == None) and (args.eeprom_write == None):
-            stderr.write(_("%s: error: argument -fv/--eeprom-verify: expected 1 argument(s)") % (sys.argv[0],))
-            stderr.write(_("Argument can be omitted only when is used with option --eeprom-write"))
+            self.stderr.write(_("%s: error: argument -fv/--eeprom-verify: expected 1 argument(s)") % (sys.argv[0],))
+            self.stderr.write(_("Argument can be omitted only when is used with option --eeprom-write"))
             return 
 
         #--eeprom-write FILENAME.HEX --eeprom-verify
@@ -360,17 +723,33 @@ class ConsoleApp():
             if len(args.change_timeout) == 2:
                 time_ms, f_cpu = args.change_timeout
                 if (time_ms < 100) or (time_ms > 10000):
-                    stderr.write( _("{}: error: --change-timeout: time delay shall be in the range 100 .. 10000 ms".
+                    self.stderr.write( _("{}: error: --change-timeout: time delay shall be in the range 100 .. 10000 ms".
                                    format(sys.argv[0]) ))
                     return
                 if (f_cpu < 1) or ( (f_cpu > 25) and (f_cpu < 10000) ) or (f_cpu > 25e6):
-                    stderr.write(_("{}: error: --change-timeout: MCU frequency must be value in range 1 .. 25 MHz or "
+                    self.stderr.write(_("{}: error: --change-timeout: MCU frequency must be value in range 1 .. 25 MHz or "
                                    "10000 .. 25000000 Hz".format(sys.argv[0])))
                     return
             elif len(args.change_timeout) > 2:
-                stderr.write(_("%s: error: argument --change-timeout: expected 1 or 2 argument(s)") % (sys.argv[0],))
+                self.stderr.write(_("%s: error: argument --change-timeout: expected 1 or 2 argument(s)") % (sys.argv[0],))
                 return
         
+        if args.watch and not (args.flash_write or args.eeprom_write):
+            self.stderr.write(_("%s: error: argument --watch: can be used only with --flash-write or --eeprom-write\n") % (sys.argv[0],))
+            return
+
+        stdin_memories = set(memory for memory, filename in (
+                ('flash', args.flash_write and args.flash_write[0]), ('flash', args.flash_verify),
+                ('eeprom', args.eeprom_write and args.eeprom_write[0]), ('eeprom', args.eeprom_verify))
+            if filename == hexfile.STDIO_FILENAME)
+        if len(stdin_memories) > 1:
+            self.stderr.write(_("%s: error: standard input can be used only for one memory\n") % (sys.argv[0],))
+            return
+
+        if args.watch and stdin_memories:
+            self.stderr.write(_("%s: error: argument --watch: cannot be used with standard input\n") % (sys.argv[0],))
+            return
+
         #print args
         if not args:
             return
@@ -378,7 +757,7 @@ class ConsoleApp():
         if args.emergency_erase:
             self.emergencyErase()
         
-        self.activateTSB()
+        self.activateTSB(self.inputImages())
         if args.info:
             self.showDeviceInfo()
 
@@ -412,13 +791,110 @@ class ConsoleApp():
         if args.eeprom_verify:
             self.eepromVerify()
 
+        if args.watch:
+            self.watchFiles()
+
+    def watchedFiles(self):
+        """Return list of (filename, format) of the files written by --watch"""
+        files = []
+        if self.args.flash_write:
+            files.append((self.args.flash_write[0], self.args.flash_file_format))
+        if self.args.eeprom_write:
+            files.append((self.args.eeprom_write[0], self.args.eeprom_file_format))
+        return files
+
+    def fileStamp(self, filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def waitFileChange(self, stamps):
+        """Wait until some of the files is changed and the change is settled.
+        Return list of the changed file names.
+        """
+        import time
+
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            changed = [filename for filename in stamps
+                       if self.fileStamp(filename) != stamps[filename]]
+            if not changed:
+                continue
+
+            # File is written by the compiler, wait for the last change
+            while True:
+                current = dict((filename, self.fileStamp(filename)) for filename in changed)
+                time.sleep(self.args.watch_settle)
+                if all(self.fileStamp(filename) == current[filename] for filename in changed):
+                    break
+
+            if all(current[filename] is not None for filename in changed):
+                stamps.update(current)
+                return changed
+
+    def reflash(self, changed):
+        """Write the changed files with the opened serial port"""
+        import time
+
+        start = time.time()
+        images = self.inputImages()
+        for key in list(self.images):
+            if key[0] in changed:
+                del self.images[key]
+
+        # Malformed file is reported before the MCU reset
+        self.parseImages(images)
+        preparing = BackgroundTask(self.prepareImages, images)
+        self.tsb.activateTSB()
+        preparing.wait()
+        try:
+            args = self.args
+            if args.flash_write and (args.flash_write[0] in changed):
+                self.flashWrite()
+                if args.flash_verify:
+                    self.flashVerify(written_only=not args.no_trim)
+            if args.eeprom_write and (args.eeprom_write[0] in changed):
+                self.eepromWrite()
+                if args.eeprom_verify:
+                    self.eepromVerify()
+        finally:
+            self.tsb.quit()
+        print(_("Written in %.1f s") % (time.time() - start,))
+
+    def watchFiles(self):
+        """Write the files again whenever they are changed. TSB is activated
+        for every write, the serial port and parsed images are reused.
+        """
+        from hexfile import DataFileError
+        from tsbloader import TSBException
+
+        stamps = dict((filename, self.fileStamp(filename))
+                      for filename, file_format in self.watchedFiles())
+        self.tsb.quit()
+
+        print('')
+        print(_("Watching %s, press Ctrl+C to stop.") % (", ".join(sorted(stamps)),))
+        try:
+            while True:
+                changed = self.waitFileChange(stamps)
+                print('')
+                print(_("Changed: %s") % (", ".join(changed),))
+                try:
+                    self.reflash(changed)
+                except (AppException, DataFileError, TSBException) as e:
+                    self.stderr.write(u"%s\n" % (e,))
+        except KeyboardInterrupt:
+            print('')
+
     def run_fw(self, parser):
         args = self.args
         
         try:
-            self.fw_db = firmware.FirmwareDB()
+            self.fw_db = import_firmware().FirmwareDB()
         except Exception as e:
-            stderr.write( _("Cannot access firmware database.\n"))
+            self.stderr.write( _("Cannot access firmware database.\n"))
             print(e.message)
             return
     
@@ -432,17 +908,17 @@ class ConsoleApp():
 
         if not args.device:
             parser.print_usage()
-            stderr.write(_("pytsb fw: error: argument -d/--device expected., Use --device help for " +
+            self.stderr.write(_("pytsb fw: error: argument -d/--device expected., Use --device help for " +
                      "list of all supported devices.\n"))
             return
         
         if not args.rxtx:
             parser.print_usage()
-            stderr.write(_("pytsb fw: error: argument -p/--rxtx expected.\n"))
+            self.stderr.write(_("pytsb fw: error: argument -p/--rxtx expected.\n"))
             return
         
         if not re.match("[a-z][0-7][a-z][0-7]", args.rxtx, re.I):
-            stderr.write(( _("pytsb fw: error: argument -p/--rxtx must be in the form d0d1, where "+
+            self.stderr.write(( _("pytsb fw: error: argument -p/--rxtx must be in the form d0d1, where "+
                      "D0 = RxD, and D1=TxD.\n")))
             return
         
@@ -452,32 +928,122 @@ class ConsoleApp():
         self.makeFirmware()
 
 
-    def initTSB(self):
+    def jobArgs(self, tsb_job, port):
+        """Return arguments of tsb sub-command for the job and port"""
+        args = self.parser_tsb.parse_args([port])
+        for name, value in tsb_job.options.items():
+            if not hasattr(args, name):
+                raise AppException(_('Unknown job option "{}".').format(name))
+            setattr(args, name, value)
+        args.baudrate = int(args.baudrate)
+        return args
+
+    def checkJob(self, tsb_job, steps, ports=None):
+        """Check options of all steps before any device is touched. Ports
+        None means ports are not known yet (watch).
+        """
+        import job
+
         try:
-            serial_port = Serial(self.args.devicename, self.args.baudrate)
-        except Exception as e:        
-            if self.args.baudrate not in serial.Serial.BAUDRATES:
-                print(_("Try to use standard baudrate from the following list:"))
-                self.showBaudrates()
-            raise AppException(e.strerror)
-            
-            
-            
-        self.tsb = TSBLoader( serial_port )
-        self.tsb.timeout_reset = self.args.timeout
-        self.tsb.password = self.args.password
-        self.tsb.reset_cmd = self.args.reset_cmd
+            tsb_job.checkOutputs(steps, ports)
+            for step in steps:
+                step.apply(self.jobArgs(tsb_job, ports[0] if ports else "watch"))
+        except job.JobError as e:
+            raise AppException(u"%s" % (e,))
+
+    def runJobSteps(self, tsb_job, steps, port, unit=None):
+        """Activate bootloader on the port and do all steps of the job"""
+        import copy
+
+        base_args = self.jobArgs(tsb_job, port)
+        try:
+            self.args = base_args
+            self.activateTSB()
+            for step in steps:
+                self.args = copy.copy(base_args)
+                step.forUnit(port, unit).apply(self.args)
+                getattr(self, step.method)()
+        finally:
+            self.close()
+
+    def loadImage(self, filename, format='auto', memory='flash'):
+        """Return DataFileContainer with the file content. Every file is
+        parsed only once and kept for next use.
+        """
+        key = (filename, format, memory)
+        if key not in self.images:
+            file_container = DataFileContainer()
+            file_container.fromFile(filename, format, memory)
+            self.images[key] = file_container
+        return self.images[key]
+
+    def openTSB(self, devicename):
+        """Open serial port and return TSBLoader set up from the command line
+        arguments.
+        """
+        import serial
+        import ports
+        import transport
+        from tsbloader import TSBLoader
+
+        replay = getattr(self.args, 'replay', None)
+        record = getattr(self.args, 'record', None)
+        if replay:
+            try:
+                serial_port = transport.ReplaySerial(open(replay, 'rb'),
+                                                     self.args.replay_realtime)
+            except (IOError, transport.TransportError) as e:
+                raise AppException(u"%s" % (e,))
+        else:
+            try:
+                serial_port = serial.Serial(ports.resolve_port(devicename), self.args.baudrate)
+            except Exception as e:        
+                if self.args.baudrate not in serial.Serial.BAUDRATES:
+                    print(_("Try to use standard baudrate from the following list:"))
+                    self.showBaudrates()
+                raise AppException(e.strerror)
+
+        if record:
+            serial_port = transport.RecordingSerial(serial_port, open(record, 'wb'))
+
+        tsb = TSBLoader( serial_port )
+        if replay and not self.args.replay_realtime:
+            tsb.delays = False
+        if self.args.low_latency:
+            tsb.setLowLatency()
+        tsb.read_retries = getattr(self.args, 'retries', 0)
+        tsb.fast_activation = not self.args.slow_activation
+        tsb.activation_retries = max(self.args.activation_retries, 0)
+        tsb.timeout_reset = self.args.timeout
+        tsb.password = self.args.password
+        tsb.reset_cmd = self.args.reset_cmd
         
         if self.args.reset_rts <> None:
-            self.tsb.reset_line = TSBLoader.RTS
-            self.tsb.reset_active = int(self.args.reset_rts)
+            tsb.reset_line = TSBLoader.RTS
+            tsb.reset_active = int(self.args.reset_rts)
 
         if self.args.reset_dtr <> None:
-            self.tsb.reset_line = TSBLoader.DTR
-            self.tsb.reset_active = int(self.args.reset_dtr)
+            tsb.reset_line = TSBLoader.DTR
+            tsb.reset_active = int(self.args.reset_dtr)
+
+        return tsb
+
+    def initTSB(self):
+        self.tsb = self.openTSB(self.args.devicename)
         
+    def printRetries(self, progress):
+        if progress.retries:
+            print(_("Recovered from %d read errors") % (progress.retries,))
+
+    def printTransferRate(self, progress):
+        elapsed = progress.elapsed()
+        if (progress.iteration == 0) or (elapsed <= 0):
+            return
+        print(_("Transfer rate %.1f kB/s (%d bytes in %.2f s)") % (
+            progress.iteration / elapsed / 1024, progress.iteration, elapsed))
+
     def printProgressBar(self, progress):
-        if progress.result != None:
+        if (progress.result != None) or (progress.total == 0) or not self.progress_bar:
             return
 
         length = 50
@@ -495,12 +1061,16 @@ class ConsoleApp():
             print('')
 
     def showPortList(self):
-        if comports:
-            print(_('List of available ports:'))
-            for port, desc, hwid in sorted(comports()):
-                print(_('  %-20s %s') % (port, desc.decode(SYS_ENCODING)))
+        import ports
+
+        print(_('List of available ports:'))
+        for info in ports.comports():
+            print(_('  %-20s %-30s %s') % (info.device, info.description.decode(SYS_ENCODING or 'ascii', 'replace'), info.hwid))
 
     def showBaudrates(self):
+        import serial
+        import textwrap
+
         print(_('List of standard baudrates, not all of them must be supported:'))
         baudrates = [str(bps) for bps in serial.Serial.BAUDRATES]
         for line in textwrap.wrap(", ".join(baudrates)):
@@ -511,11 +1081,55 @@ class ConsoleApp():
         print(_("  {:10s} auto detected, only for input files").format("auto"))
         print(_("  {:10s} Intel Hex").format("ihex"))
         print(_("  {:10s} raw binary").format("raw"))
+        print(_("  {:10s} AVR ELF, flash from the loadable segments, EEPROM from "
+                "the .eeprom section, only for input files").format("elf"))
+
+    def inputImages(self):
+        """Return list of (filename, format, memory) of all input files"""
+        args = self.args
+        images = []
+        if args.flash_write:
+            images.append((args.flash_write[0], args.flash_file_format, 'flash'))
+        if args.flash_verify:
+            images.append((args.flash_verify, args.flash_file_format, 'flash'))
+        if args.eeprom_write:
+            images.append((args.eeprom_write[0], args.eeprom_file_format, 'eeprom'))
+        if args.eeprom_verify:
+            images.append((args.eeprom_verify, args.eeprom_file_format, 'eeprom'))
+        return images
+
+    def parseImages(self, images):
+        for filename, file_format, memory in images:
+            self.loadImage(filename, file_format, memory)
+
+    def prepareImages(self, images):
+        """Make data for writing and verification, check SPM instruction"""
+        for filename, file_format, memory in images:
+            file_container = self.loadImage(filename, file_format, memory)
+            file_container.toBinStr()
+            file_container.toBinStr(0)
+            file_container.hasSPM()
+
+    def activateTSB(self, images=None):
+        """Connect to TSB. Given images are parsed on the background while
+        the port is opened and powered, errors are raised before the MCU is
+        reset. Data conversion and SPM check continue during MCU reset and
+        TSB activation.
+        """
+        parsing = preparing = None
+        if images:
+            parsing = BackgroundTask(self.parseImages, images)
 
-    def activateTSB(self):
         self.initTSB()
         self.tsb.setPower()     # Has sence only for self powered convertors
+
+        if parsing:
+            parsing.wait()
+            preparing = BackgroundTask(self.prepareImages, images)
+
         self.tsb.activateTSB()
+        if preparing:
+            preparing.wait()
     
     def showDeviceInfo(self):
         print('')
@@ -523,70 +1137,110 @@ class ConsoleApp():
         print('')
         
 
-    def flashReadData(self):
+    def readToFile(self, read, filename, file_format):
+        """Call read(sink) and write the data passed to sink into the file as
+        they are received. Empty data at the end are not written. Partially
+        written file is removed after error.
+        """
+        file_container = DataFileContainer()
+        file_container.checkOutputFileExists(filename, self.args.force)
+        file_format = file_container.outputFormat(filename, file_format)
+
+        try:
+            with hexfile.open_output(filename, 'w' if file_format == 'ihex' else 'wb') as file:
+                writer = hexfile.TrimmedWriter(hexfile.image_writer(file, file_format))
+                read(writer.write)
+                writer.close()
+        except BaseException:
+            if (filename != hexfile.STDIO_FILENAME) and os.path.exists(filename):
+                os.remove(filename)
+            raise
+
+    def flashReadData(self, sink=None):
         print('')
         print(_("Read flash program memory:"))
-        for progress in self.tsb.flashRead():
+        for progress in self.tsb.flashRead(sink):
             self.printProgressBar(progress)
             last_progress = progress
         print('')
+        self.printRetries(last_progress)
+        self.printTransferRate(last_progress)
         print(_("Flash read memory OK"))
 
         return last_progress.result
 
     def flashRead(self):
-        filename = self.args.flash_read[0]
-        overwrite = self.args.force
+        self.readToFile(self.flashReadData, self.args.flash_read[0],
+                        self.args.flash_file_format)
 
-        file_container = DataFileContainer()
-        file_container.checkOutputFileExists(filename, overwrite)
 
-        file_container.fromBinStr( self.flashReadData() )
-        file_container.toFile(
-            filename, self.args.flash_file_format, self.args.force)
+    def showVerifyReport(self, diff, error_message):
+        if self.args.verify_report == 'json':
+            self.stdout.write(diff.tojson() + '\n')
+        elif diff.ok:
+            print(diff.summary())
+        else:
+            self.stderr.write(error_message)
+            print(diff.summary())
+            print(diff.dump())
 
+    def verifyData(self, verify, data, name1, name2, error_message):
+        """Compare device memory with data, pages are compared as they are
+        received. Only mismatching pages found up to the stop are reported.
+        """
+        import imagediff
 
-    def flashVerify(self):
+        for progress in verify(data, self.args.fail_fast):
+            self.printProgressBar(progress)
+            last_progress = progress
+        print('')
+        self.printTransferRate(last_progress)
+
+        device_data = last_progress.result
+        diff = imagediff.compare_data(
+            device_data, data[:len(device_data)].ljust(len(device_data), '\xFF'),
+            name1, name2)
+        diff.stop_addr = last_progress.stop_addr
+        self.showVerifyReport(diff, error_message)
+
+    def flashVerify(self, written_only=False):
+        """Verify flash, written_only skips trailing blank pages which are
+        not written by flashWrite.
+        """
         cmp_filename = self.args.flash_verify
-        file_container = DataFileContainer()
-        file_container.fromFile(cmp_filename, 
-                                self.args.flash_file_format)
-        ihex_cmp = file_container.getIntelHex()
-        
-        flash_data = self.flashReadData()
-        ihex_flash = IntelHex()
-        ihex_flash.puts(0, flash_data)
-        
-        sio = StringIO()
-        diff_dumps(ihex_flash, ihex_cmp, tofile=sio, 
-                   name1=_l("Flash ROM device memory"), 
-                   name2=cmp_filename)
-        diff_report = sio.getvalue(False)
-        sio.close()
-        
-        if diff_report.strip() == "":
-            print(_("Data verification OK"))
-        else:
-            stderr.write(_("Flash ROM device verification error\n"))
-            print(diff_report)
+        file_container = self.loadImage(cmp_filename,
+                                        self.args.flash_file_format)
+
+        data = file_container.toBinStr(0)
+        if written_only:
+            data = self.tsb.trimBlankPages(data)[0]
+
+        print('')
+        print(_("Verify flash program memory:"))
+        self.verifyData(self.tsb.flashVerify, data,
+                        _("Flash ROM device memory"), cmp_filename,
+                        _("Flash ROM device verification error\n"))
         
     def flashErase(self):
         print('')
         print(_("Erase flash program memory:"))
-        for progress in self.tsb.flashErase():
+        blank_check = not self.args.no_blank_check
+        for progress in self.tsb.flashErase(blank_check, self.args.verify_erase):
             self.printProgressBar(progress)
 
         print('')
+        if blank_check and not self.args.verify_erase:
+            print(_("First page is blank, the rest of the flash ROM was not "
+                    "read back (--verify-erase)."))
         print(_("FLASH Erase OK"))
 
     def flashWrite(self):
-        file_container = DataFileContainer()
-        file_container.fromFile(self.args.flash_write[0],
-                                self.args.flash_file_format)
+        file_container = self.loadImage(self.args.flash_write[0],
+                                        self.args.flash_file_format)
         
         data = file_container.toBinStr()
         if (self.tsb.device_info.tinymega==0) and \
-                (self.tsb.check4SPM(data)):
+                (file_container.hasSPM()):
 
             if (not self.args.force):
                 raise AppException(
@@ -601,55 +1255,45 @@ class ConsoleApp():
 
         print('')
         print(_("Write program Flash memory:"))
-        for progress in self.tsb.flashWrite(data):
+        for progress in self.tsb.flashWrite(data, not self.args.no_trim):
             self.printProgressBar(progress)
         
         print('')
+        self.printTransferRate(progress)
+        if progress.skipped_pages:
+            print(_("Skipped %d trailing blank pages") % (progress.skipped_pages,))
+        if progress.total == 0:
+            print(_("Image is blank, FLASH was only erased"))
         print(_("FLASH Write OK"))
 
-    def eepromReadData(self):
+    def eepromReadData(self, sink=None):
         print('')
         print(_("Read EEPROM memory:"))
-        for progress in self.tsb.eepromRead():
+        for progress in self.tsb.eepromRead(sink):
             self.printProgressBar(progress)
             last_progress = progress
 
         print('')
+        self.printRetries(last_progress)
+        self.printTransferRate(last_progress)
         print(_("Read EEPROM OK"))
 
         return last_progress.result
 
     def eepromRead(self):
-        filename = self.args.eeprom_read[0]
-        overwrite = self.args.force
-
-        file_container = DataFileContainer()
-        file_container.checkOutputFileExists(filename, overwrite)
-        file_container.fromBinStr( self.eepromReadData() )
-        file_container.toFile(
-            filename, self.args.eeprom_file_format, self.args.force)
+        self.readToFile(self.eepromReadData, self.args.eeprom_read[0],
+                        self.args.eeprom_file_format)
 
     def eepromVerify(self):
         cmp_filename = self.args.eeprom_verify
-        file_container = DataFileContainer()
-        file_container.fromFile(cmp_filename, 
-                                self.args.eeprom_file_format)
-        ihex_cmp = file_container.getIntelHex()
+        file_container = self.loadImage(cmp_filename,
+                                        self.args.eeprom_file_format, 'eeprom')
 
-        eeprom_data = self.eepromReadData()
-        ihex_eeprom = IntelHex()
-        ihex_eeprom.puts(0, eeprom_data)        
-        
-        sio = StringIO()
-        diff_dumps(ihex_eeprom, ihex_cmp, tofile=sio, name1=_l("EEPROM device memory"), name2=cmp_filename)
-        diff_report = sio.getvalue(False)
-        sio.close()
-        
-        if diff_report.strip() == "":
-            print(_("Data verification OK"))
-        else:
-            stderr.write(_("EEPROM verification error\n"))
-            print(diff_report)
+        print('')
+        print(_("Verify EEPROM memory:"))
+        self.verifyData(self.tsb.eepromVerify, file_container.toBinStr(0),
+                        _("EEPROM device memory"), cmp_filename,
+                        _("EEPROM verification error\n"))
 
             
     def eepromErase(self):        
@@ -663,18 +1307,133 @@ class ConsoleApp():
         
 
     def eepromWrite(self):
-        file_container = DataFileContainer()
-        file_container.fromFile(self.args.eeprom_write[0],
-                                self.args.eeprom_file_format)
+        filename = self.args.eeprom_write[0]
+        file_container = self.loadImage(filename, self.args.eeprom_file_format,
+                                        'eeprom')
 
         data = file_container.toBinStr()
+        if not data:
+            print('')
+            if file_container.format == 'elf':
+                print(_('ELF file "{}" has no .eeprom section, nothing to write '
+                        'to EEPROM.').format(filename))
+            else:
+                print(_('EEPROM image "{}" is empty, nothing to write.').format(filename))
+            return
+
+        if self.args.delta:
+            self.eepromDeltaWrite(data)
+            return
+
         print('')
         print(_("Write EEPROM memory:"))
         for progress in self.tsb.eepromWrite(data):
             self.printProgressBar(progress)
         
         print('')
+        self.printTransferRate(progress)
         print _("EEPROM Write OK")
+
+    def unitIdRange(self):
+        """Return (start, end) of the unit ID in EEPROM given by --unit-id"""
+        try:
+            start, length = [int(value, 0) for value in self.args.unit_id.split(':')]
+        except (AttributeError, ValueError):
+            raise AppException(_("--eeprom-cache requires --unit-id START:LENGTH."))
+
+        if (start < 0) or (length <= 0) or (start + length > self.tsb.device_info.eepromsize):
+            raise AppException(_("Unit ID {} is out of EEPROM.").format(self.args.unit_id))
+        return (start, start + length)
+
+    def loadEepromCache(self, size):
+        """Return EEPROM content of the cache file, None if there is no cache
+        for the board or it does not cover size bytes. The board is
+        recognized by the unit ID, EEPROM pages up to the unit ID are read
+        back and must be the same as in the cache.
+        """
+        import binascii
+        import json
+
+        filename = self.args.eeprom_cache
+        start, end = self.unitIdRange()
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, 'r') as file:
+                cache = json.load(file)
+            current = binascii.unhexlify(cache['eeprom'])
+            valid = ((cache['signature'] == self.deviceSignature()) and
+                     (cache['unit_id'] == [start, end - start]) and
+                     (len(current) >= max(size, end)) and
+                     (current[start:end].strip('\xFF') <> ''))
+        except (IOError, ValueError, KeyError, TypeError, binascii.Error):
+            valid = False
+
+        if valid:
+            pagesize = self.tsb.device_info.pagesize
+            print('')
+            print(_("Read EEPROM up to the unit ID:"))
+            pages = current[:int(math.ceil(end / float(pagesize)) * pagesize)]
+            for progress in self.tsb.eepromVerify(pages, max_mismatches=1):
+                self.printProgressBar(progress)
+            print('')
+            if not progress.mismatches:
+                return current
+
+        print(_('EEPROM cache "{}" is not valid for the board, EEPROM is read.').format(filename))
+        return None
+
+    def saveEepromCache(self, current):
+        import binascii
+        import json
+
+        start, end = self.unitIdRange()
+        with open(self.args.eeprom_cache, 'w') as file:
+            json.dump({'signature': self.deviceSignature(),
+                       'unit_id': [start, end - start],
+                       'eeprom': binascii.hexlify(current)}, file, sort_keys=True)
+
+    def deviceSignature(self):
+        return "%.2X %.2X %.2X" % self.tsb.device_info.signature
+
+    def eepromCurrentData(self, data):
+        """Return current EEPROM content at least in the range of data. The
+        cached content is used if it was saved for the same board.
+        """
+        current = None
+        if self.args.eeprom_cache:
+            current = self.loadEepromCache(len(data))
+        if current is not None:
+            return current
+
+        print('')
+        print(_("Read EEPROM memory:"))
+        for progress in self.tsb.eepromVerify(data):
+            self.printProgressBar(progress)
+        print('')
+
+        return progress.result
+
+    def eepromDeltaWrite(self, data):
+        current = self.eepromCurrentData(data)
+        size = self.tsb.eepromDeltaSize(data, current)
+        pagesize = self.tsb.device_info.pagesize
+        skipped_pages = int(math.ceil(len(data) / float(pagesize))) - size / pagesize
+
+        if size:
+            print('')
+            print(_("Write EEPROM memory:"))
+            for progress in self.tsb.eepromWrite(data[:size]):
+                self.printProgressBar(progress)
+            print('')
+
+        print(_("Skipped %d unchanged EEPROM pages") % (skipped_pages,))
+        print _("EEPROM Write OK")
+
+        if self.args.eeprom_cache:
+            round_data = int(math.ceil(len(data) / float(pagesize)) * pagesize)
+            current = data.ljust(round_data, '\xFF') + current[round_data:]
+            self.saveEepromCache(current)
         
         
     def changeUserData(self):
@@ -716,6 +1475,8 @@ class ConsoleApp():
         
         
     def showFWDeviceList(self):
+        import textwrap
+
         devices = self.fw_db.device_names()
         #devices.sort(lambda a,b:cmp(''.join(a), ''.join(b)))
         names=[]
@@ -731,7 +1492,7 @@ class ConsoleApp():
         try:
             firmware = self.fw_db.get_firmware(self.args.device)
         except KeyError:
-            stderr.write( _("Sorry firmware is not supported for '%s'\n.") % (self.args.device,))
+            self.stderr.write( _("Sorry firmware is not supported for '%s'\n.") % (self.args.device,))
             self.showFWDeviceList()
             return
         
@@ -739,8 +1500,8 @@ class ConsoleApp():
             firmware.set_rxtx(self.args.rxtx)
         except ValueError:
             supported_ports = ", ".join(firmware.fw_info.port.keys())
-            stderr.write(_("Device '%s' doesn't support ports '%s'\n") % (self.args.device, self.args.rxtx) )
-            stderr.write(_("Supported ports are: %s\n") % (supported_ports,))
+            self.stderr.write(_("Device '%s' doesn't support ports '%s'\n") % (self.args.device, self.args.rxtx) )
+            self.stderr.write(_("Supported ports are: %s\n") % (supported_ports,))
             return
         
         filename = self.args.output
@@ -769,7 +1530,10 @@ def main():
     except Exception as e:
         print e.message
     finally:
-        app.close()
+        try:
+            app.close()
+        except Exception as e:
+            print e.message
 
 
 if __name__ == "__main__":
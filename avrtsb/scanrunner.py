@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Sub-command scan - serial ports are probed for TSB in parallel
+
+import sys
+
+import pytsb
+from tsb_locale import *
+
+
+def cancel_probe(devicename, serial_ports):
+    """Close the serial port of the running probe, its pending read fails.
+    Port which is opened later is closed by ScanRunner.probePort()."""
+    serial_port = serial_ports.setdefault(devicename, None)
+    if serial_port is not None:
+        if hasattr(serial_port, 'cancel_read'):
+            serial_port.cancel_read()
+        serial_port.close()
+
+
+class ScanRunner(object):
+    def __init__(self, app):
+        self.app = app
+        self.args = app.args
+
+    def probePort(self, devicename, serial_ports):
+        """Activate TSB on the given port and return its DeviceInfo. The open
+        serial port is put into serial_ports, so that the probe can be
+        cancelled by cancel_probe().
+        """
+        tsb = self.app.openTSB(devicename)
+        if serial_ports.setdefault(devicename, tsb.serial) is not tsb.serial:
+            tsb.serial.close()
+            raise pytsb.AppException(_("Probe of the port was cancelled."))
+        try:
+            tsb.setPower()
+            tsb.activateTSB()
+            return tsb.device_info
+        finally:
+            tsb.close()
+
+    def run(self, parser):
+        import json
+        import time
+
+        args = self.args
+        if not args.baudrate.isdigit():
+            self.app.stderr.write(_("%s: error: argument -b/--buadrate: invalid int value: '%s'") % (sys.argv[0], args.baudrate,))
+            return
+        args.baudrate = int(args.baudrate)
+
+        devicenames = args.ports
+        if not devicenames:
+            import ports
+            devicenames = [info.device for info in ports.comports()]
+
+        # All ports are probed in parallel, the waiting is limited by one
+        # common deadline
+        serial_ports = {}
+        tasks = [(port, pytsb.BackgroundTask(self.probePort, port, serial_ports))
+                 for port in devicenames]
+        deadline = time.time() + args.port_timeout
+        fw_db = pytsb.import_firmware().FirmwareDB()
+
+        results = []
+        for port, task in tasks:
+            result = {'port': port}
+            try:
+                device_info = task.wait(max(0, deadline - time.time()))
+                result.update(device_info.todict())
+                result['device'] = fw_db.sig2name(device_info.signature)
+            except Exception as e:
+                result['error'] = u"%s" % (e,)
+                if not task.finished:
+                    cancel_probe(port, serial_ports)
+            results.append(result)
+
+        if args.json:
+            self.app.stdout.write(json.dumps(results, sort_keys=True) + '\n')
+            return
+
+        print(_("%-20s %-9s %-24s %7s %7s %s") % (
+            _("PORT"), _("SIGNATURE"), _("DEVICE"), _("FLASH"), _("EEPROM"), _("BUILD")))
+        for result in results:
+            if 'error' in result:
+                print(_("%-20s %s") % (result['port'], result['error']))
+                continue
+            print(_("%-20s %-9s %-24s %7d %7d %d") % (
+                result['port'], result['signature'],
+                ", ".join(result['device'][-1:]),
+                result['flashsize'], result['eepromsize'], result['tsbbuild']))
@@ -37,7 +37,7 @@ class extract_messages(babel.extract_messages):
         babel.extract_messages.initialize_options(self)
         self.charset = 'utf-8'
         self.no_default_keywords = False
-        self.keywords = '_ l'
+        self.keywords = '_ _l'
         self.mapping_file = None
         self.no_location = False
         self.omit_header = False
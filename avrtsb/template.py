@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Personalisation of the memory images - unique data of every unit
+#
+# Base images are parsed once, the image of every unit is a copy with the
+# patched fields. Values come from the counter and from the rows of CSV file,
+# one row per unit. Example of "personalize" part of the job file:
+# {
+#     "counter": {"start": 1000, "step": 1},
+#     "csv": "units.csv",
+#     "state": "units.state",
+#     "fields": [
+#         {"name": "serial", "memory": "eeprom", "address": 0, "width": 4,
+#          "encoding": "uint-le", "value": "counter"},
+#         {"name": "mac", "memory": "eeprom", "address": 4, "width": 6,
+#          "encoding": "hex"},
+#         {"name": "cal", "memory": "eeprom", "address": 16, "width": 2,
+#          "encoding": "uint-be"}
+#     ]
+# }
+#
+# Field "value" is the CSV column name or "counter", default is the field
+# name. The state file keeps the next counter value and CSV row, so the
+# values are not used twice when pytsb is started again.
+
+import binascii
+import csv
+import json
+import os
+
+from tsb_locale import *
+
+ENCODINGS = ['uint-le', 'uint-be', 'ascii', 'hex']
+MEMORIES = ['flash', 'eeprom']
+COUNTER = 'counter'
+
+
+class TemplateError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(TemplateError, self).__init__(message)
+
+
+def parse_uint(value):
+    """Parse decimal number, hexadecimal only with 0x prefix. Leading zeros
+    of decimal numbers (serial numbers from CSV) are not taken for octal."""
+    value = value.strip()
+    if value[:2].lower() == '0x':
+        return int(value[2:], 16)
+    return int(value, 10)
+
+
+class Field(object):
+    def __init__(self, name, memory, address, width, encoding='uint-le', value=None):
+        if memory not in MEMORIES:
+            raise TemplateError(_('Field "{}": unknown memory "{}".').format(name, memory))
+        if encoding not in ENCODINGS:
+            raise TemplateError(_('Field "{}": unknown encoding "{}".').format(name, encoding))
+        if (address < 0) or (width < 1):
+            raise TemplateError(_('Field "{}": invalid address or width.').format(name))
+
+        self.name = name
+        self.memory = memory
+        self.address = address
+        self.width = width
+        self.encoding = encoding
+        self.value = value or name     # CSV column or COUNTER
+
+    def encode(self, value):
+        """Return the value as string of width bytes"""
+        try:
+            if self.encoding.startswith('uint'):
+                if not isinstance(value, (int, long)):
+                    value = parse_uint(value)
+                if not (0 <= value < 256 ** self.width):
+                    raise ValueError
+                data = ''.join(chr((value >> (8 * i)) & 0xFF) for i in xrange(self.width))
+                if self.encoding == 'uint-be':
+                    data = data[::-1]
+                return data
+
+            if self.encoding == 'hex':
+                data = binascii.unhexlify(''.join(c for c in value if c not in ':- '))
+                if len(data) != self.width:
+                    raise ValueError
+                return data
+
+            data = str(value)
+            if len(data) > self.width:
+                raise ValueError
+            return data.ljust(self.width, '\0')
+        except (ValueError, TypeError, UnicodeError):
+            raise TemplateError(_('Field "{}": value "{}" cannot be encoded as {} bytes {}.').
+                                format(self.name, value, self.width, self.encoding))
+
+
+class Template(object):
+    def __init__(self):
+        self.fields = []
+        self.rows = None            # CSV rows, list of dicts
+        self.counter_start = 0
+        self.counter_step = 1
+        self.state_file = None
+        self.counter = 0            # Next counter value
+        self.row = 0                # Next CSV row
+
+    @classmethod
+    def fromDict(cls, definition, base_dir=""):
+        """Load template definition, file names are relative to the base_dir"""
+        template = cls()
+        try:
+            counter = definition.get('counter', {})
+            template.counter_start = int(counter.get('start', 0))
+            template.counter_step = int(counter.get('step', 1))
+            template.counter = template.counter_start
+
+            if definition.get('csv'):
+                template.loadCsv(os.path.join(base_dir, definition['csv']))
+            if definition.get('state'):
+                template.state_file = os.path.join(base_dir, definition['state'])
+
+            for field in definition.get('fields', []):
+                field = dict(field)
+                template.fields.append(Field(
+                    field.pop('name'), field.pop('memory', 'eeprom'),
+                    int(field.pop('address')), int(field.pop('width')), **field))
+        except (KeyError, TypeError, ValueError) as e:
+            raise TemplateError(_('Invalid personalisation definition: {}').format(e))
+
+        template.checkFields()
+        template.loadState()
+        return template
+
+    def loadCsv(self, filename):
+        try:
+            with open(filename, 'rb') as file:
+                self.rows = list(csv.DictReader(file))
+        except (IOError, csv.Error) as e:
+            raise TemplateError(_('CSV file "{}" read error: {}').format(filename, e))
+
+    def checkFields(self):
+        """Check the CSV columns and overlapping fields"""
+        columns = set(self.rows[0]) if self.rows else set()
+        for field in self.fields:
+            if (field.value != COUNTER) and (field.value not in columns):
+                raise TemplateError(_('Field "{}": there is no CSV column "{}".').
+                                    format(field.name, field.value))
+
+        for i, field in enumerate(self.fields):
+            for other in self.fields[i+1:]:
+                if (field.memory == other.memory) and \
+                        (field.address < other.address + other.width) and \
+                        (other.address < field.address + field.width):
+                    raise TemplateError(_('Fields "{}" and "{}" overlap.').format(field.name, other.name))
+
+    def loadState(self):
+        if not (self.state_file and os.path.exists(self.state_file)):
+            return
+        try:
+            with open(self.state_file, 'r') as file:
+                state = json.load(file)
+            self.counter = int(state['counter'])
+            self.row = int(state['row'])
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            raise TemplateError(_('State file "{}" read error: {}').format(self.state_file, e))
+
+    def saveState(self):
+        if self.state_file:
+            with open(self.state_file, 'w') as file:
+                json.dump({'counter': self.counter, 'row': self.row}, file)
+
+    def memories(self):
+        return set(field.memory for field in self.fields)
+
+    def nextRecord(self):
+        """Return values of the next unit, dict of CSV columns and counter.
+        The values are never returned again, even if programming fails.
+        """
+        record = {}
+        if self.rows is not None:
+            if self.row >= len(self.rows):
+                raise TemplateError(_("All {} rows of the CSV file were used.").format(len(self.rows)))
+            record.update(self.rows[self.row])
+            self.row += 1
+        record[COUNTER] = self.counter
+        self.counter += self.counter_step
+        self.saveState()
+        return record
+
+    def apply(self, image, memory, record):
+        """Return copy of MemoryImage with the fields of the memory patched"""
+        image = image.copy()
+        for field in self.fields:
+            if field.memory == memory:
+                image.puts(field.address, field.encode(record[field.value]))
+        return image
+
+    def describe(self, record):
+        return ", ".join("%s=%s" % (field.name, record[field.value]) for field in self.fields)
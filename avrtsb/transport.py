@@ -0,0 +1,229 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Recording and replay of the serial communication
+#
+# RecordingSerial wraps serial port and writes every write, read, timeout and
+# DTR/RTS change into the binary log. ReplaySerial plays the log back to
+# TSBLoader without a device, with real timing or as fast as possible.
+#
+# Log format: MAGIC followed by records, record header is struct REC_HEADER
+# (event, time from the start in microseconds, payload length) followed by
+# the payload.
+
+import struct
+import time
+
+from tsb_locale import *
+
+MAGIC = 'TSBREC1\n'
+REC_HEADER = struct.Struct('<BQH')
+MAX_PAYLOAD = 0xFFFF
+
+EVENT_WRITE = ord('W')
+EVENT_READ = ord('R')       # Received data
+EVENT_TIMEOUT = ord('T')    # Read finished by timeout, payload: timeout in ms
+EVENT_DTR = ord('D')
+EVENT_RTS = ord('S')
+EVENT_FLUSH = ord('F')      # Input buffer flushed
+EVENT_CLOSE = ord('C')
+
+TIMEOUT_PAYLOAD = struct.Struct('<I')
+
+
+class TransportError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(TransportError, self).__init__(message)
+
+
+def read_records(file):
+    """Return list of (event, time in seconds, payload) from the log file"""
+    if file.read(len(MAGIC)) != MAGIC:
+        raise TransportError(_("Not a serial communication record file."))
+
+    records = []
+    while True:
+        header = file.read(REC_HEADER.size)
+        if not header:
+            break
+        if len(header) < REC_HEADER.size:
+            raise TransportError(_("Serial communication record is truncated."))
+        event, usec, length = REC_HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length:
+            raise TransportError(_("Serial communication record is truncated."))
+        records.append((event, usec / 1e6, payload))
+    return records
+
+
+class RecordingSerial(object):
+    """Serial port wrapper which records the communication into the file"""
+    def __init__(self, serial, file):
+        self.serial = serial
+        self.file = file
+        self.start = time.time()
+        self.file.write(MAGIC)
+
+    def record(self, event, payload=''):
+        usec = int((time.time() - self.start) * 1e6)
+        for offset in xrange(0, max(len(payload), 1), MAX_PAYLOAD):
+            chunk = payload[offset:offset+MAX_PAYLOAD]
+            self.file.write(REC_HEADER.pack(event, usec, len(chunk)))
+            self.file.write(chunk)
+
+    def write(self, data):
+        self.record(EVENT_WRITE, bytes(data))
+        return self.serial.write(data)
+
+    def read(self, size=1):
+        data = self.serial.read(size)
+        if data:
+            self.record(EVENT_READ, data)
+        if len(data) < size:
+            timeout_ms = int((self.serial.timeout or 0) * 1000)
+            self.record(EVENT_TIMEOUT, TIMEOUT_PAYLOAD.pack(timeout_ms))
+        return data
+
+    def setDTR(self, level=True):
+        self.record(EVENT_DTR, chr(int(bool(level))))
+        self.serial.setDTR(level)
+
+    def setRTS(self, level=True):
+        self.record(EVENT_RTS, chr(int(bool(level))))
+        self.serial.setRTS(level)
+
+    def flushInput(self):
+        self.record(EVENT_FLUSH)
+        self.serial.flushInput()
+
+    reset_input_buffer = flushInput
+
+    def close(self):
+        self.record(EVENT_CLOSE)
+        self.serial.close()
+        self.file.close()
+
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+    def __setattr__(self, name, value):
+        # Port settings (timeout, baudrate) are set to the wrapped port
+        if name in ('serial', 'file', 'start'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.serial, name, value)
+
+
+class ReplaySerial(object):
+    """Serial port which plays back the recorded communication. Written data
+    must match the record, TransportError is raised on the first difference
+    and the next writes are ignored.
+    Received data are returned as a stream, the size of reads can differ from
+    the record. Data recorded before the next write, or up to the recorded
+    timeout, are available for the read.
+    """
+    def __init__(self, file, realtime=False):
+        self.records = read_records(file)
+        file.close()
+        self.realtime = realtime
+        self.timeout = None
+        self.baudrate = None
+        self.pos = 0            # Index of the next record
+        self.write_offset = 0   # Already matched bytes of the write record
+        self.rx_buffer = ''
+        self.diverged = False
+        self.start = time.time()
+        self.dtr = None
+        self.rts = None
+
+    def wait(self, record_time):
+        if self.realtime:
+            delay = self.start + record_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    def skipControl(self):
+        """Skip DTR/RTS, flush and close records"""
+        while (self.pos < len(self.records)) and \
+                (self.records[self.pos][0] in (EVENT_DTR, EVENT_RTS, EVENT_FLUSH, EVENT_CLOSE)):
+            self.pos += 1
+
+    def write(self, data):
+        if self.diverged:
+            return len(data)
+
+        data = bytes(data)
+        offset = 0
+        while offset < len(data):
+            self.skipControl()
+            # Data received before the write stay in the input buffer
+            while (self.pos < len(self.records)) and \
+                    (self.records[self.pos][0] in (EVENT_READ, EVENT_TIMEOUT)):
+                if self.records[self.pos][0] == EVENT_READ:
+                    self.rx_buffer += self.records[self.pos][2]
+                self.pos += 1
+                self.skipControl()
+
+            if self.pos >= len(self.records):
+                self.diverged = True
+                raise TransportError(_("Replay: write of {!r} after the end of record.").format(data[offset:offset+16]))
+
+            event, record_time, payload = self.records[self.pos]
+            expected = payload[self.write_offset:]
+            chunk = data[offset:offset+len(expected)]
+            if not expected.startswith(chunk):
+                self.diverged = True
+                i = 0
+                while chunk[i] == expected[i]:
+                    i += 1
+                raise TransportError(_("Replay: written data differ from the record {} at byte {}: {!r} instead of {!r}.").
+                                     format(self.pos, self.write_offset + i, chunk[i:i+16], expected[i:i+16]))
+
+            offset += len(chunk)
+            self.write_offset += len(chunk)
+            if self.write_offset == len(payload):
+                self.pos += 1
+                self.write_offset = 0
+        return len(data)
+
+    def read(self, size=1):
+        while len(self.rx_buffer) < size:
+            self.skipControl()
+            if (self.pos >= len(self.records)) or (self.write_offset > 0):
+                break
+            event, record_time, payload = self.records[self.pos]
+            if event == EVENT_READ:
+                self.wait(record_time)
+                self.rx_buffer += payload
+                self.pos += 1
+            elif event == EVENT_TIMEOUT:
+                self.wait(record_time)
+                self.pos += 1
+                break
+            else:
+                # Device waits for the next write
+                break
+
+        data = self.rx_buffer[:size]
+        self.rx_buffer = self.rx_buffer[size:]
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self.rx_buffer)
+
+    def flushInput(self):
+        self.rx_buffer = ''
+
+    reset_input_buffer = flushInput
+
+    def setDTR(self, level=True):
+        self.dtr = level
+
+    def setRTS(self, level=True):
+        self.rts = level
+
+    def close(self):
+        pass
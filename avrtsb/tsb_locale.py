@@ -1,6 +1,5 @@
 __all__ = ['_', '_l', 'STDOUT_ENCODING', 'SYS_ENCODING', 'LANG_CODE']
 
-import gettext
 import locale
 import os
 import sys
@@ -15,12 +14,58 @@ LANG_CODE, SYS_ENCODING = locale.getdefaultlocale()
 
 if LANG_CODE == None:
     LANG_CODE = "en_US"
- 
-translation = gettext.translation('pytsb', LOCALE_DIRECTORY,
-                                  languages=[LANG_CODE],
-                                  codeset=STDOUT_ENCODING,
-                                  fallback=True)
 
-_ = translation.ugettext
-_l = translation.lgettext
+_translation = None
 
+def get_translation():
+    """Return the translation object. Message catalog is loaded with the first
+    translated message, not at the import time.
+    """
+    global _translation
+    if _translation is None:
+        import gettext
+        _translation = gettext.translation('pytsb', LOCALE_DIRECTORY,
+                                           languages=[LANG_CODE],
+                                           codeset=STDOUT_ENCODING,
+                                           fallback=True)
+    return _translation
+
+def _(message):
+    return get_translation().ugettext(message)
+
+class LazyString(object):
+    """Message translated only when it is used as a string. Help texts of
+    the command line parser are translated only if the help is printed.
+    """
+    def __init__(self, message):
+        self.message = message
+
+    def __unicode__(self):
+        return _(self.message)
+
+    # '%s' % lazy_string gives unicode as '%s' % _(message)
+    __str__ = __unicode__
+
+    def __mod__(self, args):
+        return _(self.message) % args
+
+    def __add__(self, other):
+        return _(self.message) + other
+
+    def __radd__(self, other):
+        return other + _(self.message)
+
+    def __contains__(self, text):
+        return text in _(self.message)
+
+    def __nonzero__(self):
+        return bool(self.message)
+
+    def __getattr__(self, name):
+        return getattr(_(self.message), name)
+
+    def __repr__(self):
+        return 'LazyString(%r)' % (self.message,)
+
+def _l(message):
+    return LazyString(message)
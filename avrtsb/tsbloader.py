@@ -1,21 +1,23 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 import time
-import firmware
 import math
 import collections
 
 from tsb_locale import *
 
-from serial import Serial
 from struct import unpack, pack
-from cStringIO import StringIO
 
 # https://docs.python.org/3/library/struct.html
 TSB_CONFIRM="!"
 TSB_REQUEST="?"
-TSB_INFO_HEADER_SIZE=15
+TSB_INFO_HEADER_SIZE=16          # Info header is followed with CONFIRM
 TSB_USER_HEADER_SIZE=3          # User header is followed with password up to end of pagesize
+TSB_PASSWORD_DELAY=2            # ms between autobaud sequence and password, TSB measures the baudrate
+TSB_ANSWER_DELAY=20             # ms to wait for the info header before the password is sent, covers USB serial latency
+
+# Identifier in the last byte of device info block: (jmpmode, tinymega)
+AVR_JMP_IDENTIFIER = {0x00: (0, 0), 0x0C: (1,0), 0xAA: (0, 1)}
 FLASH_PAGEWRITE_TIMEOUT=200     # Maximum time for write one page to flash - usually about 74
 EMERGENCY_ERASE_TIMEOUT=60000   # Emergency erase takes a lot of time, all memories must be reprogrammed
 
@@ -31,6 +33,30 @@ class ProgressInfo(object):
         self.total = total
         self.iteration = 0
         self.result = None
+        self.skipped_pages = 0  # Blank pages which were not transferred
+        self.retries = 0        # Read errors recovered by reactivation
+        self.start_time = time.time()
+
+    def elapsed(self):
+        """Time from the start of the transfer in seconds"""
+        return time.time() - self.start_time
+
+class VerifyInfo(ProgressInfo):
+    def __init__(self, total):
+        super(VerifyInfo, self).__init__(total)
+        self.mismatches = []    # Start addresses of mismatching pages
+        self.stop_addr = None   # Address where the reading was stopped
+
+def is_info_header(header):
+    """Check the info header: magic, size, valid page size, device
+    identifier and final CONFIRM"""
+    if len(header) <> TSB_INFO_HEADER_SIZE + len(TSB_CONFIRM):
+        return False
+    pagesize = ord(header[9]) * 2
+    return (header[0:3] == "TSB") and (header[-1] == TSB_CONFIRM) and \
+           (pagesize > 0) and (pagesize % 16 == 0) and \
+           (ord(header[15]) in AVR_JMP_IDENTIFIER)
+
 
 class DeviceInfo:
     def __init__(self):
@@ -89,8 +115,7 @@ class DeviceInfo:
         # detect wheter device is ATtiny or ATmega from identifier 
         # in last byte of device info block
         # while decision for jmp/rjmp depends on memory size
-        avr_jmp_identifier = {0x00: (0, 0), 0x0C: (1,0), 0xAA: (0, 1)}
-        self.jmpmode, self.tinymega = avr_jmp_identifier[ord(header[15])]
+        self.jmpmode, self.tinymega = AVR_JMP_IDENTIFIER[ord(header[15])]
 
         if header[-1] <> TSB_CONFIRM:
             raise TSBException(_("Error: Confirmation of header expected."))
@@ -137,7 +162,21 @@ class DeviceInfo:
             raise ValueError(_("Maximum lenght of password is %d") % (self.pagesize-TSB_USER_HEADER_SIZE,) )
 
     
+    def todict(self):
+        return {
+            'tsbbuild'   : self.tsbbuild,
+            'tsbstatus'  : self.tsbstatus,
+            'signature'  : "%.2X %.2X %.2X" % self.signature,
+            'flashsize'  : self.flashsize,
+            'appflash'   : self.appflash,
+            'pagesize'   : self.pagesize,
+            'eepromsize' : self.eepromsize,
+            'appjump'    : self.appjump,
+            'timeout'    : self.timeout,
+        }
+
     def tostr(self):
+        import firmware     # Firmware database is loaded only when needed
         fw_db = firmware.FirmwareDB()
         device_list = fw_db.sig2name(self.signature)
         device_name = ", ".join(device_list)
@@ -182,6 +221,11 @@ class TSBLoader:
         self.setPassword("")
         self.one_wire = False
         self.timeout_reset = 200 #ms
+        self.delays = True  # False skips delays, used for replay of records
+        self.low_latency = None
+        self.read_retries = 0   # Reactivations allowed after read error
+        self.fast_activation = True # Send password without waiting for the read timeout
+        self.activation_retries = 2 # Repeated activations after invalid info header
         self.device_info = DeviceInfo()
         
         # Timeout 50ms is big enought for transmitt 7 characters with speed
@@ -190,8 +234,13 @@ class TSBLoader:
         # time for init TSB Bootloader protected with the password
         # Concurrently the time cannot be too long, because of the autodetection
         # if the password is necessarly
-        self.serial.timeout = 0.05
+        self.read_timeout = 0.05
+        self.serial.timeout = self.read_timeout
         self.state = TSBLoader.STATE_INIT
+
+        # Buffers allocated once per session, see allocBuffers()
+        self.rx_buffer = bytearray()
+        self.tx_buffer = bytearray()
     
     @property
     def reset_line():
@@ -220,7 +269,8 @@ class TSBLoader:
         print(message)
         
     def sleep(self, ms):
-        time.sleep(ms / 1000.0)
+        if self.delays:
+            time.sleep(ms / 1000.0)
 
     def setPower(self):
         """Switch on other line than line for reset to log 1. The output
@@ -267,27 +317,61 @@ class TSBLoader:
         """Read size of data. Finish if no data come during timeout.
         Timeout is automaticaly prolonged when receive data.
         """
+        # Setting of the port timeout reconfigures the port, it is changed
+        # only if the previous read used other timeout
         if timeout == None:
-            timeout = self.serial.timeout*1000.
-            
-        old_timeout = self.serial.timeout
-        self.serial.timeout = timeout/1000.
-        data = []
-        try:
-            num_bytes = 0   #Number o received bytes
-            while num_bytes < size:
-                new_data = self.serial.read(size - num_bytes)
-                num_bytes += len(new_data)
-                data.append( new_data )
-
-                #Check timeout
-                if new_data == '':
-                    break
-        finally:
-            self.serial.timeout = old_timeout
+            port_timeout = self.read_timeout
+        else:
+            port_timeout = timeout/1000.
+        if self.serial.timeout != port_timeout:
+            self.serial.timeout = port_timeout
+
+        data = self.serial.read(size)
+        if (len(data) == size) or (data == ''):
+            return data
+
+        data = [data]
+        num_bytes = len(data[0])    #Number o received bytes
+        while num_bytes < size:
+            new_data = self.serial.read(size - num_bytes)
+            num_bytes += len(new_data)
+            data.append( new_data )
+
+            #Check timeout
+            if new_data == '':
+                break
 
         return ''.join(data)
 
+    def allocBuffers(self):
+        """Allocate receive buffer for the biggest memory and transmit buffer
+        for TSB_CONFIRM and one page."""
+        info = self.device_info
+        size = max(info.appflash, info.eepromsize, info.pagesize)
+        if len(self.rx_buffer) < size:
+            self.rx_buffer = bytearray(size)
+        self.tx_buffer = bytearray(TSB_CONFIRM + '\xFF' * info.pagesize)
+
+    def readPage(self, addr):
+        """Receive one page and copy it into the receive buffer at the
+        address. Return the page or None if it was not received whole."""
+        pagesize = self.device_info.pagesize
+        page = self.read(pagesize)
+        if len(page) <> pagesize:
+            return None
+        if len(self.rx_buffer) < addr + pagesize:
+            self.allocBuffers()
+        self.rx_buffer[addr : addr+pagesize] = page
+        return page
+
+    def sendPage(self, page):
+        """Send TSB_CONFIRM and the page data with one write. The buffer is
+        allocated here if allocBuffers() was not called for the page size."""
+        if len(self.tx_buffer) <> len(TSB_CONFIRM) + len(page):
+            self.tx_buffer = bytearray(TSB_CONFIRM + '\xFF' * len(page))
+        self.tx_buffer[1:] = page
+        self.sendCommand(self.tx_buffer)
+
 
     def waitRespond(self, respond, timeout=None):
         """Wait than device return desired request.
@@ -325,79 +409,279 @@ class TSBLoader:
            raise TSBException(_("User data write error."))
 
     def activateTSB(self):
-        if self.reset_cmd:
-            self.sendCommand(self.reset_cmd) 
-            self.read() # Read confirmation from application if exist
-        else:
-            self.resetMCU()
-        
-        self.sendCommand("@@@")
-        rx = self.read()
-        if rx[:3] == "@@@":
-            self.one_wire = True
-            rx = rx[3:]     #Strip echo characters
-            self.log(_("One-wire interface detected."))
-
-        if (rx == '') and (self.password):
-            self.sendCommand(self.password)
-            rx = self.read()
+        """Reset MCU and activate bootloader. Stale data in the input buffer
+        are dropped and valid info header is searched in the received data.
+        When only invalid data are received (framing errors at high
+        baudrates), the activation is repeated up to activation_retries times.
+        """
+        for attempt in xrange(self.activation_retries + 1):
+            if attempt > 0:
+                self.log(_("Invalid info header received, activation is repeated."))
 
-        if rx == "":
-            err_message = _("Error: Device does not respond.")
-            if self.password:             
-                err_message += _(" Please check your password.")
+            if self.reset_cmd:
+                self.sendCommand(self.reset_cmd) 
+                self.read() # Read confirmation from application if exist
             else:
-                err_message += _(" Maybe password is required.")
+                self.resetMCU()
+            self.serial.flushInput()
+
+            rx = self.sendActivation()
 
-            raise TSBException(err_message)
-        self.device_info.parseInfoHeader(rx)
+            if rx == "":
+                err_message = _("Error: Device does not respond.")
+                if self.password:             
+                    err_message += _(" Please check your password.")
+                else:
+                    err_message += _(" Maybe password is required.")
+
+                raise TSBException(err_message)
+
+            header = self.findInfoHeader(rx)
+            if header:
+                break
+        else:
+            # Report the original error of the invalid header
+            header = rx
+
+        self.device_info.parseInfoHeader(header)
         self.device_info.parseUserData(self.readUserData())
+        self.allocBuffers()
         self.state = TSBLoader.STATE_ACTIVE
 
-    def check4SPM(self, data):
+    def sendActivation(self):
+        """Send autobaud sequence and password, return the info header. TSB
+        without password answers the autobaud sequence at once and the
+        password would be taken for commands ('F' erases flash), so the
+        password is sent only if the device is silent. With fast_activation
+        it waits for a few characters only, otherwise for the read timeout.
+        The read finishes when whole info header is received.
+        """
+        header_size = TSB_INFO_HEADER_SIZE + len(TSB_CONFIRM)
+        sent = "@@@"
+        self.serial.write(sent)
+        rx = ''
+        if self.password and self.fast_activation:
+            # Echo of the one-wire interface and the first header byte
+            rx = self.read(len(sent) + 1, self.answerTimeout(len(sent) + 1))
+            if rx in ('', sent):
+                self.sleep(TSB_PASSWORD_DELAY)
+                self.serial.write(self.password)
+                sent += self.password
+
+        rx += self.read(header_size - len(rx))
+        if rx[:3] == "@@@":
+            self.one_wire = True
+            rx = (rx + self.read(len(sent)))[len(sent):]    #Strip echo characters
+            self.log(_("One-wire interface detected."))
+
+        if (rx == '') and self.password and not self.fast_activation:
+            self.sendCommand(self.password)
+            rx = self.read(header_size)
+        return rx
+
+    def answerTimeout(self, size):
+        """Time in ms to receive size characters, plus TSB_ANSWER_DELAY"""
+        baudrate = getattr(self.serial, 'baudrate', None) or 9600
+        return TSB_ANSWER_DELAY + int(math.ceil(size * 10000.0 / baudrate))
+
+    def findInfoHeader(self, rx):
+        """Return valid info header found in the received data or None. If
+        there are other data before the header, the rest of the header is
+        read up to the read timeout.
+        """
+        size = TSB_INFO_HEADER_SIZE + len(TSB_CONFIRM)
+        if is_info_header(rx[:size]):
+            return rx[:size]
+
+        rx += self.read()
+        pos = rx.find("TSB")
+        while pos >= 0:
+            if is_info_header(rx[pos:pos+size]):
+                return rx[pos:pos+size]
+            pos = rx.find("TSB", pos + 1)
+        return None
+
+    @staticmethod
+    def check4SPM(data):
         """Check for presence of SPM instruction in the code data. SPM instruction
         is used for write into the FLASH memory."""
 
-        #Every instructions has same size 2bytes
-        opcodes = [data[i:i+2] for i in xrange(0, len(data), 2)]
-        return '\xE8\x95' in opcodes
+        #Every instructions has same size 2bytes, only even positions are valid
+        pos = data.find('\xE8\x95')
+        while pos >= 0:
+            if (pos % 2) == 0:
+                return True
+            pos = data.find('\xE8\x95', pos + 1)
+        return False
     
-    def flashRead(self):
+    def flashRead(self, sink=None):
         if self.state <> TSBLoader.STATE_ACTIVE:
             self.activateTSB()
 
-        flashdata = []
-        self.sendCommand("f")
+        return self.readMemory("f", self.device_info.appflash,
+                               _("Read flash memory page error."), sink)
+
+    def restartRead(self, command):
+        """Reactivate bootloader after the read error and start reading
+        again from the first page"""
+        self.state = TSBLoader.STATE_INIT
+        self.serial.flushInput()
+        self.activateTSB()
+        self.sendCommand(command)
+
+    def readMemory(self, command, memsize, error_message, sink=None):
+        """Read whole memory with command 'f' or 'e'. After the read error
+        the bootloader is activated again (up to read_retries times), pages
+        received before are read again but not stored and reading continues
+        from the failed page.
+        If sink is given, every page is passed to sink(addr, page) as soon as
+        it is received and the result is empty string.
+        """
+        self.sendCommand(command)
 
         addr = 0
-        rx = "init"
-        progress = ProgressInfo(self.device_info.appflash)
-        while (rx <> '') and (addr < self.device_info.appflash):
+        resume_addr = 0     # Pages below the address are already received
+        pagesize = self.device_info.pagesize
+        progress = ProgressInfo(memsize)
+        while addr < memsize:
             self.sendCommand(TSB_CONFIRM)
-            rx = self.read(self.device_info.pagesize)
-            
-            if len(rx) <> self.device_info.pagesize:
-                raise TSBException(_("Read flash memory page error."))
-    
-            addr += len(rx)
-            progress.iteration += len(rx)
-            flashdata.append(rx)
+            if addr < resume_addr:
+                received = len(self.read(pagesize)) == pagesize
+            else:
+                page = self.readPage(addr)
+                received = page is not None
+                if received and sink:
+                    sink(addr, page)
+
+            if not received:
+                resume_addr = max(resume_addr, addr)
+                addr = 0
+                while True:
+                    # Bootloader started by application command cannot be reset
+                    if (progress.retries >= self.read_retries) or self.reset_cmd:
+                        raise TSBException(error_message)
+                    progress.retries += 1
+                    try:
+                        self.restartRead(command)
+                        break
+                    except TSBException:
+                        pass
+                continue
+
+            addr += pagesize
+            if addr > resume_addr:
+                progress.iteration = addr
+                yield(progress)
+
+        # Flash reading is finished by TSB after the last page
+        if command <> "f":
+            self.sendCommand(TSB_REQUEST)
+        self.waitRespond(TSB_CONFIRM)
+        if sink:
+            progress.result = ''
+        else:
+            data = memoryview(self.rx_buffer)[:addr].tobytes()
+            progress.result = data.rstrip("\xFF") #Remove empty data
+        yield(progress)
+
+
+    def pageExchanges(self, command, count):
+        """Read up to count pages with command 'f' or 'e' and yield duration
+        of every page exchange in seconds. Used for the link diagnostic, the
+        generator must be consumed to the end."""
+        memsize = {'f': self.device_info.appflash,
+                   'e': self.device_info.eepromsize}[command]
+        pagesize = self.device_info.pagesize
+        count = min(count, memsize / pagesize)
+
+        self.sendCommand(command)
+        for i in xrange(count):
+            start = time.time()
+            self.sendCommand(TSB_CONFIRM)
+            if len(self.read(pagesize)) <> pagesize:
+                raise TSBException(_("Read memory page error."))
+            yield time.time() - start
+
+        if (command == "f") and (count * pagesize >= memsize):
+            self.waitRespond(TSB_CONFIRM)
+        else:
+            self.sendCommand(TSB_REQUEST)
+            self.waitRespond(TSB_CONFIRM)
+
+    def verifyMemory(self, command, memsize, data, max_mismatches=0):
+        """Read memory with command 'f' or 'e' and compare every page with
+        data as soon as it is received. Only the pages covered by data are
+        read. Reading is stopped after max_mismatches mismatching pages,
+        0 means compare all pages.
+        """
+        pagesize = self.device_info.pagesize
+        size = int(math.ceil(len(data) / float(pagesize)) * pagesize)
+        data = data.ljust(size, '\xFF')
+
+        if size > memsize:
+            raise TSBException(_("Error: Not enough space."))
+
+        self.sendCommand(command)
+
+        addr = 0
+        data = memoryview(data)
+        progress = VerifyInfo(size)
+        while addr < size:
+            self.sendCommand(TSB_CONFIRM)
+            page = self.readPage(addr)
+            if page is None:
+                raise TSBException(_("Read memory page error."))
+
+            if page <> data[addr:addr+pagesize]:
+                progress.mismatches.append(addr)
+
+            addr += pagesize
+            progress.iteration = addr
+            if max_mismatches and (len(progress.mismatches) >= max_mismatches):
+                progress.stop_addr = addr
+                break
             yield(progress)
-            
-        
-        if addr < self.device_info.appflash:
-            raise TSBException(_("Read Error: other memory page expected."))
 
-        self.waitRespond( TSB_CONFIRM )        
-        flashdata = ''.join(flashdata)
-        flashdata = flashdata.rstrip("\xFF") #Remove empty data
+        # Flash reading is finished by TSB after the last page, otherwise
+        # reading is interrupted with request
+        if (command == "f") and (addr >= memsize):
+            self.waitRespond(TSB_CONFIRM)
+        else:
+            self.sendCommand(TSB_REQUEST)
+            self.waitRespond(TSB_CONFIRM)
 
-        progress.result = flashdata
+        progress.result = memoryview(self.rx_buffer)[:addr].tobytes()
         yield(progress)
 
+    def flashVerify(self, data, max_mismatches=0):
+        if self.state <> TSBLoader.STATE_ACTIVE:
+            self.activateTSB()
 
-    def flashWrite(self, data):
+        return self.verifyMemory("f", self.device_info.appflash, data, max_mismatches)
+
+    def eepromVerify(self, data, max_mismatches=0):
+        return self.verifyMemory("e", self.device_info.eepromsize, data, max_mismatches)
+
+    def trimBlankPages(self, data):
+        """Remove trailing pages which include only 0xFF. Return tuple
+        (data, number of removed pages). Data are padded to whole pages.
+        """
         pagesize = self.device_info.pagesize
+        round_data = int(math.ceil(len(data) / float(pagesize)) * pagesize)
+        used_data = int(math.ceil(len(data.rstrip('\xFF')) / float(pagesize)) * pagesize)
+        data = data[:used_data].ljust(used_data, '\xFF')
+        return data, (round_data - used_data) / pagesize
+
+    def flashWrite(self, data, trim=True):
+        """Write data to the flash. With trim the trailing blank pages are
+        not sent, flash is already erased by F command. The last progress
+        has the result set, it is yielded also for blank image when no page
+        is sent.
+        """
+        pagesize = self.device_info.pagesize
+        skipped_pages = 0
+        if trim:
+            data, skipped_pages = self.trimBlankPages(data)
         
         #Pad data to all page
         round_data = int(math.ceil(len(data) / float(pagesize)) * pagesize)
@@ -413,10 +697,10 @@ class TSBLoader:
         self.waitRespond( TSB_REQUEST, FLASH_PAGEWRITE_TIMEOUT*pages_count) 
 
         progress = ProgressInfo(len(data))
+        progress.skipped_pages = skipped_pages
+        data = memoryview(data)
         for pagenum in xrange(len(data) / pagesize):
-            pagedata = data[pagenum*pagesize : (pagenum+1)*pagesize]
-            self.sendCommand(TSB_CONFIRM)
-            self.sendCommand(pagedata)
+            self.sendPage(data[pagenum*pagesize : (pagenum+1)*pagesize])
             # self.log(_("Flash write %.4X") % (pagenum*pagesize,))
             
             #From datasheet the maximum time for write one page is 4.5ms and
@@ -438,10 +722,37 @@ class TSBLoader:
         self.sendCommand(TSB_REQUEST)
         # For AVR Tiny must wait longer time
         self.waitRespond(TSB_CONFIRM, FLASH_PAGEWRITE_TIMEOUT)
+        progress.result = True
+        yield(progress)
+
+    def flashErase(self, blank_check=True, verify=False):
+        """TSB erases the whole application flash before the first page is
+        requested. The write is finished immediately, no 0xFF pages are sent.
+        With blank_check the first page is read back, TSB reads the flash
+        only from the start, so the whole flash is read back only with
+        verify. The reading is stopped at the first page which is not blank.
+        """
+        self.sendCommand("F")
+        pages_count = self.device_info.appflash / self.device_info.pagesize
+        self.waitRespond( TSB_REQUEST, FLASH_PAGEWRITE_TIMEOUT*pages_count)
+        self.sendCommand(TSB_REQUEST)
+        self.waitRespond(TSB_CONFIRM, FLASH_PAGEWRITE_TIMEOUT)
 
-    def flashErase(self):
-        data = self.device_info.flashsize * b'\xFF'
-        self.flashWrite(data)
+        if not blank_check:
+            progress = ProgressInfo(self.device_info.appflash)
+            progress.iteration = progress.total
+            yield(progress)
+            return
+
+        blank_size = self.device_info.appflash if verify else self.device_info.pagesize
+        for progress in self.flashVerify(blank_size * '\xFF', max_mismatches=1):
+            if progress.result is None:
+                yield(progress)
+
+        if progress.mismatches:
+            raise TSBException(_("Flash erase error: page 0x%.4X is not blank.")
+                               % (progress.mismatches[0],))
+        yield(progress)
 
     def eepromWrite(self, data):
         pagesize = self.device_info.pagesize
@@ -461,10 +772,9 @@ class TSBLoader:
         self.waitRespond( TSB_REQUEST, FLASH_PAGEWRITE_TIMEOUT*pages_count) 
 
         progress = ProgressInfo(len(data))
+        data = memoryview(data)
         for pagenum in xrange(len(data) / pagesize):
-            pagedata = data[pagenum*pagesize : (pagenum+1)*pagesize]
-            self.sendCommand(TSB_CONFIRM)
-            self.sendCommand(pagedata)
+            self.sendPage(data[pagenum*pagesize : (pagenum+1)*pagesize])
             
             # From datasheet the maximum time for write one byte is 8.5 ms
             # For sure the data are realy written 10 ms timout is used
@@ -483,39 +793,28 @@ class TSBLoader:
         self.waitRespond(TSB_CONFIRM) 
 
 
+    def eepromDeltaSize(self, data, current):
+        """Return number of bytes of data which must be written so that EEPROM
+        with current content will include data. E command writes pages from
+        the address 0, so all pages up to the last changed one must be sent.
+        """
+        pagesize = self.device_info.pagesize
+        round_data = int(math.ceil(len(data) / float(pagesize)) * pagesize)
+        data = data.ljust(round_data, '\xFF')
+        current = current[:round_data].ljust(round_data, '\xFF')
+
+        for addr in xrange(round_data - pagesize, -1, -pagesize):
+            if data[addr:addr+pagesize] <> current[addr:addr+pagesize]:
+                return addr + pagesize
+        return 0
+
     def eepromErase(self):
         data = self.device_info.eepromsize * b'\xFF'
         return self.eepromWrite(data)
         
-    def eepromRead(self):
-        eepromdata = []
-        self.sendCommand("e")
-
-        addr = 0
-        rx = "init"
-        progress = ProgressInfo(self.device_info.eepromsize)
-        while (rx <> '') and (addr < self.device_info.eepromsize):
-            self.sendCommand(TSB_CONFIRM)
-            rx = self.read(self.device_info.pagesize)
-            
-            if len(rx) <> self.device_info.pagesize:
-                raise TSBException(_("Read EEPROM memory page error."))
-    
-            addr += len(rx)
-            progress.iteration += len(rx)
-            eepromdata.append(rx)
-            yield(progress)
-        
-        if addr < self.device_info.eepromsize:
-            raise TSBException(_("Read Error: other EEPROM page expected."))
-        
-        self.sendCommand(TSB_REQUEST)
-        self.waitRespond(TSB_CONFIRM)      
-        eepromdata = ''.join(eepromdata)
-        eepromdata = eepromdata.rstrip("\xFF") #Remove empty data
-
-        progress.result = eepromdata
-        yield(progress)
+    def eepromRead(self, sink=None):
+        return self.readMemory("e", self.device_info.eepromsize,
+                               _("Read EEPROM memory page error."), sink)
         
     
     def emergencyErase(self):
@@ -542,9 +841,30 @@ class TSBLoader:
         self.waitRespond(TSB_CONFIRM, EMERGENCY_ERASE_TIMEOUT)
   
 
-    def close(self):
-        self.sendCommand('q')
+    def setLowLatency(self):
+        """Switch the serial port to low latency mode, the previous setting
+        is restored by close()."""
+        import ports
+
+        if self.low_latency is None:
+            self.low_latency = ports.LowLatency(self.serial)
+            for message in self.low_latency.enable():
+                self.log(message)
+
+    def quit(self):
+        """Leave the bootloader and start the application. Serial port stays
+        open, TSB can be activated again."""
+        # Inactive bootloader would take 'q' for a part of the password
+        if self.state == TSBLoader.STATE_ACTIVE:
+            self.sendCommand('q')
         self.resetMCU()
+        self.state = TSBLoader.STATE_INIT
+
+    def close(self):
+        self.quit()
+        if self.low_latency is not None:
+            self.low_latency.restore()
+            self.low_latency = None
         self.serial.close()
         self.state = TSBLoader.STATE_CLOSE
     
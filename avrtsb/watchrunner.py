@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+# Sub-command watch - the job file is run on every newly connected serial
+# port. Boards are processed in parallel, each in own thread with own
+# ConsoleApp. One status line per board is printed, the full output of the
+# board is appended to the log file.
+
+import sys
+
+import pytsb
+from jobrunner import load_job, show_job_plan, unit_images
+from tsb_locale import *
+
+
+class WatchRunner(object):
+    def __init__(self, app):
+        self.app = app
+        self.args = app.args
+        self.stderr = app.stderr    # Error output of the worker threads
+
+    def watchPorts(self):
+        """Return set of device names of the watched ports"""
+        import fnmatch
+        import ports
+
+        if self.args.match:
+            return set(info.device for info in ports.comports()
+                       if fnmatch.fnmatch(info.device, self.args.match))
+        return set(info.device for info in ports.comports() if info.vid is not None)
+
+    def worker(self, tsb_job, steps, port, images, unit=None):
+        """Run the job on the port in own ConsoleApp, return (ok, output)"""
+        import time
+
+        sys.stdout.capture()
+        try:
+            if unit:
+                print(_("Unit: %s") % (unit,))
+            time.sleep(self.args.settle)
+            worker = pytsb.ConsoleApp(self.app.argv, stderr=self.stderr)
+            worker.images = images
+            worker.progress_bar = False
+            worker.runJobSteps(tsb_job, steps, port, unit)
+            ok = True
+        except Exception as e:
+            print(u"%s" % (e,))
+            ok = False
+        return ok, sys.stdout.release()
+
+    def logResult(self, port, ok, output):
+        import time
+
+        status = _("OK") if ok else _("FAILED")
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        print(_("%s  %-20s %s") % (timestamp, port, status))
+        with open(self.args.log, 'a') as log:
+            log.write("=== %s %s %s ===\n" % (timestamp, port, status.encode('utf-8')))
+            log.write(output)
+            if output and not output.endswith('\n'):
+                log.write('\n')
+
+    def run(self, parser):
+        """Poll the serial ports and start the job in the background on every
+        new port. Ports connected before the start are not programmed.
+        """
+        import time
+
+        app = self.app
+        tsb_job, steps = load_job(self.args.jobfile)
+        show_job_plan(tsb_job, steps, [self.args.match or _("new USB ports")])
+        app.checkJob(tsb_job, steps)
+
+        for filename, file_format, memory in tsb_job.images(steps):
+            app.loadImage(filename, file_format, memory)
+
+        known = self.watchPorts()
+        active = {}     # port: BackgroundTask
+        finished = 0
+        exhausted = False   # No unit data for the next port
+        print(_("Waiting for new serial ports, press Ctrl+C to stop."))
+
+        stdout, sys.stdout = sys.stdout, pytsb.ThreadOutput(sys.stdout)
+        self.stderr = pytsb.ThreadOutput(app.stderr, sys.stdout.buffers)
+        try:
+            while ((self.args.count <= 0) or (finished < self.args.count)) and \
+                    not (exhausted and not active):
+                current = self.watchPorts()
+                for port in sorted(current - known):
+                    if exhausted or \
+                            ((self.args.count > 0) and (len(active) + finished >= self.args.count)):
+                        break
+                    try:
+                        images, unit = unit_images(tsb_job, steps, app.images)
+                    except pytsb.AppException as e:
+                        app.stderr.write(_("%s New ports are not programmed.\n") % (e,))
+                        exhausted = True
+                        break
+                    active[port] = pytsb.BackgroundTask(self.worker, tsb_job, steps,
+                                                        port, images, unit)
+
+                # Port stays known while connected or processed
+                known = current | set(active)
+
+                for port, task in active.items():
+                    if task.finished:
+                        del active[port]
+                        self.logResult(port, *task.wait())
+                        finished += 1
+
+                time.sleep(self.args.interval)
+        except KeyboardInterrupt:
+            print(_("Waiting for %d running jobs.") % (len(active),))
+            for port, task in active.items():
+                self.logResult(port, *task.wait())
+        finally:
+            sys.stdout = stdout
+            self.stderr = app.stderr
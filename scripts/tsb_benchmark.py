@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks of the host side code of avrtsb. Protocol loops run against
+in-memory TSB device of the unit tests (tests/tsb_device.py) without any
+latency, so only the host overhead is measured.
+
+Results can be saved as JSON baseline and later runs compared with it,
+the script fails if some time is worse than baseline more than tolerance.
+scripts/tsb_benchmark_baseline.json is the baseline of the reference
+machine, save own baseline for other machines.
+
+Example of use:
+    python scripts/tsb_benchmark.py startup
+    python scripts/tsb_benchmark.py --save baseline.json
+    python scripts/tsb_benchmark.py --compare scripts/tsb_benchmark_baseline.json --tolerance 0.3
+"""
+import os, sys
+import argparse
+import json
+import random
+import subprocess
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from tests.tsb_device import FakeTSBDevice
+
+# Maximum time in milliseconds which the import of avrtsb.pytsb and creating
+# of the ConsoleApp can add to the bare interpreter startup. Measured time is
+# 30-50 ms, the budget catches eager import of heavy modules, not noise.
+STARTUP_BUDGET_MS = 80
+
+# Modules which shall not be imported by pytsb if the sub-command does not
+# need them
+STARTUP_LAZY_MODULES = ['serial', 'intelhex', 'avrtsb.firmware']
+
+STARTUP_CODE = (
+    "import sys\n"
+    "from avrtsb import pytsb\n"
+    "pytsb.ConsoleApp(['tsb', 'help'])\n"
+    "sys.stdout.write(' '.join(m for m in %r if m in sys.modules))\n"
+) % (STARTUP_LAZY_MODULES,)
+
+
+def run_python(code):
+    """Run code in the new interpreter and return (time in ms, stdout)"""
+    start = time.time()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT_DIR,
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    return (time.time() - start) * 1000, output
+
+
+def measure(function, repeat=5):
+    """Return the best time of the function call in ms"""
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        function()
+        times.append((time.time() - start) * 1000)
+    return min(times)
+
+
+def print_results(results):
+    for name in sorted(results):
+        print "%-22s: %8.2f ms" % (name, results[name])
+
+
+def test_image(size, seed=0):
+    """Return pseudo random data without SPM instruction"""
+    rnd = random.Random(seed)
+    data = ''.join(chr(rnd.randint(0, 255)) for i in xrange(size))
+    return data.replace('\xE8\x95', '\xE8\x94')
+
+
+def bench_startup(repeat=20):
+    """
+    Measure the time added by pytsb to the interpreter startup.
+    Return - (ok, results), ok is True if the time is in the budget and no
+    heavy module is imported
+    """
+    interpreter = min(run_python("pass")[0] for i in xrange(repeat))
+    results = [run_python(STARTUP_CODE) for i in xrange(repeat)]
+    startup = min(r[0] for r in results) - interpreter
+    imported = results[0][1].split()
+
+    print "Interpreter startup   : %.1f ms" % (interpreter,)
+    print "pytsb startup         : %.1f ms (budget %d ms)" % (startup, STARTUP_BUDGET_MS)
+    print "Eagerly imported      : %s" % (", ".join(imported) or "-",)
+    return (startup <= STARTUP_BUDGET_MS) and not imported, {'startup': startup}
+
+
+def bench_firmware():
+    """Firmware database load and lookups, firmware generation"""
+    from avrtsb import firmware
+
+    fw_db = firmware.FirmwareDB()
+    fw = fw_db.get_firmware('ATmega328P')
+    results = {
+        'db_load'      : measure(firmware.FirmwareDB),
+        'sig2name'     : measure(lambda: fw_db.sig2name((0x1E, 0x95, 0x0F))),
+        'get_firmware' : measure(lambda: fw_db.get_firmware('ATmega328P')),
+        'tobinstr'     : measure(fw.tobinstr),
+        'getihex'      : measure(fw.getihex),
+    }
+    print_results(results)
+    return True, results
+
+
+def bench_spm():
+    """SPM instruction check of 256 kB image"""
+    from avrtsb.tsbloader import TSBLoader
+
+    data = test_image(256 * 1024)
+    results = {'check4spm_256k': measure(lambda: TSBLoader.check4SPM(data))}
+    print_results(results)
+    return True, results
+
+
+def bench_hexfile():
+    """Intel HEX parsing and writing of 128 kB image"""
+    import tempfile
+    from avrtsb import pytsb
+
+    data = test_image(128 * 1024)
+    container = pytsb.DataFileContainer()
+    container.fromBinStr(data)
+
+    tmp_dir = tempfile.mkdtemp()
+    filename = os.path.join(tmp_dir, 'image.hex')
+    try:
+        results = {
+            'ihex_write_128k' : measure(lambda: container.toIntelHex(filename)),
+            'ihex_read_128k'  : measure(lambda: pytsb.DataFileContainer().fromFile(filename)),
+        }
+        loaded = pytsb.DataFileContainer()
+        loaded.fromFile(filename)
+        assert loaded.toBinStr() == data
+        results['tobinstr_128k'] = measure(lambda: loaded.image.tobinstr())
+    finally:
+        os.remove(filename)
+        os.rmdir(tmp_dir)
+
+    print_results(results)
+    return True, results
+
+
+def bench_protocol():
+    """Flash and EEPROM transfers with the in-memory device"""
+    from avrtsb.tsbloader import TSBLoader
+
+    device = FakeTSBDevice(pagesize=128, appflash=0x7000, eepromsize=1024)
+    tsb = TSBLoader(device)
+    tsb.delays = False
+    tsb.activateTSB()
+
+    flash_data = test_image(device.appflash)
+    eeprom_data = test_image(device.eepromsize, seed=1)
+
+    def run(generator):
+        for progress in generator:
+            pass
+        return progress.result
+
+    results = {
+        'flash_write'  : measure(lambda: run(tsb.flashWrite(flash_data))),
+        'flash_read'   : measure(lambda: run(tsb.flashRead())),
+        'flash_verify' : measure(lambda: run(tsb.flashVerify(flash_data))),
+        'eeprom_write' : measure(lambda: run(tsb.eepromWrite(eeprom_data))),
+        'eeprom_read'  : measure(lambda: run(tsb.eepromRead())),
+    }
+    assert run(tsb.flashRead())[:len(flash_data)] == flash_data
+    print_results(results)
+    return True, results
+
+
+def compare(results, baseline, tolerance):
+    """Print results worse than baseline, return True if all are in tolerance"""
+    ok = True
+    for bench in sorted(results):
+        for name, value in sorted(results[bench].items()):
+            base = baseline.get(bench, {}).get(name)
+            if base is None:
+                continue
+            if value > base * (1 + tolerance):
+                print "REGRESSION %s.%s: %.2f ms, baseline %.2f ms" % (bench, name, value, base)
+                ok = False
+    return ok
+
+
+BENCHMARKS = {
+    'startup'  : bench_startup,
+    'firmware' : bench_firmware,
+    'spm'      : bench_spm,
+    'hexfile'  : bench_hexfile,
+    'protocol' : bench_protocol,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of avrtsb host side code")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="Benchmarks to run, default all: %s" % (", ".join(sorted(BENCHMARKS.keys())),))
+    parser.add_argument("--save", metavar="FILENAME",
+                        help="Save results as JSON baseline")
+    parser.add_argument("--compare", metavar="FILENAME",
+                        help="Compare results with JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against baseline, default 0.25")
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: %s" % (name,))
+
+    ok = True
+    results = {}
+    for name in args.names or sorted(BENCHMARKS.keys()):
+        print "[%s]" % (name,)
+        bench_ok, results[name] = BENCHMARKS[name]()
+        ok = bench_ok and ok
+        print
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            ok = compare(results, json.load(file), args.tolerance) and ok
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    sys.exit(0 if ok else 1)
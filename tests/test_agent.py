@@ -0,0 +1,34 @@
+# -*- coding: UTF-8 -*-
+import unittest
+
+from avrtsb import agent
+
+
+class AgentTest(unittest.TestCase):
+    def test_check_file_name(self):
+        self.assertEqual(agent.check_file_name("0_app.hex"), "0_app.hex")
+        for name in ["", "-", "..", "../app.hex", "/etc/passwd", "dir/app.hex",
+                     "..\\app.hex", "C:\\app.hex"]:
+            self.assertRaises(agent.AgentError, agent.check_file_name, name)
+
+    def test_check_job(self):
+        agent.check_job({
+            'ports': ['COM1'],
+            'options': {'baudrate': 115200, 'password': 'secret'},
+            'operations': [{'op': 'flash-write', 'file': '0_app.hex', 'no_trim': True},
+                           {'op': 'flash-verify'}],
+        })
+
+    def test_check_job_rejects_paths(self):
+        job_def = {'operations': [{'op': 'flash-read', 'file': '../../app.hex'}]}
+        self.assertRaises(agent.AgentError, agent.check_job, job_def)
+
+    def test_check_job_rejects_options(self):
+        for job_def in [{'options': {'record': '/tmp/session.rec'}},
+                        {'operations': [{'op': 'eeprom-write', 'file': 'ee.hex',
+                                         'eeprom_cache': '/etc/passwd'}]}]:
+            self.assertRaises(agent.AgentError, agent.check_job, job_def)
+
+
+if __name__ == '__main__':
+    unittest.main()
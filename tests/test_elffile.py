@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+import struct
+import unittest
+
+from avrtsb import elffile
+from avrtsb import hexfile
+
+SHT_PROGBITS = 1
+SHT_STRTAB = 3
+
+
+def build_elf(sections, machine=elffile.EM_AVR):
+    """Return AVR ELF file like avr-gcc output. Sections are list of (name,
+    type, address, load address, data), a program header is made for every
+    section with the load address.
+    """
+    names = '\0' + ''.join(name + '\0' for name, t, a, l, d in sections) + '.shstrtab\0'
+    loadable = [section for section in sections if section[3] is not None]
+    offset = elffile.ELF_HEADER.size + elffile.PROGRAM_HEADER.size * len(loadable)
+
+    body = ''
+    program_headers = ''
+    section_headers = elffile.SECTION_HEADER.pack(*([0] * 10))
+    for name, sh_type, addr, load_addr, data in sections:
+        section_offset = offset + len(body)
+        if sh_type != elffile.SHT_NOBITS:
+            body += data
+        if load_addr is not None:
+            program_headers += elffile.PROGRAM_HEADER.pack(
+                elffile.PT_LOAD, section_offset, addr, load_addr, len(data), len(data), 5, 1)
+        section_headers += elffile.SECTION_HEADER.pack(
+            names.index(name + '\0'), sh_type, 2, addr, section_offset, len(data), 0, 0, 1, 0)
+
+    section_headers += elffile.SECTION_HEADER.pack(
+        names.index('.shstrtab'), SHT_STRTAB, 0, 0, offset + len(body), len(names), 0, 0, 1, 0)
+    body += names
+
+    header = elffile.ELF_HEADER.pack(
+        '\x7fELF\x01\x01\x01'.ljust(16, '\0'), 2, machine, 1, 0,
+        elffile.ELF_HEADER.size, offset + len(body), 0x85, elffile.ELF_HEADER.size,
+        elffile.PROGRAM_HEADER.size, len(loadable), elffile.SECTION_HEADER.size,
+        len(sections) + 2, len(sections) + 1)
+    return header + program_headers + body + section_headers
+
+
+TEXT = '\x0C\x94\x34\x00' * 8
+SECTIONS = [
+    ('.text', SHT_PROGBITS, 0, 0, TEXT),
+    ('.data', SHT_PROGBITS, 0x800100, len(TEXT), 'DATA01'),
+    ('.bss', elffile.SHT_NOBITS, 0x800106, None, 'xx'),
+    ('.eeprom', SHT_PROGBITS, 0x810000, 0x810000, 'EEPROM-123'),
+    ('.fuse', SHT_PROGBITS, 0x820000, 0x820000, '\xFF\xD9\xE2'),
+]
+
+
+class ReadElfTest(unittest.TestCase):
+    def test_flash(self):
+        image = elffile.read_elf(build_elf(SECTIONS))
+        self.assertEqual((image.minaddr(), image.maxaddr()), (0, len(TEXT) + 5))
+        self.assertEqual(image.tobinstr(), TEXT + 'DATA01')
+
+    def test_eeprom(self):
+        data = build_elf(SECTIONS)
+        names = [name for name, addr, section_data in elffile.ElfFile(data).sections()]
+        self.assertEqual(names, ['.text', '.data', '.eeprom', '.fuse', '.shstrtab'])
+
+        image = elffile.read_elf(data, 'eeprom')
+        self.assertEqual((image.minaddr(), image.tobinstr()), (0, 'EEPROM-123'))
+
+    def test_no_eeprom_section(self):
+        image = elffile.read_elf(build_elf(SECTIONS[:3]), 'eeprom')
+        self.assertEqual(len(image), 0)
+
+    def test_invalid_files(self):
+        data = build_elf(SECTIONS)
+        for invalid in [data[:40], 'PK\x03\x04' + data[4:], build_elf(SECTIONS, machine=3),
+                        data[:len(data) - 20]]:
+            self.assertRaises(hexfile.DataFileError, elffile.read_elf, invalid, 'eeprom')
+
+
+if __name__ == '__main__':
+    unittest.main()
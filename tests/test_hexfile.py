@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+import unittest
+from StringIO import StringIO
+
+from avrtsb import hexfile
+
+
+class ReadIntelHexTest(unittest.TestCase):
+    def test_read(self):
+        data = (hexfile.ihex_record(hexfile.IHEX_EXT_LINEAR_ADDR, 0, '\x00\x01') +
+                hexfile.ihex_record(hexfile.IHEX_DATA, 0x10, '\x01\x02\x03') +
+                hexfile.ihex_record(hexfile.IHEX_EOF, 0))
+        image = hexfile.read_ihex(data)
+        self.assertEqual(image.tobinstr(0x10010, 0x10012), '\x01\x02\x03')
+
+    def test_checksum_error(self):
+        self.assertRaises(hexfile.DataFileError, hexfile.read_ihex,
+                          ":0400000001020304F3\n")
+
+    def test_truncated_address_records(self):
+        for rectype, data in [(hexfile.IHEX_EXT_SEGMENT_ADDR, '\x10'),
+                              (hexfile.IHEX_EXT_LINEAR_ADDR, ''),
+                              (hexfile.IHEX_START_SEGMENT_ADDR, '\x00\x00\x01'),
+                              (hexfile.IHEX_START_LINEAR_ADDR, '\x00')]:
+            record = hexfile.ihex_record(rectype, 0, data)
+            self.assertRaises(hexfile.DataFileError, hexfile.read_ihex, record)
+
+
+class WriteIntelHexTest(unittest.TestCase):
+    def test_round_trip(self):
+        image = hexfile.MemoryImage()
+        image.puts(0x0000, ''.join(chr(i) for i in xrange(40)))
+        image.puts(0x0100, '\x55' * 3)
+        image.puts(0xFFF8, '\xAA' * 16)       # Crosses 64 kB boundary
+        image.start_record = (hexfile.IHEX_START_LINEAR_ADDR, '\x00\x00\x01\x00')
+
+        file = StringIO()
+        hexfile.write_ihex(image, file)
+        loaded = hexfile.read_ihex(file.getvalue())
+
+        self.assertEqual(loaded.segments, image.segments)
+        self.assertEqual(loaded.start_record, image.start_record)
+        self.assertIn(hexfile.ihex_record(hexfile.IHEX_EXT_LINEAR_ADDR, 0, '\x00\x01'),
+                      file.getvalue())
+        self.assertTrue(file.getvalue().endswith(hexfile.ihex_record(hexfile.IHEX_EOF, 0)))
+
+    def test_records_do_not_cross_64k(self):
+        file = StringIO()
+        writer = hexfile.IntelHexWriter(file)
+        writer.write(0xFFF8, '\x01' * 16)
+        writer.close()
+        lines = file.getvalue().splitlines()
+
+        self.assertEqual(lines[0], hexfile.ihex_record(hexfile.IHEX_DATA, 0xFFF8, '\x01' * 8).strip())
+        self.assertEqual(lines[2], hexfile.ihex_record(hexfile.IHEX_DATA, 0x0000, '\x01' * 8).strip())
+
+    def test_raw_round_trip(self):
+        image = hexfile.MemoryImage()
+        image.puts(0x10, '\x01\x02')
+        image.puts(0x20, '\x03')
+
+        file = StringIO()
+        hexfile.write_raw(image, file)
+        self.assertEqual(file.getvalue(), '\x01\x02' + '\xFF' * 14 + '\x03')
+        self.assertEqual(hexfile.read_raw(file.getvalue(), 0x10).tobinstr(), file.getvalue())
+
+    def test_trimmed_writer(self):
+        file = StringIO()
+        writer = hexfile.TrimmedWriter(hexfile.RawWriter(file))
+        for addr, page in [(0, '\x01\xFF'), (2, '\xFF\xFF'), (4, '\x02\xFF'), (6, '\xFF\xFF')]:
+            writer.write(addr, page)
+        writer.close()
+        self.assertEqual(file.getvalue(), '\x01\xFF\xFF\xFF\x02')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from avrtsb import job
+from avrtsb import pytsb
+from avrtsb.tsbloader import TSBLoader
+
+from tests.tsb_device import FakeTSBDevice
+
+
+class JobPlanTest(unittest.TestCase):
+    def makeJob(self, operations, ports=None):
+        tsb_job = job.Job()
+        tsb_job.fromDict({'ports': ports or ['COM1'], 'operations': operations})
+        return tsb_job
+
+    def test_erase_dropped_before_write(self):
+        tsb_job = self.makeJob([{'op': 'flash-erase'},
+                                {'op': 'flash-write', 'file': 'app.hex'},
+                                {'op': 'eeprom-erase'},
+                                {'op': 'eeprom-write', 'file': 'ee.hex'}])
+        steps = tsb_job.plan()
+
+        self.assertEqual([step.op for step in steps],
+                         ['flash-write', 'eeprom-erase', 'eeprom-write'])
+        self.assertEqual([step.op for step, reason in tsb_job.dropped], ['flash-erase'])
+
+    def test_erase_kept_before_verify(self):
+        tsb_job = self.makeJob([{'op': 'flash-erase'},
+                                {'op': 'flash-verify', 'file': 'app.hex'}])
+        self.assertEqual([step.op for step in tsb_job.plan()], ['flash-erase', 'flash-verify'])
+
+    def test_verify_inherits_written_file(self):
+        tsb_job = self.makeJob([{'op': 'flash-write', 'file': 'app.bin', 'flash_file_format': 'raw'},
+                                {'op': 'eeprom-write', 'file': 'ee.hex'},
+                                {'op': 'flash-verify', 'fail_fast': 1},
+                                {'op': 'eeprom-verify'}])
+        write, ee_write, verify, ee_verify = tsb_job.plan()
+
+        self.assertEqual(verify.filename, 'app.bin')
+        self.assertEqual(verify.options, {'fail_fast': 1, 'flash_file_format': 'raw'})
+        self.assertEqual((ee_verify.filename, ee_verify.file_format), ('ee.hex', 'auto'))
+        self.assertEqual(tsb_job.images([write, verify]), [('app.bin', 'raw', 'flash')])
+
+    def test_verify_without_written_file(self):
+        tsb_job = self.makeJob([{'op': 'eeprom-verify'}])
+        self.assertRaises(job.JobError, tsb_job.plan)
+
+    def test_read_file_per_port(self):
+        tsb_job = self.makeJob([{'op': 'flash-read', 'file': 'app.hex'}])
+        steps = tsb_job.plan()
+        tsb_job.checkOutputs(steps, ['COM1'])
+        self.assertRaises(job.JobError, tsb_job.checkOutputs, steps, ['COM1', 'COM2'])
+        self.assertRaises(job.JobError, tsb_job.checkOutputs, steps, None)
+
+        tsb_job = self.makeJob([{'op': 'flash-read', 'file': 'app_{port}.hex'}])
+        steps = tsb_job.plan()
+        tsb_job.checkOutputs(steps, None)
+        self.assertEqual(steps[0].forUnit('/dev/ttyUSB1').filename, 'app_ttyUSB1.hex')
+
+    def test_unit_requires_personalisation(self):
+        tsb_job = self.makeJob([{'op': 'eeprom-read', 'file': 'ee_{unit}.hex'}])
+        self.assertRaises(job.JobError, tsb_job.checkOutputs, tsb_job.plan(), ['COM1'])
+
+    def test_unit_file_name(self):
+        self.assertEqual(job.unit_file_name('out/{port}.hex', 'COM3'), 'out/COM3.hex')
+        self.assertEqual(job.unit_file_name('{port}.hex', '1-1.2:1.0'), '1-1.2_1.0.hex')
+        self.assertEqual(job.unit_file_name('ee_{unit}.hex', 'COM3', 'serial=0001, mac=00:11'),
+                         'ee_serial_0001_mac_00_11.hex')
+
+
+class JobRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_on_more_ports(self):
+        devices = {'/dev/ttyUSB0': FakeTSBDevice(), '/dev/ttyUSB1': FakeTSBDevice()}
+        devices['/dev/ttyUSB0'].eeprom[0] = 0x01
+        devices['/dev/ttyUSB1'].eeprom[0] = 0x02
+
+        def openTSB(devicename):
+            tsb = TSBLoader(devices[devicename])
+            tsb.delays = False
+            return tsb
+
+        filename = os.path.join(self.tmp_dir, 'job.json')
+        with open(filename, 'w') as file:
+            json.dump({'ports': sorted(devices),
+                       'options': {'eeprom_file_format': 'raw'},
+                       'operations': [{'op': 'eeprom-read', 'file': 'ee_{port}.bin'}]}, file)
+        app = pytsb.ConsoleApp(['job', filename], stderr=StringIO())
+        app.openTSB = openTSB
+
+        app.run()
+        self.assertIn("Job finished OK", sys.stdout.getvalue())
+        for name, first in [('ee_ttyUSB0.bin', '\x01'), ('ee_ttyUSB1.bin', '\x02')]:
+            with open(os.path.join(self.tmp_dir, name), 'rb') as file:
+                self.assertEqual(file.read(1), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from avrtsb import ports
+
+
+class SysfsTest(unittest.TestCase):
+    """Ports read from sysfs tree made in the temporary directory"""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.saved = (ports.SYSFS_TTY, ports.DEV_DIR, ports._cache)
+        ports.SYSFS_TTY = self.makeDir('sys', 'class', 'tty')
+        ports.DEV_DIR = self.makeDir('dev')
+
+    def tearDown(self):
+        ports.SYSFS_TTY, ports.DEV_DIR, ports._cache = self.saved
+        shutil.rmtree(self.tmp_dir)
+
+    def makeDir(self, *path):
+        path = os.path.join(self.tmp_dir, *path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def writeAttrs(self, path, **attrs):
+        for name, value in attrs.items():
+            with open(os.path.join(path, name), 'w') as file:
+                file.write(value + '\n')
+
+    def addTTY(self, name, device_path, subsystem, **attrs):
+        """Add tty with the device in the subsystem, return tty directory"""
+        os.symlink(self.makeDir('sys', 'bus', subsystem), os.path.join(device_path, 'subsystem'))
+        tty_path = self.makeDir('sys', 'class', 'tty', name)
+        os.symlink(device_path, os.path.join(tty_path, 'device'))
+        self.writeAttrs(tty_path, **attrs)
+        open(os.path.join(ports.DEV_DIR, name), 'w').close()
+        return tty_path
+
+    def addUsbPort(self, name, serial, location='1-1.2:1.0', subsystem='usb-serial'):
+        usb_path = self.makeDir('sys', 'devices', 'usb1', serial, location.split(':')[0])
+        self.writeAttrs(usb_path, idVendor='0403', idProduct='6001', serial=serial,
+                        manufacturer='FTDI', product='FT232R USB UART')
+        interface_path = self.makeDir(usb_path, location)
+        if subsystem == 'usb-serial':
+            device_path = self.makeDir(interface_path, name)
+        else:
+            device_path = interface_path
+        return self.addTTY(name, device_path, subsystem)
+
+    def test_usb_serial_port(self):
+        self.addUsbPort('ttyUSB0', 'A50285BI')
+        info, = ports.PortCache().comports()
+
+        self.assertEqual(info.device, os.path.join(ports.DEV_DIR, 'ttyUSB0'))
+        self.assertEqual((info.vid, info.pid), (0x0403, 0x6001))
+        self.assertEqual(info.serial_number, 'A50285BI')
+        self.assertEqual(info.location, '1-1.2:1.0')
+        self.assertEqual(info.description, 'FT232R USB UART')
+        self.assertEqual(info.hwid, 'USB VID:PID=0403:6001 SER=A50285BI LOCATION=1-1.2:1.0')
+
+    def test_usb_acm_port(self):
+        self.addUsbPort('ttyACM0', '85734323', location='1-2:1.0', subsystem='usb')
+        info, = ports.PortCache().comports()
+
+        self.assertEqual(info.subsystem, 'usb')
+        self.assertEqual(info.serial_number, '85734323')
+        self.assertEqual(info.location, '1-2:1.0')
+
+    def test_ports_without_hardware(self):
+        self.addTTY('ttyS0', self.makeDir('sys', 'devices', 'pnp0', '00:01'), 'pnp', type='4')
+        self.addTTY('ttyS1', self.makeDir('sys', 'devices', 'pnp0', '00:02'), 'pnp', type='0')
+        self.addTTY('ttyS2', self.makeDir('sys', 'devices', 'platform', 'serial8250'), 'platform')
+        self.makeDir('sys', 'class', 'tty', 'tty0')     # Virtual terminal
+
+        names = [info.name for info in ports.PortCache().comports()]
+        self.assertEqual(names, ['ttyS0'])
+
+    def test_adapter_replaced_under_same_name(self):
+        cache = ports.PortCache()
+        tty_path = self.addUsbPort('ttyUSB0', 'A50285BI')
+        self.assertEqual(cache.comports()[0].serial_number, 'A50285BI')
+
+        # Old directory and device file are kept, so their inodes are not
+        # reused by the new ones
+        os.rename(tty_path, os.path.join(self.tmp_dir, 'old_tty'))
+        os.rename(os.path.join(ports.DEV_DIR, 'ttyUSB0'), os.path.join(self.tmp_dir, 'old_dev'))
+        self.addUsbPort('ttyUSB0', 'A10K4ZQT')
+        os.utime(ports.SYSFS_TTY, (0, 0))
+
+        self.assertEqual(cache.comports()[0].serial_number, 'A10K4ZQT')
+
+    def test_find_port(self):
+        self.addUsbPort('ttyUSB0', 'A50285BI', location='1-1.2:1.0')
+        self.addUsbPort('ttyUSB1', 'A10K4ZQT', location='1-1.3:1.0')
+        ports._cache = ports.PortCache()
+
+        self.assertEqual(ports.find_port('A10K4ZQT').name, 'ttyUSB1')
+        self.assertEqual(ports.find_port('1-1.2:1.0').name, 'ttyUSB0')
+        self.assertEqual(ports.resolve_port('1-1.3:1.0'), os.path.join(ports.DEV_DIR, 'ttyUSB1'))
+        self.assertEqual(ports.resolve_port('COM7'), 'COM7')
+
+
+if __name__ == '__main__':
+    unittest.main()
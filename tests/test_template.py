@@ -0,0 +1,25 @@
+# -*- coding: UTF-8 -*-
+import unittest
+
+from avrtsb import template
+
+
+class FieldTest(unittest.TestCase):
+    def test_encode_decimal_with_leading_zeros(self):
+        field = template.Field('serial', 'eeprom', 0, 2, 'uint-be')
+        self.assertEqual(field.encode('0100'), '\x00\x64')
+        self.assertEqual(field.encode('0009'), '\x00\x09')
+
+    def test_encode_hexadecimal(self):
+        field = template.Field('serial', 'eeprom', 0, 2, 'uint-le')
+        self.assertEqual(field.encode('0x0100'), '\x00\x01')
+        self.assertEqual(field.encode(0x1234), '\x34\x12')
+
+    def test_encode_invalid_number(self):
+        field = template.Field('serial', 'eeprom', 0, 2, 'uint-le')
+        for value in ['0o17', '0b11', '1A', '-1', '65536']:
+            self.assertRaises(template.TemplateError, field.encode, value)
+
+
+if __name__ == '__main__':
+    unittest.main()
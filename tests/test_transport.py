@@ -0,0 +1,91 @@
+# -*- coding: UTF-8 -*-
+import unittest
+from StringIO import StringIO
+
+from avrtsb import transport
+from avrtsb.tsbloader import TSBLoader
+
+from tests.tsb_device import FakeTSBDevice
+
+
+def run(generator):
+    """Run the transfer, return the last progress"""
+    progress = None
+    for progress in generator:
+        pass
+    return progress
+
+
+class RecordFile(StringIO):
+    """Record file which keeps its content after close"""
+    def close(self):
+        self.content = self.getvalue()
+        StringIO.close(self)
+
+
+class RecordReplayTest(unittest.TestCase):
+    def session(self, serial, data):
+        """Activate TSB, write and read back EEPROM, return the content read"""
+        tsb = TSBLoader(serial)
+        tsb.delays = False
+        tsb.log = lambda message: None
+        tsb.activateTSB()
+        run(tsb.eepromWrite(data))
+        result = run(tsb.eepromRead()).result
+        tsb.close()
+        return result
+
+    def record(self, data):
+        device = FakeTSBDevice()
+        record = RecordFile()
+        result = self.session(transport.RecordingSerial(device, record), data)
+        return result, record.content
+
+    def test_replay(self):
+        data = '\x01\x02\x03' * 50
+        result, record = self.record(data)
+        self.assertEqual(result[:len(data)], data)
+
+        events = [event for event, record_time, payload in
+                  transport.read_records(StringIO(record))]
+        self.assertIn(transport.EVENT_DTR, events)
+        self.assertEqual(events[-1], transport.EVENT_CLOSE)
+
+        replay = transport.ReplaySerial(StringIO(record))
+        self.assertEqual(self.session(replay, data), result)
+        self.assertFalse(replay.diverged)
+
+    def test_replay_divergence(self):
+        data = '\x01\x02\x03' * 50
+        result, record = self.record(data)
+
+        replay = transport.ReplaySerial(StringIO(record))
+        changed = data[:70] + '\x00' + data[71:]
+        with self.assertRaises(transport.TransportError) as context:
+            self.session(replay, changed)
+        # The second page is written with the confirmation character
+        self.assertIn("at byte 7: '\\x00", str(context.exception))
+        self.assertTrue(replay.diverged)
+        # Next writes are ignored, e.g. while the port is closed
+        self.assertEqual(replay.write('q'), 1)
+
+    def test_replay_long_write(self):
+        record = RecordFile()
+        serial = transport.RecordingSerial(FakeTSBDevice(), record)
+        serial.write('x' * (transport.MAX_PAYLOAD + 10))
+        serial.close()
+
+        records = transport.read_records(StringIO(record.content))
+        self.assertEqual([len(payload) for event, record_time, payload in records[:2]],
+                         [transport.MAX_PAYLOAD, 10])
+        replay = transport.ReplaySerial(StringIO(record.content))
+        self.assertEqual(replay.write('x' * (transport.MAX_PAYLOAD + 10)), transport.MAX_PAYLOAD + 10)
+
+    def test_invalid_record(self):
+        self.assertRaises(transport.TransportError, transport.read_records, StringIO('PNG'))
+        record = transport.MAGIC + transport.REC_HEADER.pack(transport.EVENT_READ, 0, 10) + 'abc'
+        self.assertRaises(transport.TransportError, transport.read_records, StringIO(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
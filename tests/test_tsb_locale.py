@@ -0,0 +1,42 @@
+# -*- coding: UTF-8 -*-
+import unittest
+
+from avrtsb import pytsb
+from avrtsb import tsb_locale
+from avrtsb.tsb_locale import _l
+
+
+class PrefixTranslation(object):
+    def ugettext(self, message):
+        return u'Č ' + message
+
+
+class LazyStringTest(unittest.TestCase):
+    def setUp(self):
+        self.translation = tsb_locale._translation
+
+    def tearDown(self):
+        tsb_locale._translation = self.translation
+
+    def test_translated_when_used(self):
+        tsb_locale._translation = PrefixTranslation()
+        message = _l("Show %(prog)s info")
+
+        self.assertEqual(u"%s" % (message,), u"Č Show %(prog)s info")
+        self.assertEqual(message % {'prog': 'pytsb'}, u"Č Show pytsb info")
+        self.assertEqual(message.splitlines(), [u"Č Show %(prog)s info"])
+        self.assertTrue('%(prog)' in message)
+
+    def test_parser_does_not_load_catalog(self):
+        tsb_locale._translation = None
+        app = pytsb.ConsoleApp(['tsb', 'COM1', '-i'])
+        app.parser.parse_args(app.argv)
+        self.assertIsNone(tsb_locale._translation)
+
+        tsb_locale._translation = PrefixTranslation()
+        self.assertIn(u"Č Show bootloader and device info", app.parser_tsb.format_help())
+        self.assertIn(u"Č Console Tool for TinySafeBoot", app.parser.format_help())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,380 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from avrtsb import pytsb
+from avrtsb.tsbloader import TSBException, TSBLoader
+
+from tests.tsb_device import FakeTSBDevice
+
+
+def run(generator):
+    """Run the transfer, return the last progress"""
+    progress = None
+    for progress in generator:
+        pass
+    return progress
+
+
+class DroppingTSBDevice(FakeTSBDevice):
+    """Device which sends only a part of the page drop_page (counted from 1)
+    and does not answer until it is reset by DTR."""
+    def __init__(self, drop_page, **kwargs):
+        FakeTSBDevice.__init__(self, **kwargs)
+        self.drop_page = drop_page
+
+    def write(self, data):
+        FakeTSBDevice.write(self, data)
+        if self.page_reads == self.drop_page:
+            self.drop_page = None
+            del self.output[-10:]
+            self.need = 0
+        return len(data)
+
+
+class GarbledTSBDevice(FakeTSBDevice):
+    """Device which sends the answers instead of the info header after the
+    next activations (framing errors at high baudrate)."""
+    def __init__(self, answers, **kwargs):
+        FakeTSBDevice.__init__(self, **kwargs)
+        self.answers = list(answers)
+
+    def header(self):
+        if self.answers:
+            return self.answers.pop(0)
+        return FakeTSBDevice.header(self)
+
+
+class TSBLoaderTest(unittest.TestCase):
+    def activate(self, device, password=""):
+        tsb = TSBLoader(device)
+        tsb.delays = False
+        tsb.log = lambda message: None
+        tsb.password = password
+        tsb.activateTSB()
+        return tsb
+
+    def test_activation_with_password(self):
+        device = FakeTSBDevice(password="secret")
+        tsb = self.activate(device, "secret")
+        self.assertEqual(tsb.device_info.pagesize, device.pagesize)
+        self.assertEqual(tsb.device_info.password, "secret")
+
+    def test_activation_password_not_sent_without_password(self):
+        # TSB without password would take the password for commands
+        device = FakeTSBDevice()
+        device.flash[:4] = '\x01\x02\x03\x04'
+        tsb = self.activate(device, "FEC")
+        self.assertEqual(tsb.device_info.appflash, device.appflash)
+        self.assertEqual(device.commands, ['c'])
+        self.assertEqual(device.flash[:4], bytearray('\x01\x02\x03\x04'))
+
+    def test_close_resets_mcu(self):
+        for activate in [True, False]:
+            device = FakeTSBDevice()
+            tsb = TSBLoader(device)
+            tsb.delays = False
+            if activate:
+                tsb.activateTSB()
+            written = []
+            device.write = lambda data: written.append(data)
+            tsb.resetMCU = lambda: written.append('reset')
+
+            tsb.close()
+            self.assertEqual(written, ['q', 'reset'] if activate else ['reset'])
+            self.assertEqual(tsb.state, TSBLoader.STATE_CLOSE)
+
+    def test_activation_garbage_before_header(self):
+        device = FakeTSBDevice()
+        device = GarbledTSBDevice(['\x00\xF0TS\xFE' + device.header()])
+        tsb = self.activate(device)
+
+        self.assertEqual(device.resets, 1)
+        self.assertEqual(device.commands, ['c'])
+        self.assertEqual(tsb.device_info.eepromsize, device.eepromsize)
+
+    def test_activation_repeated_after_invalid_header(self):
+        device = GarbledTSBDevice(['\xF8\x80' * 12])
+        messages = []
+        tsb = TSBLoader(device)
+        tsb.delays = False
+        tsb.log = messages.append
+        tsb.activateTSB()
+
+        self.assertEqual(device.resets, 2)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(tsb.device_info.pagesize, device.pagesize)
+
+    def test_activation_invalid_header(self):
+        device = GarbledTSBDevice(['\xF8\x80' * 12] * 3)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.assertRaises(TSBException, self.activate, device)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(device.resets, 3)
+
+    def test_flash_write_blank_image(self):
+        device = FakeTSBDevice()
+        device.flash[:4] = '\x01\x02\x03\x04'
+        tsb = self.activate(device)
+
+        progress = run(tsb.flashWrite('\xFF' * 1024))
+        self.assertTrue(progress.result)
+        self.assertEqual(progress.total, 0)
+        self.assertEqual(progress.skipped_pages, 1024 / device.pagesize)
+        self.assertEqual(device.flash, bytearray('\xFF' * device.appflash))
+
+    def test_read_resumed_after_dropped_page(self):
+        device = DroppingTSBDevice(drop_page=3)
+        device.eeprom[:] = ''.join(chr(i % 251) for i in xrange(device.eepromsize))
+        tsb = self.activate(device)
+        tsb.read_retries = 1
+
+        pages = []
+        progress = run(tsb.eepromRead(lambda addr, page: pages.append((addr, bytes(page)))))
+        self.assertEqual(progress.retries, 1)
+        self.assertEqual(device.resets, 2)
+        # Pages received before the error are read again, but passed only once
+        self.assertEqual(device.page_reads, 3 + 4)
+        self.assertEqual([addr for addr, page in pages], range(0, device.eepromsize, device.pagesize))
+        self.assertEqual(''.join(page for addr, page in pages), bytes(device.eeprom))
+
+    def test_read_error_without_retries(self):
+        device = DroppingTSBDevice(drop_page=2)
+        tsb = self.activate(device)
+
+        self.assertRaises(TSBException, run, tsb.eepromRead())
+        self.assertEqual(device.resets, 1)
+
+    def test_send_page_without_buffers(self):
+        device = FakeTSBDevice()
+        tsb = self.activate(device)
+        tsb.tx_buffer = bytearray()
+
+        tsb.sendCommand('E')
+        tsb.waitRespond('?')
+        tsb.sendPage('\x55' * device.pagesize)
+        tsb.waitRespond('?')
+        self.assertEqual(device.eeprom[:device.pagesize], bytearray('\x55' * device.pagesize))
+
+    def test_flash_erase_checks_first_page(self):
+        device = FakeTSBDevice()
+        tsb = self.activate(device)
+
+        progress = run(tsb.flashErase())
+        self.assertEqual(progress.mismatches, [])
+        self.assertEqual(device.page_reads, 1)
+
+        device.page_reads = 0
+        run(tsb.flashErase(verify=True))
+        self.assertEqual(device.page_reads, device.appflash / device.pagesize)
+
+    def test_verify_fail_fast(self):
+        device = FakeTSBDevice()
+        pagesize = device.pagesize
+        data = ''.join(chr(i % 251) for i in xrange(4 * pagesize))
+        device.flash[:len(data)] = data
+        device.flash[pagesize + 5] = 0x00
+        device.flash[3 * pagesize] = 0x00
+        tsb = self.activate(device)
+
+        progress = run(tsb.flashVerify(data, max_mismatches=1))
+        self.assertEqual(progress.mismatches, [pagesize])
+        self.assertEqual(progress.stop_addr, 2 * pagesize)
+        self.assertEqual(device.page_reads, 2)
+        self.assertEqual(progress.result, bytes(device.flash[:2 * pagesize]))
+
+        # Reading was stopped, TSB accepts next command
+        device.page_reads = 0
+        progress = run(tsb.flashVerify(data))
+        self.assertEqual(progress.mismatches, [pagesize, 3 * pagesize])
+        self.assertEqual(progress.stop_addr, None)
+        self.assertEqual(device.page_reads, 4)
+
+    def test_eeprom_delta_size(self):
+        tsb = self.activate(FakeTSBDevice())
+        current = '\x11' * 256
+
+        self.assertEqual(tsb.eepromDeltaSize('\x11' * 192, current), 0)
+        self.assertEqual(tsb.eepromDeltaSize('\x22' + '\x11' * 191, current), 64)
+        # Pages up to the last changed one are written, data are padded with 0xFF
+        self.assertEqual(tsb.eepromDeltaSize('\x11' * 130 + '\x22', current), 192)
+        self.assertEqual(tsb.eepromDeltaSize('\x11' * 150, current), 192)
+        self.assertEqual(tsb.eepromDeltaSize('\x11' * 128, '\x11' * 100), 128)
+        self.assertEqual(tsb.eepromDeltaSize('', current), 0)
+
+
+class DataFileContainerTest(unittest.TestCase):
+    def test_get_intel_hex(self):
+        file_container = pytsb.DataFileContainer()
+        file_container.fromBinStr('\x01\x02', 0x10)
+        file_container.fromBinStr('\x03', 0x20)
+
+        ihex = file_container.getIntelHex()
+        self.assertEqual(ihex.segments(), [(0x10, 0x12), (0x20, 0x21)])
+        self.assertEqual(ihex.tobinstr(0x10, 0x20), file_container.toBinStr())
+
+
+class ConsoleAppTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp_dir)
+
+    def writeFile(self, name, data):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'wb') as file:
+            file.write(data)
+        return filename
+
+    def consoleApp(self, device, argv):
+        app = pytsb.ConsoleApp(argv)
+        app.args = app.parser.parse_args(argv)
+        app.progress_bar = False
+        app.tsb = TSBLoader(device)
+        app.tsb.delays = False
+        app.tsb.activateTSB()
+        return app
+
+    def test_flash_write_blank_image(self):
+        filename = self.writeFile('blank.hex', ":04000000FFFFFFFF00\n:00000001FF\n")
+        device = FakeTSBDevice()
+        device.flash[:2] = '\x0C\x94'
+        app = self.consoleApp(device, ['tsb', 'COM1', '-fw', filename])
+
+        app.flashWrite()
+        self.assertIn("FLASH Write OK", sys.stdout.getvalue())
+        self.assertEqual(device.flash, bytearray('\xFF' * device.appflash))
+
+    def test_flash_erase_reports_checked_range(self):
+        device = FakeTSBDevice()
+        app = self.consoleApp(device, ['tsb', 'COM1', '-fe'])
+        app.flashErase()
+        self.assertIn("First page is blank", sys.stdout.getvalue())
+
+        sys.stdout = StringIO()
+        app = self.consoleApp(FakeTSBDevice(), ['tsb', 'COM1', '-fe', '--verify-erase'])
+        app.flashErase()
+        self.assertNotIn("First page is blank", sys.stdout.getvalue())
+        self.assertIn("FLASH Erase OK", sys.stdout.getvalue())
+
+    def test_verify_report_json(self):
+        filename = self.writeFile('app.hex', ":0400000001020304F2\n:00000001FF\n")
+        device = FakeTSBDevice()
+        device.flash[:4] = '\x01\x02\x03\x04'
+        app = self.consoleApp(device, ['tsb', 'COM1', '-fv', filename,
+                                       '--verify-report', 'json'])
+        app.stdout = StringIO()
+
+        app.flashVerify()
+        self.assertTrue(json.loads(app.stdout.getvalue())['ok'])
+        self.assertIn("Verify flash", sys.stdout.getvalue())
+
+    def test_verify_report_json_fail_fast(self):
+        filename = self.writeFile('app.hex', ":0400000001020304F2\n:00000001FF\n")
+        device = FakeTSBDevice()
+        device.flash[:4] = '\x01\x00\x03\x00'
+        app = self.consoleApp(device, ['tsb', 'COM1', '-fv', filename, '--fail-fast',
+                                       '--verify-report', 'json'])
+        app.stdout = StringIO()
+
+        app.flashVerify()
+        report = json.loads(app.stdout.getvalue())
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['stop_addr'], device.pagesize)
+        self.assertEqual(report['mismatch_count'], 2)
+        self.assertEqual(report['ranges'], [{'start': 1, 'end': 2, 'length': 1},
+                                            {'start': 3, 'end': 4, 'length': 1}])
+
+    def test_eeprom_write_empty_image(self):
+        device = FakeTSBDevice()
+        filename = self.writeFile('empty.hex', ":00000001FF\n")
+        app = self.consoleApp(device, ['tsb', 'COM1', '-ew', filename])
+
+        app.eepromWrite()
+        self.assertIn("nothing to write", sys.stdout.getvalue())
+        self.assertNotIn('E', device.commands)
+
+    def test_eeprom_write_elf_without_eeprom(self):
+        device = FakeTSBDevice()
+        header = struct.pack('<16sHHIIIIIHHHHHH', '\x7fELF\x01\x01\x01'.ljust(16, '\0'),
+                             2, 83, 1, 0, 0, 0, 0, 52, 32, 0, 40, 0, 0)
+        filename = self.writeFile('firmware.elf', header)
+        app = self.consoleApp(device, ['tsb', 'COM1', '-ew', filename])
+
+        app.eepromWrite()
+        self.assertIn("no .eeprom section", sys.stdout.getvalue())
+        self.assertNotIn('E', device.commands)
+
+    def eepromDevice(self, unit_id):
+        device = FakeTSBDevice()
+        device.eeprom[:] = ''.join(chr(i) for i in xrange(device.eepromsize))
+        device.eeprom[0:4] = unit_id
+        return device
+
+    def test_eeprom_delta_write(self):
+        device = self.eepromDevice('UN01')
+        data = str(device.eeprom)
+        data = data[:70] + '\x00' + data[71:]
+        filename = self.writeFile('eeprom.bin', data)
+        app = self.consoleApp(device, ['tsb', 'COM1', '-ew', filename, '--delta'])
+
+        app.eepromWrite()
+        self.assertIn("Skipped 2 unchanged EEPROM pages", sys.stdout.getvalue())
+        self.assertEqual(device.page_reads, 4)
+        self.assertEqual(device.eeprom[70], 0)
+
+    def test_eeprom_delta_write_cache(self):
+        cache = os.path.join(self.tmp_dir, 'eeprom.json')
+        board_1 = self.eepromDevice('UN01')
+        board_2 = self.eepromDevice('UN02')
+        data = str(board_1.eeprom[:200])
+        filename = self.writeFile('eeprom.bin', data[:150] + '\x00' + data[151:])
+        argv = ['tsb', 'COM1', '-ew', filename, '--delta',
+                '--eeprom-cache', cache, '--unit-id', '0:4']
+
+        self.consoleApp(board_1, argv).eepromWrite()
+        self.assertEqual(board_1.page_reads, 4)
+        self.assertTrue(os.path.exists(cache))
+
+        # Only the page with the unit ID is read back
+        board = FakeTSBDevice()
+        board.eeprom[:] = board_1.eeprom
+        self.consoleApp(board, argv).eepromWrite()
+        self.assertEqual(board.page_reads, 1)
+        self.assertIn("Skipped 4 unchanged EEPROM pages", sys.stdout.getvalue())
+
+        # Other board on the same port is recognized by the unit ID
+        self.consoleApp(board_2, argv).eepromWrite()
+        self.assertIn("is not valid for the board", sys.stdout.getvalue())
+        self.assertEqual(board_2.page_reads, 1 + 4)
+        self.assertEqual(board_2.eeprom[150], 0)
+
+    def test_eeprom_cache_requires_unit_id(self):
+        filename = self.writeFile('eeprom.bin', '\x00' * 10)
+        app = self.consoleApp(FakeTSBDevice(), ['tsb', 'COM1', '-ew', filename, '--delta',
+                                                '--eeprom-cache', 'eeprom.json'])
+        self.assertRaises(pytsb.AppException, app.eepromWrite)
+
+    def test_job_errors_to_given_stderr(self):
+        filename = self.writeFile('job.json', '{"operations": [{"op": "info"}]}')
+        stderr = StringIO()
+        app = pytsb.ConsoleApp(['job', filename], stderr=stderr)
+
+        app.run()
+        self.assertIn("no port given", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
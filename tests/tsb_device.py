@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+"""
+In-memory TSB device with the serial port interface, used by the unit tests.
+Answers are available immediately after the command is written.
+"""
+import struct
+
+
+class FakeTSBDevice(object):
+    def __init__(self, pagesize=64, appflash=0x1000, eepromsize=256,
+                 password=""):
+        self.pagesize = pagesize
+        self.appflash = appflash
+        self.eepromsize = eepromsize
+        self.password = password
+        self.flash = bytearray('\xFF' * appflash)
+        self.eeprom = bytearray('\xFF' * eepromsize)
+        self.userdata = (struct.pack("<HB", 0, 200) + password).ljust(pagesize, '\xFF')
+        self.commands = []      # Commands received from the host
+        self.page_reads = 0
+        self.resets = 0
+        self.timeout = 0.05
+        self.baudrate = 115200
+        self.output = bytearray()
+        self.reset()
+
+    def reset(self):
+        """Restart the bootloader, data being received are lost"""
+        self.input = bytearray()
+        self.protocol = self.run()
+        self.need = next(self.protocol)
+
+    def write(self, data):
+        self.input.extend(data)
+        while self.need and (len(self.input) >= self.need):
+            chunk = bytes(self.input[:self.need])
+            del self.input[:self.need]
+            self.need = self.protocol.send(chunk)
+        return len(data)
+
+    def read(self, size=1):
+        data = bytes(self.output[:size])
+        del self.output[:size]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self.output)
+
+    def flushInput(self):
+        del self.output[:]
+
+    reset_input_buffer = flushInput
+
+    def setDTR(self, level=True):
+        # DTR is the reset line of TSBLoader
+        if level:
+            self.resets += 1
+            self.reset()
+
+    def setRTS(self, level=True):
+        pass
+
+    def close(self):
+        pass
+
+    def header(self):
+        return ("TSB" + struct.pack("<H", 0x2A3B) + "\x00" + "\x1E\x95\x0F" +
+                chr(self.pagesize // 2) + struct.pack("<H", self.appflash // 2) +
+                struct.pack("<H", self.eepromsize - 1) + "\x00\xAA!")
+
+    def run(self):
+        """Generator of the device protocol, yields number of bytes needed"""
+        pagesize = self.pagesize
+        while True:
+            while (yield 1) != '@':
+                pass
+            if (yield 2) == '@@':
+                break
+        if self.password and ((yield len(self.password)) != self.password):
+            yield 0     # Wrong password, TSB does not answer any more
+        self.output.extend(self.header())
+
+        while True:
+            command = yield 1
+            self.commands.append(command)
+            if command == 'c':
+                self.output.extend(self.userdata + '!')
+            elif command == 'C':
+                self.output.extend('?')
+                if (yield 1) == '!':
+                    self.userdata = yield pagesize
+                self.output.extend('?')
+            elif command in 'fe':
+                memory = self.flash if command == 'f' else self.eeprom
+                for addr in xrange(0, len(memory), pagesize):
+                    if (yield 1) != '!':
+                        break
+                    self.page_reads += 1
+                    self.output.extend(memory[addr:addr+pagesize])
+                self.output.extend('!')
+            elif command in 'FE':
+                memory = self.flash if command == 'F' else self.eeprom
+                if command == 'F':
+                    memory[:] = '\xFF' * len(memory)
+                self.output.extend('?')
+                addr = 0
+                while (yield 1) == '!':
+                    memory[addr:addr+pagesize] = yield pagesize
+                    addr += pagesize
+                    self.output.extend('?')
+                self.output.extend('!')
+            elif command == 'q':
+                yield 0